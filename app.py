@@ -1,72 +1,232 @@
+# Spawned export workers import the main script again; run from serve.py so
+# that's a small module rather than all of the setup below
+if __name__ == "__main__":
+    import runpy
+    runpy.run_module("serve", run_name="__main__", alter_sys=True)
+    raise SystemExit
+
+# Imported first so the startup report's clock starts before everything else
+from startup import Lazy, StartupReport, warm_up
 import json
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session
-from recipe_scrapers import scrape_me
-import pyrebase
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import (
-    SimpleDocTemplate,
-    Paragraph,
-    Spacer,
-    Frame,
-    PageTemplate,
-    BaseDocTemplate,
-    FrameBreak,
-    Table,
-    TableStyle,
-    PageBreak,
-    KeepTogether
-)
-from reportlab.lib import colors
-from reportlab.pdfgen import canvas
-import io
+import math
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, session, jsonify
 import os
-from reportlab.lib.units import inch
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+import tempfile
 from functools import wraps
-
+from recipe_cache import RecipeCache
+from recipe_feed import RecipeFeed
+from recipe import normalize, normalize_all
+from ingredients import shopping_list
+from storage import FirebaseStore, SQLiteStore, flatten_recipe
+from scraping import Scraper
+from jobs import JobQueue
+from ingest import BulkIngest, iter_records
+from search_index import IngredientIndex, RecipeIndex, SourceIndex, TitleOrder, encode_cursor, decode_cursor, title_key
+from scrape_cache import ScrapeCache, normalize_url
+from pdf_themes import THEMES, get_theme, register_theme
+from fragment_cache import FragmentCache
+from response_cache import ResponseCache, fingerprint
+from dedup import DUPLICATES, DuplicateIndex, missing_fields
+from scaling import MAX_SERVINGS, UNIT_SYSTEMS, recipe_servings, scale_recipes
+from governor import CircuitOpen, Governor
+import metrics
+
+# pyrebase, ReportLab/pypdf and recipe-scrapers take most of a cold start, so
+# they are loaded when first needed (or by the warm-up below), not on import
+startup_report = StartupReport()
+startup_report.mark("imports")
 
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "admin"
 
-# Try registering Baskerville font (you can place baskerville.ttf in your project folder)
-try:
-    pdfmetrics.registerFont(TTFont('Baskerville', 'baskerville.ttf'))
-    base_font = 'Baskerville'
-except:
-    base_font = 'Times-Roman'  # Fallback if not found
-
-styles = getSampleStyleSheet()
-styles.add(ParagraphStyle(name="RecipeTitle", fontName=base_font, fontSize=16, leading=18, alignment=1))
-styles.add(ParagraphStyle(name="RecipeCategory", fontName=base_font, fontSize=10, leading=12, textColor=colors.grey))
-styles.add(ParagraphStyle(name="RecipeText", fontName=base_font, fontSize=10, leading=12))
-styles.add(ParagraphStyle(name="RecipeSubtitle", fontName=base_font, fontSize=12, leading=14))
-styles.add(ParagraphStyle(name="CategoryTitlePage", fontName=base_font, fontSize=48, leading=50, alignment=1, spaceAfter=50)) # New Style
-
 app = Flask(__name__)
 app.secret_key = "thisisasecret"
+# Request timings at /metrics; METRICS_SERVER_TIMING=1 also sends a
+# Server-Timing header (db, template, export, scrape totals) with each response
+metrics.install(app, server_timing=os.environ.get("METRICS_SERVER_TIMING", "0") == "1")
+
+
+# Recipe storage: Firebase by default, or a local SQLite database file
+RECIPE_STORE = os.environ.get("RECIPE_STORE", "firebase")
+# Recipes fetched per ordered Firebase query when paging without the cache
+FIREBASE_PAGE_BATCH = 200
+
+def connect_firebase():
+    with startup_report.phase("connect firebase"):
+        import pyrebase
+
+        with open("firebase_config.json") as f:
+            firebase_config = json.load(f)
+        return pyrebase.initialize_app(firebase_config)
+
+# Firebase calls and each scraped site get retries with jittered backoff, a
+# circuit breaker that fails fast once they keep failing, and a rate limit
+RETRIES = int(os.environ.get("RETRIES", 2))
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", 5))
+BREAKER_RESET = float(os.environ.get("BREAKER_RESET", 30))
+
+if RECIPE_STORE == "sqlite":
+    store = SQLiteStore(os.environ.get("RECIPE_DB", "recipes.db"))
+else:
+    store = FirebaseStore(
+        connect_firebase,
+        fetch_workers=int(os.environ.get("FETCH_WORKERS", 16)),
+        page_batch=FIREBASE_PAGE_BATCH,
+        timeout=float(os.environ.get("FIREBASE_TIMEOUT", 10)),
+        governor=Governor(
+            "firebase",
+            rate=float(os.environ.get("FIREBASE_RATE", 0)),
+            burst=int(os.environ.get("FIREBASE_BURST", 50)),
+            retries=RETRIES,
+            failures=BREAKER_FAILURES,
+            reset_after=BREAKER_RESET,
+        ),
+    )
+
+# Search index over titles, ingredients and categories, and the title-sorted
+# order used for paging the list, both kept current by the cache
+search_index = RecipeIndex()
+title_order = TitleOrder()
+# Recipe ids by source URL, so URL imports skip pages imported before
+source_index = SourceIndex()
+# Recipe ids by parsed ingredient name, for "what can I make"
+ingredient_index = IngredientIndex()
+# Near-duplicate detection when recipes are added: "flag" warns about them,
+# "skip" leaves them out, "merge" fills in what the existing recipe is missing
+# from them and leaves them out, "off" turns the check (and its index) off
+DEDUP_MODE = os.environ.get("DEDUP_MODE", "flag")
+duplicate_index = DuplicateIndex(threshold=float(os.environ.get("DEDUP_THRESHOLD", 0.7)))
+
+# Write-through recipe cache. Reads are served in-process; the add/edit/delete
+# routes update it right after writing to the store.
+recipe_cache = RecipeCache(
+    store.all,
+    store.get,
+    ttl=float(os.environ.get("RECIPE_CACHE_TTL", 30)),
+    max_size=int(os.environ.get("RECIPE_CACHE_SIZE", 10000)),
+    listeners=[search_index, title_order, source_index, ingredient_index]
+    + ([duplicate_index] if DEDUP_MODE != "off" else []),
+    fetch_many=store.get_many,
+)
 
+# Firebase change events keep the cache current, so lists and exports are
+# served from memory instead of re-downloading the recipes node
+recipe_feed = None
+if store.live_updates and recipe_cache.enabled and os.environ.get("RECIPE_FEED", "1") != "0":
+    recipe_feed = RecipeFeed(recipe_cache, store.stream, flatten=flatten_recipe).start()
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Parsed pages are kept on disk and revalidated with conditional GETs once stale
+SCRAPE_CACHE_DB = os.environ.get("SCRAPE_CACHE_DB", "scrape_cache.db")
+scraper = Scraper(
+    max_workers=int(os.environ.get("SCRAPE_WORKERS", 8)),
+    per_host=int(os.environ.get("SCRAPE_PER_HOST", 2)),
+    timeout=float(os.environ.get("SCRAPE_TIMEOUT", 15)),
+    cache=ScrapeCache(
+        SCRAPE_CACHE_DB,
+        fresh_for=float(os.environ.get("SCRAPE_CACHE_FRESH", 86400)),
+    ) if SCRAPE_CACHE_DB else None,
+    governor=Governor(
+        "scrape",
+        rate=float(os.environ.get("SCRAPE_RATE", 1)),
+        burst=int(os.environ.get("SCRAPE_BURST", 3)),
+        retries=RETRIES,
+        failures=BREAKER_FAILURES,
+        reset_after=BREAKER_RESET,
+    ),
+)
+
+# Recipes per batch write when importing files
+INGEST_CHUNK_SIZE = int(os.environ.get("INGEST_CHUNK_SIZE", 500))
+MAX_FLASHED_ERRORS = 10
+
+# Export themes (fonts and styles). Extra ones can be added from a JSON file of
+# {"name": {"font": ..., "font_file": ..., "scale": ..., "muted": ...}}; each
+# theme is only built when first used, then shared by every export.
+if os.environ.get("EXPORT_THEMES_FILE"):
+    with open(os.environ["EXPORT_THEMES_FILE"]) as f:
+        for theme_name, theme_spec in json.load(f).items():
+            register_theme(theme_name, **theme_spec)
+EXPORT_THEME = os.environ.get("EXPORT_THEME", "classic")
+if EXPORT_THEME not in THEMES:
+    raise ValueError(f"EXPORT_THEME: no theme named '{EXPORT_THEME}'")
+
+# Layouts /bulk_export_all can make
+EXPORT_FORMATS = ("standard", "category_sorted", "cards")
+
+# Rendered recipes are cached on disk, so an export only lays out what changed;
+# large renders are spread across worker processes
+EXPORT_CACHE_MB = int(os.environ.get("EXPORT_CACHE_MB", 512))
+
+def new_export_engine():
+    from pdf_export import ExportEngine
+
+    return ExportEngine(
+        processes=int(os.environ.get("EXPORT_PROCESSES", os.cpu_count() or 1)),
+        min_parallel=int(os.environ.get("EXPORT_PARALLEL_MIN", 200)),
+        segment_size=int(os.environ.get("EXPORT_SEGMENT_SIZE", 100)),
+        cache=FragmentCache(
+            os.environ.get("EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "recipe_fragments")),
+            max_bytes=EXPORT_CACHE_MB * 1024 * 1024,
+        ) if EXPORT_CACHE_MB > 0 else None,
+    )
+
+export_engine = Lazy(new_export_engine, "pdf export", startup_report)
+
+# Long-running imports and exports can run here instead of in the request thread
+job_queue = JobQueue(
+    max_workers=int(os.environ.get("JOB_WORKERS", 2)),
+    result_dir=os.environ.get("JOB_DIR", os.path.join(tempfile.gettempdir(), "recipe_jobs")),
+)
 
-# Firebase setup
-with open("firebase_config.json") as f:
-    firebase_config = json.load(f)
+# Rendered list/recipe pages (in memory) and cookbook PDFs (on disk), keyed by
+# route, parameters and the recipe cache's version, and sent with ETags so
+# unchanged pages and downloads come back as 304s
+RESPONSE_CACHE_MB = int(os.environ.get("RESPONSE_CACHE_MB", 256))
+response_cache = ResponseCache(
+    max_pages=int(os.environ.get("RESPONSE_CACHE_PAGES", 512)),
+    directory=os.environ.get("RESPONSE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "recipe_responses")),
+    max_bytes=RESPONSE_CACHE_MB * 1024 * 1024,
+)
 
-firebase = pyrebase.initialize_app(firebase_config)
-db = firebase.database()
+# Load the recipes and the heavy libraries in the background right after
+# startup, so the first export or URL import doesn't pay for them; with
+# WARMUP=0 each one is loaded by the first request that needs it
+def warm_up_recipes():
+    if recipe_cache.enabled:
+        recipe_cache.sync()
+    else:
+        store.get("warm-up")  # just opens the connection
+
+def warm_up_pdf():
+    export_engine.get()
+    get_theme(EXPORT_THEME)
+
+def warm_up_scraping():
+    import requests  # noqa: F401
+    import recipe_scrapers  # noqa: F401
+
+startup_report.mark("setup")
+print(startup_report.summary())
+if os.environ.get("WARMUP", "1") != "0":
+    warm_up([
+        ("recipes", warm_up_recipes),
+        ("pdf export", warm_up_pdf),
+        ("scraping", warm_up_scraping),
+    ], startup_report)
 
 # ------------------ Helpers ------------------
-def flatten_recipe(recipe_data):
-    """Flatten nested dicts from Firebase if needed."""
-    if isinstance(recipe_data, dict) and "ingredients" not in recipe_data and len(recipe_data) == 1:
-        return list(recipe_data.values())[0]
-    return recipe_data
-
 def export_recipe_pdf(recipe):
     """Generate PDF for a single recipe."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+    from pdf_export import BUILD_SECONDS
+
     pdf_file = f"{recipe['title']}.pdf"
     doc = SimpleDocTemplate(pdf_file, pagesize=letter)
-    styles = getSampleStyleSheet()
+    styles = get_theme(EXPORT_THEME).styles
     story = []
 
     story.append(Paragraph(f"<b>{recipe['title']}</b>", styles["Title"]))
@@ -82,9 +242,15 @@ def export_recipe_pdf(recipe):
     story.append(Spacer(1, 12))
     story.append(Paragraph(f"<b>Source:</b> {recipe['source']}", styles["Italic"]))
 
-    doc.build(story)
+    with metrics.timed(BUILD_SECONDS, "single", span="export"):
+        doc.build(story)
     return pdf_file
 
+@app.errorhandler(CircuitOpen)
+def store_unavailable(e):
+    # Firebase has been failing; answer now rather than queue up behind it
+    return "The recipe database is not responding. Please try again shortly.", 503, {"Retry-After": str(math.ceil(e.retry_after))}
+
 def admin_required(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -95,6 +261,212 @@ def admin_required(f):
     return wrapper
 
 
+def cached_view(version=None):
+    """
+    Serve a GET view's HTML through response_cache. The key is the endpoint,
+    its arguments, the query string, whether an admin is logged in and
+    `version(**kwargs)` (default: recipe_cache.version). Pages with flash
+    messages waiting, and everything when the recipe cache is off (its
+    version then misses outside changes), are rendered as usual.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not recipe_cache.enabled or request.method not in ("GET", "HEAD") or "_flashes" in session:
+                return view(*args, **kwargs)
+            recipe_cache.sync()
+            data_version = version(**kwargs) if version else recipe_cache.version
+            key = response_cache.key(
+                request.endpoint, kwargs, sorted(request.args.items(multi=True)),
+                bool(session.get("admin_logged_in")), data_version,
+            )
+            return response_cache.page(key, lambda: view(*args, **kwargs))
+        return wrapper
+    return decorator
+
+def recipe_version(rid):
+    """Content hash of one recipe, so its page stays cached while other recipes change."""
+    recipe = recipe_cache.get(rid)
+    return fingerprint(recipe.to_dict()) if recipe else None
+
+def find_duplicates(new_recipes):
+    """
+    New recipes ({rid: recipe}) that look like an existing recipe or an
+    earlier one of the same batch, as {rid: (id, title) of the one it looks like}.
+    Needs the recipe cache, which keeps duplicate_index current.
+    """
+    if DEDUP_MODE == "off" or not recipe_cache.enabled:
+        return {}
+    recipe_cache.sync()  # fills duplicate_index
+    batch = DuplicateIndex(threshold=duplicate_index.threshold)
+    found = {}
+    for rid, data in new_recipes.items():
+        recipe = normalize(data, rid)
+        if recipe is None:
+            continue
+        matches = duplicate_index.similar(recipe) or batch.similar(recipe)
+        if matches:
+            match_rid = matches[0][0]
+            match = recipe_cache.get(match_rid) if match_rid not in new_recipes else normalize(new_recipes[match_rid])
+            found[rid] = (match_rid, match.title if match else match_rid)
+        batch.on_put(rid, recipe)
+    return found
+
+def save_new_recipes(new_recipes, report_duplicate=None):
+    """
+    Write {rid: recipe} to the store in one batch and cache them. Likely
+    duplicates are reported to `report_duplicate(message)` and, with
+    DEDUP_MODE=skip or merge, not saved. Returns how many were saved.
+    """
+    merged_into = {}
+    for rid, (match_rid, match_title) in find_duplicates(new_recipes).items():
+        title = new_recipes[rid].get("title") or "Untitled recipe"
+        if DEDUP_MODE == "merge":
+            # The match may itself have been merged into an earlier one
+            match_rid = merged_into.get(match_rid, match_rid)
+            fields = merge_duplicate(match_rid, new_recipes.pop(rid), new_recipes)
+            merged_into[rid] = match_rid
+            DUPLICATES.inc(1, "merged")
+            added = f"; added its {', '.join(fields)}" if fields else ""
+            message = f"Merged '{title}' into '{match_title}'{added}."
+        elif DEDUP_MODE == "skip":
+            del new_recipes[rid]
+            DUPLICATES.inc(1, "skipped")
+            message = f"Skipped '{title}': it looks like a duplicate of '{match_title}'."
+        else:
+            DUPLICATES.inc(1, "flagged")
+            message = f"'{title}' looks like a duplicate of '{match_title}'."
+        if report_duplicate:
+            report_duplicate(message)
+
+    if new_recipes:
+        store.put_many(new_recipes)
+    for rid, recipe in new_recipes.items():
+        recipe_cache.put(rid, recipe)
+    return len(new_recipes)
+
+def merge_duplicate(match_rid, duplicate, new_recipes):
+    """
+    Fill in what the recipe `match_rid` is missing from `duplicate`. The
+    match is either one of `new_recipes` (not saved yet) or already in the
+    store. Returns the names of the fields filled in.
+    """
+    if match_rid in new_recipes:
+        fields = missing_fields(normalize(new_recipes[match_rid], match_rid), normalize(duplicate))
+        new_recipes[match_rid].update(fields)
+        return list(fields)
+    match = recipe_cache.get(match_rid)
+    if match is None:
+        return []
+    fields = missing_fields(match, normalize(duplicate))
+    if fields:
+        store.update(match_rid, fields)
+        recipe_cache.put(match_rid, match.replace(**fields))
+    return list(fields)
+
+def import_urls(urls, category, report_error, progress=None, report_duplicate=None, limit=True):
+    """
+    Scrape URLs in parallel and save the successes in one batch. URLs that
+    are repeated, or that an existing recipe was imported from, are skipped.
+    `limit=False` skips the per-site rate limit. Returns (added, skipped).
+    """
+    if recipe_cache.enabled:
+        recipe_cache.sync()  # fills source_index
+    pending, seen = [], set()
+    for url in urls:
+        key = normalize_url(url)
+        if key not in seen and source_index.find(url) is None:
+            pending.append(url)
+        seen.add(key)
+    skipped = len(urls) - len(pending)
+
+    new_recipes = {}
+    for result in scraper.scrape_all(pending, category, progress=progress, limit=limit):
+        if result.ok:
+            new_recipes[store.generate_key()] = result.recipe
+        else:
+            report_error(f"Error scraping recipe from '{result.url}': {result.error}")
+
+    added = save_new_recipes(new_recipes, report_duplicate) if new_recipes else 0
+    return added, skipped
+
+def new_ingest(progress=None, report_duplicate=None):
+    """A BulkIngest that saves uploaded recipes in chunked batch writes and caches them."""
+    return BulkIngest(
+        store,
+        lambda chunk: save_new_recipes(chunk, report_duplicate),
+        chunk_size=INGEST_CHUNK_SIZE,
+        progress=progress,
+    )
+
+def scrape_job(job, urls, category):
+    """Background job version of add_url."""
+    job.set_progress(0, len(urls), "Scraping recipes")
+    recipes_added, skipped = import_urls(
+        urls, category, job.add_error, progress=job.set_progress, report_duplicate=job.add_error,
+    )
+    job.message = f"Successfully added {recipes_added} recipe(s)!"
+    if skipped:
+        job.message += f" Skipped {skipped} URL(s) that were repeated or already imported."
+
+def upload_job(job, path):
+    """Background job version of upload_json, reading the upload saved at `path`."""
+    job.set_progress(0, message="Uploading recipes")
+    ingest = new_ingest(progress=job.set_progress, report_duplicate=job.add_error)
+    try:
+        with open(path, "rb") as stream:
+            try:
+                ingest.run(iter_records(stream))
+            finally:
+                for error in ingest.errors:
+                    job.add_error(error)
+                job.set_progress(ingest.seen, ingest.seen)
+    finally:
+        os.remove(path)
+    job.message = f"Successfully uploaded {ingest.added} recipes."
+
+def request_theme():
+    """The export theme asked for with ?theme=, or None (with a flash) if there is no such theme."""
+    theme = request.values.get("theme") or EXPORT_THEME
+    if theme not in THEMES:
+        flash(f"Unknown export theme '{theme}'. Available: {', '.join(sorted(THEMES))}", "error")
+        return None
+    return theme
+
+def request_format():
+    """The export layout asked for with ?format=, or None (with a flash) if there is no such layout."""
+    format_type = request.values.get("format", "standard")
+    if format_type not in EXPORT_FORMATS:
+        flash(f"Unknown export format '{format_type}'. Available: {', '.join(EXPORT_FORMATS)}", "error")
+        return None
+    return format_type
+
+def request_scaling():
+    """
+    (servings, units) asked for with ?servings= and ?units=, None for each
+    one left out. Raises ValueError if either is not valid.
+    """
+    servings = request.values.get("servings", "").strip()
+    units = request.values.get("units", "").strip().lower() or None
+    if servings:
+        if not servings.isdigit() or not 1 <= int(servings) <= MAX_SERVINGS:
+            raise ValueError(f"Servings must be a whole number from 1 to {MAX_SERVINGS}.")
+        servings = int(servings)
+    if units is not None and units not in UNIT_SYSTEMS:
+        raise ValueError(f"Unknown units '{units}'. Available: {', '.join(UNIT_SYSTEMS)}")
+    return servings or None, units
+
+def run_in_background():
+    """True when the user asked for a long-running route to run as a job."""
+    return request.values.get("background") in ("1", "true", "on")
+
+def job_started(job):
+    """Respond to a queued job: JSON for API clients, the job page for browsers."""
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(job_id=job.id, status_url=url_for("job_status", job_id=job.id)), 202
+    return redirect(url_for("view_job", job_id=job.id))
+
+
 # ------------------ Routes ------------------
 
 @app.route("/")
@@ -130,15 +502,16 @@ def logout():
 def delete_recipe(rid):
     try:
         # 1. Check if the recipe key exists (Diagnostic Step)
-        recipe_check = db.child("recipes").child(rid).get()
+        recipe_check = recipe_cache.get(rid)
         
-        if recipe_check.val() is None:
+        if recipe_check is None:
             # If the recipe is not found at the given path
             flash(f"Deletion failed: Recipe ID '{rid}' was not found.", "error")
             return redirect(url_for("view_recipes")) 
         
         # 2. If it exists, proceed with deletion
-        db.child("recipes").child(rid).remove() 
+        store.delete(rid)
+        recipe_cache.delete(rid)
         flash("Recipe deleted successfully.", "success")
         
     except Exception as e:
@@ -156,13 +529,19 @@ def add_manual():
         category = request.form.get("category")
         source = request.form.get("source")
 
-        db.child("recipes").push({
+        recipe = {
             "title": title,
             "ingredients": ingredients,
             "instructions": instructions,
             "category": category,
             "source": source
-        })
+        }
+        # Typed in by hand, so it is always saved; a likely duplicate is only pointed out
+        for _, match_title in find_duplicates({None: recipe}).values():
+            DUPLICATES.inc(1, "flagged")
+            flash(f"'{title}' looks like a duplicate of '{match_title}'.", "warning")
+        rid = store.add(recipe)
+        recipe_cache.put(rid, recipe)
         return redirect(url_for("view_recipes"))
 
     return render_template("add_manual.html")
@@ -173,26 +552,28 @@ def add_url():
     if request.method == "POST":
         urls = [u.strip() for u in request.form.get("urls").split(",") if u.strip()]
         category = request.form.get("category")
-        recipes_added = 0
-        
-        for url in urls:
-            try:
-                scraper = scrape_me(url)
-                db.child("recipes").push({
-                    "title": scraper.title(),
-                    "ingredients": scraper.ingredients(),
-                    "instructions": scraper.instructions(),
-                    "category": category,
-                    "source": url
-                })
-                recipes_added += 1
-            except Exception as e:
-                # FIX: Use flash to show the error to the user instead of just printing
-                flash(f"Error scraping recipe from '{url}': {e}", "error")
-        
-        # If any recipes were added, show success and redirect to the recipe list
-        if recipes_added > 0:
-            flash(f"Successfully added {recipes_added} recipe(s)!", "success")
+        recipes_added = skipped = 0
+
+        if run_in_background():
+            job = job_queue.submit("add_url", scrape_job, urls, category)
+            return job_started(job)
+
+        # Fetch and parse all URLs in parallel, then write them in one batch.
+        # The user is waiting, so only background imports are rate limited.
+        try:
+            recipes_added, skipped = import_urls(
+                urls, category, lambda message: flash(message, "error"),
+                report_duplicate=lambda message: flash(message, "warning"), limit=False,
+            )
+        except Exception as e:
+            flash(f"Error saving scraped recipes: {e}", "error")
+
+        if skipped:
+            flash(f"Skipped {skipped} URL(s) that were repeated or already imported.", "info")
+        # If any recipes were added (or were already there), redirect to the recipe list
+        if recipes_added > 0 or skipped:
+            if recipes_added:
+                flash(f"Successfully added {recipes_added} recipe(s)!", "success")
             return redirect(url_for("view_recipes"))
         else:
             # If all attempts failed, redirect back to the add page to see the errors
@@ -205,21 +586,40 @@ def add_url():
 def upload_json():
     if request.method == "POST":
         file = request.files.get("json_file")
-        recipes_added = 0
         if file and file.filename:
+            if run_in_background():
+                # The upload has to outlive this request, so spool it to disk for the job
+                fd, path = tempfile.mkstemp(suffix=".upload", dir=job_queue.result_dir)
+                os.close(fd)
+                file.save(path)
+                job = job_queue.submit("upload_json", upload_job, path)
+                return job_started(job)
+
+            duplicates = []
+            ingest = new_ingest(report_duplicate=duplicates.append)
             try:
-                data = json.load(file)
-                if isinstance(data, list):
-                    for recipe in data:
-                        db.child("recipes").push(recipe)
-                        recipes_added += 1
-                    flash(f"Successfully uploaded {recipes_added} recipes.", "success")
-                else:
-                    flash("Upload failed: JSON file content is not a list of recipes.", "error")
+                # Parsed incrementally, so large files are never fully loaded into memory
+                ingest.run(iter_records(file.stream))
+                flash(f"Successfully uploaded {ingest.added} recipes.", "success")
             except json.JSONDecodeError:
                 flash("Upload failed: The file is not valid JSON.", "error")
+                if ingest.added:
+                    flash(f"{ingest.added} recipes were saved before the upload stopped.", "warning")
+            except ValueError as e:
+                flash(f"Upload failed: {e}", "error")
             except Exception as e:
                 flash(f"Upload failed due to a critical error: {e}", "error")
+                if ingest.added:
+                    flash(f"{ingest.added} recipes were saved before the upload stopped.", "warning")
+
+            for error in ingest.errors[:MAX_FLASHED_ERRORS]:
+                flash(f"Skipped invalid recipe. {error}", "error")
+            if len(ingest.errors) > MAX_FLASHED_ERRORS:
+                flash(f"... and {len(ingest.errors) - MAX_FLASHED_ERRORS} more invalid recipes.", "error")
+            for message in duplicates[:MAX_FLASHED_ERRORS]:
+                flash(message, "warning")
+            if len(duplicates) > MAX_FLASHED_ERRORS:
+                flash(f"... and {len(duplicates) - MAX_FLASHED_ERRORS} more likely duplicates.", "warning")
         else:
             flash("No file was selected for upload.", "warning")
 
@@ -228,470 +628,281 @@ def upload_json():
 
 # ------------------ View Recipes ------------------
 @app.route("/recipes")
+@cached_view()
 def view_recipes():
     # 1. Get filter/search parameters from the URL
     search_query = request.args.get("search", "").lower()
     category_filter = request.args.get("category", "")
-    
-    all_recipes_snapshot = db.child("recipes").get()
-    recipes = {}
-    categories = set()
-
-    if all_recipes_snapshot.each():
-        for snap in all_recipes_snapshot.each():
-            rid = snap.key()
-            try: # ADDED try-except block to handle individual corrupted recipes
-                recipe_data = flatten_recipe(snap.val())
-                
-                # Ensure all necessary keys exist before access or sorting
-                recipe_data.setdefault("title", "Untitled Recipe") 
-                recipe_data.setdefault("ingredients", [])
-                recipe_data.setdefault("instructions", "")
-                recipe_data.setdefault("category", "Uncategorized")
-                recipe_data.setdefault("source", "")
-                
-                recipe_data["id"] = rid
-                
-                # Collect all categories for the filter dropdown
-                # This line is now safe because 'category' is guaranteed to exist by setdefault above
-                categories.add(recipe_data["category"])
-
-                # 2. Filtering Logic
-                is_match = True
-
-                # Filter by Category
-                if category_filter and category_filter != recipe_data["category"]:
-                    is_match = False
-                
-                # Filter by Search Title (case-insensitive)
-                # This line is now safe because 'title' is guaranteed to exist
-                if search_query and search_query not in recipe_data["title"].lower():
-                    is_match = False
-
-                if is_match:
-                    recipes[rid] = recipe_data
-            
-            except Exception as e:
-                # If a single recipe is malformed, log the error and skip it, 
-                # instead of crashing the entire page
-                flash(f"Skipped a corrupted recipe (ID: {rid}) due to error: {e}", "error")
-                continue # Skip to the next recipe
-
-    # Sort recipes by title (only the filtered results)
-    # This line is now safe because 'title' is guaranteed to exist for all recipes in the 'recipes' dict
-    sorted_recipes = dict(sorted(recipes.items(), key=lambda x: x[1]["title"].lower()))
+    page = max(request.args.get("page", 1, type=int), 1)
+    page_size = min(max(request.args.get("page_size", DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    cursor = request.args.get("cursor")
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return "Invalid cursor", 400
+
+    # 2. Find the ids on this page
+    offset = 0 if after else (page - 1) * page_size
+    if recipe_cache.enabled:
+        # Make sure the indexes have seen the whole collection, then look up
+        # matching ids in the index instead of scanning every recipe
+        recipe_cache.sync()
+        matching_ids = None
+        if search_query or category_filter:
+            matching_ids = search_index.search(search_query, category_filter)
+        page_ids, has_more = title_order.page(page_size, offset=offset, after=after, only=matching_ids)
+        total = len(matching_ids) if matching_ids is not None else len(title_order)
+        # One batch for whatever isn't cached (a collection bigger than the cache)
+        found, _ = recipe_cache.get_many(page_ids)
+        page_recipes = [(rid, found.get(rid)) for rid in page_ids]
+        categories = search_index.categories()
+    else:
+        rows, next_key = store.query(after, page_size, search=search_query, category=category_filter, offset=offset)
+        page_recipes = [(rid, normalize(data, rid)) for rid, data in rows]
+        has_more = next_key is not None
+        total = None
+        categories = sorted({r.category for _, r in page_recipes if r is not None} | ({category_filter} if category_filter else set()))
+
+    # None is a recipe deleted since the index was updated, or a record that
+    # isn't a recipe at all
+    recipes = {rid: recipe for rid, recipe in page_recipes if recipe is not None}
+
+    # 3. Links to the neighbouring pages. Without the cache, or once the client
+    # is following cursors, paging continues with a cursor from the last row.
+    filters = {"search": request.args.get("search", ""), "category": category_filter}
+    if page_size != DEFAULT_PAGE_SIZE:
+        filters["page_size"] = page_size
+    filters = {key: value for key, value in filters.items() if value}
+    next_cursor = None
+    if has_more and page_recipes:
+        if recipe_cache.enabled:
+            # A recipe deleted since the page was read has left title_order;
+            # the page then ends at the last row whose place is still known
+            for rid, recipe in reversed(page_recipes):
+                key = title_order.key(rid) or (recipe is not None and (title_key(recipe), rid))
+                if key:
+                    next_cursor = encode_cursor(key)
+                    break
+        else:
+            next_cursor = encode_cursor(next_key)
+
+    next_url = prev_url = None
+    if recipe_cache.enabled and not cursor:
+        if has_more:
+            next_url = url_for("view_recipes", page=page + 1, **filters)
+        if page > 1:
+            prev_url = url_for("view_recipes", page=page - 1, **filters)
+    else:
+        if next_cursor:
+            next_url = url_for("view_recipes", cursor=next_cursor, **filters)
+        if cursor:
+            prev_url = url_for("view_recipes", **filters)
+        elif page > 1:
+            prev_url = url_for("view_recipes", page=page - 1, **filters)
+
+    # Rows come back already sorted by title
     return render_template("recipes.html", 
-                           recipes=sorted_recipes, 
-                           categories=sorted(categories),
+                           recipes=recipes, 
+                           total=total,
+                           page=page if not cursor else None,
+                           next_url=next_url,
+                           prev_url=prev_url,
+                           next_cursor=next_cursor,
+                           categories=categories,
                            search_query=request.args.get("search", ""),
                            category_filter=category_filter
                            )
 
 # ------------------ View Single Recipe ------------------
 @app.route("/view_recipe/<rid>")
+@cached_view(recipe_version)
 def view_recipe(rid):
-    snap = db.child("recipes").child(rid).get()
-    if not snap.val():
+    recipe = recipe_cache.get(rid)
+    if not recipe:
         return "Recipe not found", 404
+    try:
+        servings, units = request_scaling()
+    except ValueError as e:
+        return str(e), 400
 
-    recipe = flatten_recipe(snap.val())
-    # Ensure all keys exist
-    recipe.setdefault("title", "Untitled Recipe")
-    recipe.setdefault("ingredients", [])
-    recipe.setdefault("instructions", "")
-    recipe.setdefault("category", "Uncategorized")
-    recipe.setdefault("source", "")
-    recipe["id"] = rid
-
-    return render_template("view_recipe.html", recipe=recipe)
+    recipe = scale_recipes([recipe], servings, units)[0]
+    return render_template("view_recipe.html",
+                           recipe=recipe,
+                           servings=recipe_servings(recipe),
+                           units=units,
+                           unit_systems=UNIT_SYSTEMS)
 
 # ------------------ Edit Recipe ------------------
 @app.route("/edit_recipe/<rid>", methods=["GET", "POST"])
 def edit_recipe(rid):
-    snap = db.child("recipes").child(rid).get()
-    if not snap.val():
+    recipe = recipe_cache.get(rid)
+    if not recipe:
         return "Recipe not found", 404
 
-    recipe = flatten_recipe(snap.val())
-    # Ensure all keys exist
-    recipe.setdefault("title", "Untitled Recipe")
-    recipe.setdefault("ingredients", [])
-    recipe.setdefault("instructions", "")
-    recipe.setdefault("category", "Uncategorized")
-    recipe.setdefault("source", "")
-    recipe["id"] = rid
-
     if request.method == "POST":
-        db.child("recipes").child(rid).update({
+        fields = {
             "title": request.form.get("title"),
             "ingredients": [i.strip() for i in request.form.get("ingredients").split(",")],
             "instructions": request.form.get("instructions"),
             "category": request.form.get("category"),
             "source": request.form.get("source")
-        })
+        }
+        store.update(rid, fields)
+        recipe_cache.put(rid, recipe.replace(**fields))
         return redirect(url_for("view_recipe", rid=rid))
 
     return render_template("edit_recipe.html", recipe=recipe)
 
+# ------------------ Ingredients ------------------
+MAX_MISSING = 3
+
+@app.route("/what_can_i_make")
+@cached_view()
+def what_can_i_make():
+    have = [h.strip() for h in request.args.get("have", "").split(",") if h.strip()]
+    max_missing = min(max(request.args.get("missing", 0, type=int), 0), MAX_MISSING)
+
+    results = []
+    if have:
+        if recipe_cache.enabled:
+            recipe_cache.sync()
+            matches = ingredient_index.can_make(have, max_missing=max_missing)
+            recipes, _ = recipe_cache.get_many([rid for rid, _ in matches])
+        else:
+            # No cache to keep the index current, so build one for this request
+            recipes = normalize_all(store.all())
+            index = IngredientIndex()
+            index.on_reload(recipes)
+            matches = index.can_make(have, max_missing=max_missing)
+        results = [(rid, recipes[rid], missing) for rid, missing in matches if rid in recipes]
+        results.sort(key=lambda r: (len(r[2]), r[1].title.lower()))
+
+    return render_template("what_can_i_make.html",
+                           results=results[:MAX_PAGE_SIZE],
+                           total=len(results),
+                           have=request.args.get("have", ""),
+                           max_missing=max_missing,
+                           missing_choices=range(MAX_MISSING + 1))
+
+@app.route("/shopping_list", methods=["POST"])
+def shopping_list_view():
+    selected_ids = request.form.getlist("selected_recipes")
+    if not selected_ids:
+        flash("No recipes selected for the shopping list.")
+        return redirect(url_for("view_recipes"))
+
+    recipes, missing = recipe_cache.get_many(selected_ids)
+    if missing:
+        flash(f"{len(missing)} selected recipe(s) no longer exist and were left out: {', '.join(missing)}")
+    return render_template("shopping_list.html",
+                           items=shopping_list(recipes.values()),
+                           recipes=list(recipes.values()))
+
+# ------------------ Duplicates ------------------
+@app.route("/duplicates")
+@admin_required
+def duplicates():
+    if recipe_cache.enabled and DEDUP_MODE != "off":
+        recipe_cache.sync()
+        clusters = duplicate_index.clusters()
+        recipes, _ = recipe_cache.get_many([rid for cluster in clusters for rid in cluster])
+    else:
+        # No cache to keep the index current, so build one for this request
+        recipes = normalize_all(store.all())
+        index = DuplicateIndex(threshold=duplicate_index.threshold)
+        index.on_reload(recipes)
+        clusters = index.clusters()
+
+    groups = []
+    for cluster in clusters:
+        group = sorted(((rid, recipes[rid]) for rid in cluster if rid in recipes), key=lambda r: r[1].title.lower())
+        if len(group) > 1:
+            groups.append(group)
+    return render_template("duplicates.html", groups=groups)
+
 # ------------------ Bulk Export PDF ------------------
 @app.route("/bulk_export", methods=["POST"])
 def bulk_export():
     selected_ids = request.form.getlist("selected_recipes")
-    for rid in selected_ids:
-        snap = db.child("recipes").child(rid).get()
-        recipe = flatten_recipe(snap.val())
-        # Ensure all keys exist
-        recipe.setdefault("title", "Untitled Recipe")
-        recipe.setdefault("ingredients", [])
-        recipe.setdefault("instructions", "")
-        recipe.setdefault("category", "Uncategorized")
-        recipe.setdefault("source", "")
+    recipes, missing = recipe_cache.get_many(selected_ids)
+    for recipe in recipes.values():
         export_recipe_pdf(recipe)
+    if missing:
+        return f"Exported {len(recipes)} PDFs. Recipes not found: {', '.join(missing)}"
     return "PDFs exported successfully!"
 
+def send_pdf(render, download_name=None):
+    """
+    Stream a PDF download from a temp file instead of building it in memory.
+    `render(output)` writes the PDF and may return the download file name.
+    """
+    spool = tempfile.TemporaryFile()
+    try:
+        download_name = render(spool) or download_name
+        size = spool.tell()
+        spool.seek(0)
+    except Exception:
+        spool.close()
+        raise
+    # send_file streams the file in blocks and closes (and so deletes) it when done
+    response = send_file(spool, as_attachment=True, download_name=download_name, mimetype='application/pdf')
+    response.content_length = size
+    return response
+
+def send_export(key_parts, render, conditional=True):
+    """
+    send_pdf through response_cache, keyed by `key_parts` and the recipe
+    cache's version, so a repeated download is served from disk (or a 304,
+    unless `conditional` is off).
+    """
+    if response_cache.files is None or not recipe_cache.enabled:
+        return send_pdf(render)
+    return response_cache.file(response_cache.key(*key_parts, recipe_cache.version), render, conditional=conditional)
+
+def load_export_recipes():
+    """All recipes as a list, for the exporters."""
+    return list(recipe_cache.all().values())
+
+def export_job(job, format_type, theme, servings=None, units=None):
+    """Background job: render a full cookbook export to a file for download."""
+    recipes_list = scale_recipes(load_export_recipes(), servings, units)
+    if not recipes_list:
+        raise ValueError("No recipes found to export.")
+
+    job.set_progress(0, len(recipes_list), "Rendering PDF")
+    path = os.path.join(job_queue.job_dir(job), "export.pdf")
+    with open(path, "wb") as output:
+        job.download_name = export_engine.get().render(recipes_list, format_type, output, progress=job.set_progress, theme=theme)
+    job.result_path = path
+    job.set_progress(len(recipes_list), message="Export finished")
+
 @app.route("/bulk_export_all", methods=["POST", "GET"])
 def bulk_export_all():
-    from reportlab.platypus import KeepTogether, Frame, PageTemplate, BaseDocTemplate, FrameBreak
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.units import inch
-    from reportlab.lib import colors
-    from reportlab.platypus import Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.styles import getSampleStyleSheet
-
-    # Use request.values.get() to check both query params (args) and form data
-    format_type = request.values.get("format", "standard") 
-
-    all_recipes_dict = db.child("recipes").get().val()
-
-    if not all_recipes_dict:
-        flash("No recipes found to export.")
+    format_type = request_format()
+    theme = request_theme()
+    if format_type is None or theme is None:
         return redirect(url_for("index"))
-
-    # Convert the dictionary of recipes to a list of flattened recipe objects for all export formats
-    recipes_list = []
-    for r_id, r_data in all_recipes_dict.items():
-        recipe = flatten_recipe(r_data)
-        recipe["id"] = r_id
-        # Ensure all keys exist
-        recipe.setdefault("title", "Untitled Recipe")
-        recipe.setdefault("ingredients", [])
-        recipe.setdefault("instructions", "")
-        recipe.setdefault("category", "Uncategorized")
-        recipe.setdefault("source", "")
-        recipes_list.append(recipe)
-
-    pdf_file = "all_recipes.pdf"
-    
-    # Redefining styles here just in case, but using the globally defined one as well
     try:
-        pdfmetrics.registerFont(TTFont('Baskerville', 'baskerville.ttf'))
-        base_font = 'Baskerville'
-    except:
-        base_font = 'Times-Roman'  # Fallback if not found
-
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name="RecipeTitle", fontName=base_font, fontSize=16, leading=18, alignment=1))
-    styles.add(ParagraphStyle(name="RecipeCategory", fontName=base_font, fontSize=10, leading=12, textColor=colors.grey))
-    styles.add(ParagraphStyle(name="RecipeText", fontName=base_font, fontSize=10, leading=12))
-    styles.add(ParagraphStyle(name="RecipeSubtitle", fontName=base_font, fontSize=12, leading=12))
-    styles.add(ParagraphStyle(name="CategoryTitlePage", fontName=base_font, fontSize=48, leading=50, alignment=1, spaceAfter=50))
-    
-
-    if format_type == "standard":
-        pdf_file = "All_Recipes.pdf"
-        
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        
-        story = []
-
-        # Sort all recipes by title for the standard export
-        recipes_list.sort(key=lambda r: r.get("title", "").lower())
-        
-        # Loop through all recipes sorted by title
-        for idx, recipe in enumerate(recipes_list):
-            # Use custom styles defined globally
-            story.append(Paragraph(f"<b>{recipe['title']}</b>", styles["RecipeTitle"]))
-            story.append(Spacer(1, 12))
-            story.append(Paragraph(f"<b>Category:</b> {recipe['category']}", styles["RecipeCategory"]))
-            story.append(Spacer(1, 12))
-            story.append(Paragraph("<b>Ingredients:</b>", styles["RecipeSubtitle"]))
-            for ing in recipe["ingredients"]:
-                story.append(Paragraph(f"- {ing}", styles["RecipeText"]))
-            story.append(Spacer(1, 12))
-            story.append(Paragraph("<b>Instructions:</b>", styles["RecipeSubtitle"]))
-            story.append(Paragraph(recipe["instructions"], styles["RecipeText"]))
-            story.append(Spacer(1, 12))
-            story.append(Paragraph(f"<b>Source:</b> {recipe['source']}", styles["RecipeCategory"]))
-
-            if idx != len(recipes_list) - 1:
-                story.append(PageBreak())  # separate recipes
-
-        doc.build(story)
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name=pdf_file, mimetype='application/pdf')
-
-    # NEW FORMAT: Category Sorted
-    elif format_type == "category_sorted":
-        pdf_file = "Category_Sorted_Recipes.pdf"
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        story = []
-
-        # 1. Group recipes by category
-        grouped_recipes = {}
-        for recipe in recipes_list:
-            category = recipe["category"]
-            grouped_recipes.setdefault(category, []).append(recipe)
-        
-        # 2. Sort categories and recipes within each category
-        sorted_categories = sorted(grouped_recipes.keys())
-        
-        for category in sorted_categories:
-            grouped_recipes[category].sort(key=lambda r: r.get("title", "").lower())
-            
-        # 3. Build the story
-        for cat_idx, category in enumerate(sorted_categories):
-            # i. Add subtitle page
-            story.append(Spacer(1, 2 * inch)) # Visually center the title
-            story.append(Paragraph(category.upper(), styles["CategoryTitlePage"]))
-            story.append(PageBreak()) # Separates the category title page from the first recipe
-            
-            recipes_in_category = grouped_recipes[category]
-            
-            # iii. Iterate and add recipes
-            for rec_idx, recipe in enumerate(recipes_in_category):
-                # Recipe Block - same as standard format
-                story.append(Paragraph(f"<b>{recipe['title']}</b>", styles["RecipeTitle"]))
-                story.append(Spacer(1, 12))
-                story.append(Paragraph(f"<b>Category:</b> {recipe['category']}", styles["RecipeCategory"]))
-                story.append(Spacer(1, 12))
-                story.append(Paragraph("<b>Ingredients:</b>", styles["RecipeSubtitle"]))
-                for ing in recipe["ingredients"]:
-                    story.append(Paragraph(f"- {ing}", styles["RecipeText"]))
-                story.append(Spacer(1, 12))
-                story.append(Paragraph("<b>Instructions:</b>", styles["RecipeSubtitle"]))
-                story.append(Paragraph(recipe["instructions"], styles["RecipeText"]))
-                story.append(Spacer(1, 12))
-                story.append(Paragraph(f"<b>Source:</b> {recipe['source']}", styles["RecipeCategory"]))
-
-                # iv. Separate recipes
-                # Add PageBreak between all recipes, but not after the very last recipe in the last category
-                is_last_recipe_in_category = rec_idx == len(recipes_in_category) - 1
-                is_last_category = cat_idx == len(sorted_categories) - 1
-                
-                if not (is_last_recipe_in_category and is_last_category):
-                    story.append(PageBreak())
-
-        doc.build(story)
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name=pdf_file, mimetype='application/pdf')
-
-
-    elif format_type == "cards":
-        # Two 5x7" cards per page (top + bottom)
-        class TwoPerPageDoc(BaseDocTemplate):
-            def __init__(self, filename, **kwargs):
-                super().__init__(filename, **kwargs)
-                # Each card = 7" wide x 5" tall, centered on letter page (8.5 x 11")
-                x_margin = (8.5 * inch - 7 * inch) / 2
-                y_top = 11 * inch - 5 * inch - 0.5 * inch
-                y_bottom = 0.5 * inch
-                card_width = 7 * inch
-                card_height = 5 * inch
-
-                self.frames = [
-                    Frame(x_margin, y_top, card_width, card_height, id="top"),
-                    Frame(x_margin, y_bottom, card_width, card_height, id="bottom")
-                ]
-                self.addPageTemplates([PageTemplate(id="TwoPerPage", frames=self.frames)])
-
-        pdf_file = "Recipe_Cards.pdf" # Changed filename for clarity
-        buffer = io.BytesIO()
-        doc = TwoPerPageDoc(buffer, pagesize=letter)
-        story = []
-
-        def build_card(recipe, max_chars=700):
-            """
-            Build one or more 5x7 cards per recipe with ingredients in two columns.
-            Splits instructions automatically if they exceed max_chars.
-            Ingredients only appear on the first card.
-            Returns a list of Flowables (cards).
-            """
-            title = recipe.get('title', 'Untitled')
-            category = recipe.get('category', 'Uncategorized')
-            ingredients_list = recipe.get('ingredients', [])
-            instructions = recipe.get('instructions', '').replace("\n", "<br/>")
-            source = recipe.get('source', '')
-
-            # Split instructions into manageable chunks
-            chunks = [instructions[i:i+max_chars] for i in range(0, len(instructions), max_chars)]
-            cards = []
-
-            for i, chunk in enumerate(chunks):
-                story = []
-
-                # Title (add continued if not first chunk)
-                story.append(Paragraph(title if i == 0 else f"{title} (continued)", styles["RecipeTitle"]))
-                story.append(Paragraph(category, styles["RecipeCategory"]))
-                story.append(Spacer(1, 6))
-
-                # Only show ingredients on the first card
-                if i == 0 and ingredients_list:
-                    half = (len(ingredients_list) + 1) // 2
-                    col1 = ingredients_list[:half]
-                    col2 = ingredients_list[half:]
-                    
-                    if not col1: col1 = ['']
-                    if not col2: col2 = ['']
-
-                    max_rows = max(len(col1), len(col2))
-                    col1 += [''] * (max_rows - len(col1))
-                    col2 += [''] * (max_rows - len(col2))
-                    table_data = [[Paragraph(f"- {c1}", styles["RecipeText"]),
-                                Paragraph(f"- {c2}", styles["RecipeText"])] for c1, c2 in zip(col1, col2)]
-
-                    table = Table(table_data, colWidths=[3.0*inch, 3.0*inch])
-                    table.setStyle(TableStyle([
-                        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-                        ('LEFTPADDING', (0,0), (-1,-1), 4),
-                        ('RIGHTPADDING', (0,0), (-1,-1), 4),
-                        ('TOPPADDING', (0,0), (-1,-1), 2),
-                        ('BOTTOMPADDING', (0,0), (-1,-1), 2),
-                    ]))
-                    story.append(Paragraph("<b>Ingredients:</b>", styles["RecipeText"]))
-                    story.append(table)
-                    story.append(Spacer(1, 6))
-
-                # Instructions (always included)
-                story.append(Paragraph("<b>Instructions:</b>", styles["RecipeText"]))
-                story.append(Paragraph(chunk, styles["RecipeText"]))
-                story.append(Spacer(1, 6))
-
-                # Source only on last chunk
-                if i == len(chunks) - 1 and source:
-                    story.append(Paragraph(f"<i>Source:</i> {source}", styles["RecipeCategory"]))
-
-                cards.append(KeepTogether(story))
-
-            return cards
-
-
-        recipes_list.sort(key=lambda r: r.get("title", "").lower()) # Sort by title
-
-        for recipe in recipes_list:
-            for card in build_card(recipe):
-                story.append(card)
-                story.append(FrameBreak())
-
-
+        servings, units = request_scaling()
+    except ValueError as e:
+        flash(str(e), "error")
+        return redirect(url_for("index"))
 
-        doc.build(story)
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name=pdf_file, mimetype='application/pdf')
-
-
-    elif format_type == "cards":
-        # Two 5x7" cards per page (top + bottom)
-        class TwoPerPageDoc(BaseDocTemplate):
-            def __init__(self, filename, **kwargs):
-                super().__init__(filename, **kwargs)
-                # Each card = 7" wide x 5" tall, centered on letter page (8.5 x 11")
-                x_margin = (8.5 * inch - 7 * inch) / 2
-                y_top = 11 * inch - 5 * inch - 0.5 * inch
-                y_bottom = 0.5 * inch
-                card_width = 7 * inch
-                card_height = 5 * inch
-
-                self.frames = [
-                    Frame(x_margin, y_top, card_width, card_height, id="top"),
-                    Frame(x_margin, y_bottom, card_width, card_height, id="bottom")
-                ]
-                self.addPageTemplates([PageTemplate(id="TwoPerPage", frames=self.frames)])
-
-        pdf_file = "Recipe_Cards.pdf" # Changed filename for clarity
-        buffer = io.BytesIO()
-        doc = TwoPerPageDoc(buffer, pagesize=letter)
-        story = []
-
-        def build_card(recipe, max_chars=700):
-            """
-            Build one or more 5x7 cards per recipe with ingredients in two columns.
-            Splits instructions automatically if they exceed max_chars.
-            Ingredients only appear on the first card.
-            Returns a list of Flowables (cards).
-            """
-            title = recipe.get('title', 'Untitled')
-            category = recipe.get('category', 'Uncategorized')
-            ingredients_list = recipe.get('ingredients', [])
-            instructions = recipe.get('instructions', '').replace("\n", "<br/>")
-            source = recipe.get('source', '')
-
-            # Split instructions into manageable chunks
-            chunks = [instructions[i:i+max_chars] for i in range(0, len(instructions), max_chars)]
-            cards = []
-
-            for i, chunk in enumerate(chunks):
-                story = []
-
-                # Title (add continued if not first chunk)
-                story.append(Paragraph(title if i == 0 else f"{title} (continued)", styles["RecipeTitle"]))
-                story.append(Paragraph(category, styles["RecipeCategory"]))
-                story.append(Spacer(1, 6))
-
-                # Only show ingredients on the first card
-                if i == 0 and ingredients_list:
-                    half = (len(ingredients_list) + 1) // 2
-                    col1 = ingredients_list[:half]
-                    col2 = ingredients_list[half:]
-                    
-                    if not col1: col1 = ['']
-                    if not col2: col2 = ['']
-
-                    max_rows = max(len(col1), len(col2))
-                    col1 += [''] * (max_rows - len(col1))
-                    col2 += [''] * (max_rows - len(col2))
-                    table_data = [[Paragraph(f"- {c1}", styles["RecipeText"]),
-                                Paragraph(f"- {c2}", styles["RecipeText"])] for c1, c2 in zip(col1, col2)]
-
-                    table = Table(table_data, colWidths=[3.0*inch, 3.0*inch])
-                    table.setStyle(TableStyle([
-                        ('VALIGN', (0,0), (-1,-1), 'TOP'),
-                        ('LEFTPADDING', (0,0), (-1,-1), 4),
-                        ('RIGHTPADDING', (0,0), (-1,-1), 4),
-                        ('TOPPADDING', (0,0), (-1,-1), 2),
-                        ('BOTTOMPADDING', (0,0), (-1,-1), 2),
-                    ]))
-                    story.append(Paragraph("<b>Ingredients:</b>", styles["RecipeText"]))
-                    story.append(table)
-                    story.append(Spacer(1, 6))
-
-                # Instructions (always included)
-                story.append(Paragraph("<b>Instructions:</b>", styles["RecipeText"]))
-                story.append(Paragraph(chunk, styles["RecipeText"]))
-                story.append(Spacer(1, 6))
-
-                # Source only on last chunk
-                if i == len(chunks) - 1 and source:
-                    story.append(Paragraph(f"<i>Source:</i> {source}", styles["RecipeCategory"]))
-
-                cards.append(KeepTogether(story))
-
-            return cards
-
-
-        recipes_list.sort(key=lambda r: r.get("title", "").lower()) # Sort by title
-
-        for recipe in recipes_list:
-            for card in build_card(recipe):
-                story.append(card)
-                story.append(FrameBreak())
+    if run_in_background():
+        job = job_queue.submit("bulk_export_all", export_job, format_type, theme, servings, units)
+        return job_started(job)
 
+    # Scaled and converted for the whole cookbook at once, before any layout
+    recipes_list = scale_recipes(load_export_recipes(), servings, units)
 
+    if not recipes_list:
+        flash("No recipes found to export.")
+        return redirect(url_for("index"))
 
-        doc.build(story)
-        buffer.seek(0)
-        return send_file(buffer, as_attachment=True, download_name=pdf_file, mimetype='application/pdf')
+    return send_export(
+        ("bulk_export_all", format_type, theme, THEMES[theme], servings, units),
+        lambda output: export_engine.get().render(recipes_list, format_type, output, theme=theme),
+    )
 
 @app.route("/bulk_export_selected", methods=["POST"])
 def bulk_export_selected():
@@ -701,58 +912,41 @@ def bulk_export_selected():
         flash("No recipes selected for export.")
         return redirect(url_for("view_recipes")) 
 
-    pdf_file_name = "Selected_Recipes.pdf"
-    
-    # FIX: Use in-memory buffer instead of file on disk
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    
-    # The global `styles` object is now correctly used here
-    story = []
+    recipes, missing = recipe_cache.get_many(selected_ids)
+    if missing:
+        flash(f"{len(missing)} selected recipe(s) no longer exist and were left out: {', '.join(missing)}")
 
-    for idx, rid in enumerate(selected_ids):
-        snap = db.child("recipes").child(rid).get()
-        if not snap.val():
-            continue # Skip missing recipes
-
-        recipe = flatten_recipe(snap.val())
-        # Ensure all keys exist
-        recipe.setdefault("title", "Untitled Recipe")
-        recipe.setdefault("ingredients", [])
-        recipe.setdefault("instructions", "")
-        recipe.setdefault("category", "Uncategorized")
-        recipe.setdefault("source", "")
-
-        # FIX: Use custom styles defined globally (RecipeTitle, RecipeText, etc.)
-        story.append(Paragraph(f"<b>{recipe['title']}</b>", styles["RecipeTitle"]))
-        story.append(Spacer(1, 12))
-        story.append(Paragraph(f"<b>Category:</b> {recipe['category']}", styles["RecipeCategory"]))
-        story.append(Spacer(1, 12))
-        story.append(Paragraph("<b>Ingredients:</b>", styles["RecipeSubtitle"]))
-        for ing in recipe["ingredients"]:
-            story.append(Paragraph(f"- {ing}", styles["RecipeText"]))
-        story.append(Spacer(1, 12))
-        story.append(Paragraph("<b>Instructions:</b>", styles["RecipeSubtitle"]))
-        story.append(Paragraph(recipe["instructions"], styles["RecipeText"]))
-        story.append(Spacer(1, 12))
-        story.append(Paragraph(f"<b>Source:</b> {recipe['source']}", styles["RecipeCategory"]))
-
-        if idx != len(selected_ids) - 1:
-            story.append(PageBreak())
-
-    doc.build(story)
-    buffer.seek(0)
-    # FIX: Send the in-memory buffer
-    return send_file(buffer, as_attachment=True, download_name=pdf_file_name, mimetype='application/pdf')
+    theme = request_theme()
+    if not recipes or theme is None:
+        return redirect(url_for("view_recipes"))
+    try:
+        servings, units = request_scaling()
+    except ValueError as e:
+        flash(str(e), "error")
+        return redirect(url_for("view_recipes"))
+    recipes_list = scale_recipes(recipes.values(), servings, units)
 
+    # A POST, so browsers won't revalidate it: the same selection again is
+    # served from the cache, but with no ETag to match
+    return send_export(
+        ("bulk_export_selected", list(recipes), theme, THEMES[theme], servings, units),
+        lambda output: export_engine.get().render(recipes_list, "selected", output, theme=theme),
+        conditional=False,
+    )
 
 @app.route("/download_template")
 def download_template():
     """
     Generates a PDF with two blank 5x7 rectangles per page for recipe cards.
     """
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
+    return send_pdf(draw_card_template, "recipe_card_template.pdf")
+
+def draw_card_template(output):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.units import inch
+    from reportlab.pdfgen import canvas
+
+    c = canvas.Canvas(output, pagesize=letter)
     width, height = letter
 
     # Card size: 7\" wide x 5\" tall
@@ -772,14 +966,31 @@ def download_template():
 
     c.showPage()
     c.save()
-    buffer.seek(0)
 
-    return send_file(buffer, as_attachment=True, download_name="recipe_card_template.pdf", mimetype="application/pdf")
+# ------------------ Background Jobs ------------------
+@app.route("/jobs/<job_id>")
+def view_job(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return "Job not found", 404
+    return render_template("job.html", job=job)
+
+@app.route("/jobs/<job_id>/status")
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify(error="Job not found"), 404
+    return jsonify(job.to_dict())
+
+@app.route("/jobs/<job_id>/download")
+def download_job(job_id):
+    job = job_queue.get(job_id)
+    if not job or job.status != "done" or not job.result_path:
+        return "No finished download for this job", 404
+    return send_file(job.result_path, as_attachment=True, download_name=job.download_name, mimetype="application/pdf")
 
 # ------------------ Run App ------------------
 #if __name__ == "__main__":
 #    app.run(debug=True)
 
-if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 10000))  # Render expects port 10000 by default
-    app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
+# `python app.py` runs serve.py (see the top of this file)
\ No newline at end of file
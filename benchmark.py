@@ -0,0 +1,481 @@
+"""
+Benchmarks for listing, search, single views, scaling, JSON upload and the PDF exports.
+
+Each collection size runs in its own process against LocalFirebase, an
+in-memory stand-in for the Firebase database, seeded with synthetic
+recipes. Requests go through the real app with Flask's test client, so the
+timings cover everything from the route to the response body. Results
+(throughput, p50/p99 latency and peak RSS) are written as JSON and can be
+compared against a saved baseline:
+
+    python benchmark.py --sizes 1000,10000 --output bench.json
+    python benchmark.py --baseline bench.json   # exits 1 on a regression
+
+Exports are skipped above --export-max recipes, since a cold 100k-recipe
+export takes a long time. Environment variables (RECIPE_CACHE_SIZE,
+EXPORT_PROCESSES, ...) are passed through to the app as usual.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = (1000, 10000, 100000)
+EXPORT_FORMATS = ("standard", "category_sorted", "cards")
+
+
+# ------------------ Local Firebase ------------------
+class LocalFirebase:
+    """
+    The part of a pyrebase app that FirebaseStore uses, backed by a dict.
+
+    Recipes are kept as JSON text and decoded on every read, like a real
+    REST response. Title keys are also kept decoded, standing in for the
+    ".indexOn": "title_key" index on recipe_titles that ordered queries use.
+    `latency` (seconds) is added to each call to stand in for the network
+    round trip.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.requests = requests.Session()
+        self.nodes = {"recipes": {}, "recipe_titles": {}}  # top-level key -> {child key: JSON text}
+        self.titles = {}  # recipe id -> title key, for order_by_child("title_key")
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def database(self):
+        return LocalDatabase(self)
+
+    def seed(self, recipes):
+        for rid, data in recipes.items():
+            self.write(self.nodes["recipes"], rid, data)
+
+    def write(self, node, key, value):
+        if value is None:
+            node.pop(key, None)
+            if node is self.nodes["recipe_titles"]:
+                self.titles.pop(key, None)
+            return
+        node[key] = json.dumps(value)
+        if node is self.nodes["recipe_titles"]:
+            title = value.get("title_key") if isinstance(value, dict) else None
+            self.titles[key] = "" if title is None else str(title)
+
+
+class LocalResponse:
+    def __init__(self, value):
+        self.value = value
+
+    def val(self):
+        return self.value
+
+
+class LocalDatabase:
+    def __init__(self, app):
+        self.app = app
+        self.path = []
+        self.query = {}
+
+    def child(self, *parts):
+        for part in parts:
+            self.path.extend(p for p in str(part).split("/") if p)
+        return self
+
+    def order_by_child(self, field):
+        self.query["order_by"] = field
+        return self
+
+    def start_at(self, value):
+        self.query["start_at"] = value
+        return self
+
+    def shallow(self):
+        self.query["shallow"] = True
+        return self
+
+    def limit_to_first(self, limit):
+        self.query["limit"] = limit
+        return self
+
+    def generate_key(self):
+        return "-L%013x%s" % (int(time.time() * 1000), os.urandom(4).hex())
+
+    def _call(self):
+        self.app.calls += 1
+        if self.app.latency:
+            time.sleep(self.app.latency)
+        path, query = self.path, self.query
+        self.path, self.query = [], {}
+        if not path:
+            return None, path, query
+        if path[0] not in self.app.nodes:
+            raise ValueError(f"LocalFirebase has no node at {'/'.join(path)!r}")
+        return self.app.nodes[path[0]], path[1:], query
+
+    def get(self):
+        node, path, query = self._call()
+        with self.app.lock:
+            if path:
+                text = node.get(path[0])
+                value = json.loads(text) if text is not None else None
+                for key in path[1:]:
+                    value = value.get(key) if isinstance(value, dict) else None
+                return LocalResponse(value)
+            if query.get("shallow"):
+                return LocalResponse(list(node) or None)
+            field = query.get("order_by")
+            if field is None:
+                keys = list(node)
+            elif field == "title_key" and node is self.app.nodes["recipe_titles"]:
+                titles = self.app.titles
+                keys = sorted(node, key=lambda rid: (titles[rid], rid))
+                if "start_at" in query:
+                    keys = [rid for rid in keys if titles[rid] >= query["start_at"]]
+            else:
+                raise ValueError(f"LocalFirebase has no index on {field!r}")
+            if "limit" in query:
+                keys = keys[:query["limit"]]
+            texts = [(key, node[key]) for key in keys]
+        return LocalResponse({key: json.loads(text) for key, text in texts} or None)
+
+    def update(self, data):
+        root, path, _ = self._call()
+        with self.app.lock:
+            for key, value in data.items():
+                node, parts = root, path + [p for p in key.split("/") if p]
+                if node is None:
+                    # A multi-path update from the root
+                    node, parts = self.app.nodes[parts[0]], parts[1:]
+                if len(parts) == 1:
+                    self.app.write(node, parts[0], value)
+                    continue
+                recipe = json.loads(node.get(parts[0], "{}"))
+                target = recipe
+                for part in parts[1:-1]:
+                    target = target.setdefault(part, {})
+                if value is None:
+                    target.pop(parts[-1], None)
+                else:
+                    target[parts[-1]] = value
+                self.app.write(node, parts[0], recipe)
+        return data
+
+    def remove(self):
+        node, path, _ = self._call()
+        with self.app.lock:
+            if path:
+                self.app.write(node, path[0], None)
+            else:
+                node.clear()
+                if node is self.app.nodes["recipe_titles"]:
+                    self.app.titles.clear()
+
+
+# ------------------ Synthetic recipes ------------------
+FOODS = (
+    "chicken", "beef", "pork", "salmon", "shrimp", "tofu", "lentils", "chickpeas", "rice", "pasta",
+    "potatoes", "onion", "garlic", "carrot", "celery", "tomato", "spinach", "kale", "mushrooms",
+    "zucchini", "eggplant", "bell pepper", "broccoli", "cauliflower", "lemon", "lime", "ginger",
+    "cilantro", "parsley", "basil", "thyme", "rosemary", "cumin", "paprika", "butter", "olive oil",
+    "flour", "sugar", "brown sugar", "eggs", "milk", "cream", "yogurt", "parmesan", "cheddar",
+    "feta", "honey", "soy sauce", "vinegar", "coconut milk", "oats", "almonds", "walnuts",
+    "chocolate", "vanilla", "cinnamon", "apples", "bananas", "berries", "corn",
+)
+PREP = ("", "", "chopped", "diced", "minced", "sliced", "grated", "fresh", "dried", "softened")
+UNITS = ("cup", "cups", "tbsp", "tsp", "g", "oz", "lb", "cloves", "pinch of", "can", "")
+AMOUNTS = ("1", "2", "3", "4", "1/2", "1/4", "3/4", "1 1/2", "200", "400")
+DISHES = (
+    "Soup", "Stew", "Curry", "Salad", "Bake", "Stir-Fry", "Tacos", "Pasta", "Risotto", "Pie",
+    "Casserole", "Bowl", "Skillet", "Roast", "Muffins", "Bread", "Cake", "Cookies", "Pancakes",
+)
+STYLES = ("Easy", "Spicy", "Creamy", "Classic", "Quick", "Roasted", "Lemony", "Smoky", "Garlicky", "Weeknight")
+CATEGORIES = (
+    "Breakfast", "Lunch", "Dinner", "Soups", "Salads", "Sides", "Desserts", "Baking",
+    "Vegetarian", "Seafood", "Snacks", "Drinks",
+)
+STEPS = (
+    "Preheat the oven to {n}0 degrees.",
+    "Heat the {a} in a large pan over medium heat.",
+    "Add the {a} and cook for {n} minutes, stirring now and then.",
+    "Stir in the {a} and {b} and season well with salt and pepper.",
+    "Whisk the {a} with the {b} in a bowl until smooth.",
+    "Simmer gently for {n} minutes until the {a} is tender.",
+    "Transfer to a baking dish and bake for {n}5 minutes until golden.",
+    "Fold in the {a}, taking care not to overmix.",
+    "Let it rest for {n} minutes before serving.",
+    "Garnish with {a} and serve warm with the {b} on the side.",
+)
+
+
+def synthetic_recipe(rng, i):
+    main, other = rng.sample(FOODS, 2)
+    ingredients = []
+    for food in rng.sample(FOODS, rng.randint(5, 16)):
+        parts = (rng.choice(AMOUNTS), rng.choice(UNITS), rng.choice(PREP), food)
+        ingredients.append(" ".join(p for p in parts if p))
+    steps = (
+        rng.choice(STEPS).format(n=rng.randint(2, 9), a=rng.choice(FOODS), b=rng.choice(FOODS))
+        for _ in range(rng.randint(4, 12))
+    )
+    return {
+        "title": f"{rng.choice(STYLES)} {main.title()} and {other.title()} {rng.choice(DISHES)} {i}",
+        "ingredients": ingredients,
+        "instructions": " ".join(steps),
+        "category": rng.choice(CATEGORIES),
+        "source": f"https://recipes.example.com/{i}",
+        "servings": 2 + i % 6,
+    }
+
+
+def synthetic_recipes(count, seed, start=0):
+    rng = random.Random(f"{seed}-{start}")
+    return {f"-bench{i:08d}": synthetic_recipe(rng, i) for i in range(start, start + count)}
+
+
+# ------------------ Measuring ------------------
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    # Nearest rank
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, items=None, unit="req/s"):
+    """Latencies in seconds -> stats; `items` is what throughput counts (default: requests)."""
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    done = items if items is not None else len(latencies)
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+        "throughput": round(done / total, 2) if total else None,
+        "unit": unit,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def timed_request(client, method, url, expect=(200,), **kwargs):
+    started = time.perf_counter()
+    response = client.open(url, method=method, **kwargs)
+    response.get_data()  # read streamed bodies (PDF downloads) to the end
+    elapsed = time.perf_counter() - started
+    response.close()
+    if response.status_code not in expect:
+        raise RuntimeError(f"{method} {url} returned {response.status_code}")
+    return elapsed
+
+
+def run_size(size, args):
+    """Seed a collection of `size`, run every benchmark against it and return the results."""
+    sys.path.insert(0, HERE)
+    os.chdir(HERE)  # app.py reads firebase_config.json from the working directory
+
+    firebase = LocalFirebase(latency=args.latency_ms / 1000)
+    started = time.perf_counter()
+    recipes = synthetic_recipes(size, args.seed)
+    firebase.seed(recipes)
+    seed_seconds = time.perf_counter() - started
+    rss_after_seed = peak_rss_mb()
+
+    import pyrebase
+    pyrebase.initialize_app = lambda config: firebase
+    import app as recipe_app
+
+    client = recipe_app.app.test_client()
+    rng = random.Random(args.seed)
+    rids = list(recipes)
+    titles = [recipes[rid]["title"] for rid in rng.sample(rids, min(len(rids), 200))]
+    del recipes
+
+    results = {}
+    # The first list request loads the collection into the cache
+    results["first_list"] = summarize([timed_request(client, "GET", "/recipes")])
+
+    pages = max(1, size // 50)
+    results["list"] = summarize([
+        timed_request(client, "GET", f"/recipes?page={rng.randint(1, min(pages, 200))}")
+        for _ in range(args.requests)
+    ])
+
+    searches = []
+    for _ in range(args.requests):
+        kind = rng.randrange(3)
+        if kind == 0:
+            query = rng.choice(titles).split()[rng.randint(0, 2)]
+        elif kind == 1:
+            query = f"has {rng.choice(FOODS)} and {rng.choice(FOODS)}"
+        else:
+            query = f"category:{rng.choice(CATEGORIES).lower()} {rng.choice(FOODS)[:3]}"
+        searches.append(timed_request(client, "GET", "/recipes", query_string={"search": query}))
+    results["search"] = summarize(searches)
+
+    results["view"] = summarize([
+        timed_request(client, "GET", f"/view_recipe/{rng.choice(rids)}") for _ in range(args.requests)
+    ])
+
+    # Scaling and unit conversion of the whole collection, as a scaled export
+    # does it (~10 ingredient lines per recipe, so 10k recipes is ~100k lines)
+    from scaling import scale_recipes
+    collection = list(recipe_app.recipe_cache.all().values())
+    lines = sum(len(recipe.parsed) for recipe in collection)
+    for name, options in (("scale_servings", {"servings": 6}), ("scale_metric", {"units": "metric"})):
+        started = time.perf_counter()
+        scale_recipes(collection, **options)
+        results[name] = summarize([time.perf_counter() - started], items=lines, unit="lines/s")
+    del collection
+
+    if size <= args.export_max:
+        for format_type in EXPORT_FORMATS:
+            # cold lays out every fragment; warm is assembled from the fragment
+            # cache, so the response cache is cleared first; cached is the same
+            # download again, answered by the response cache
+            for label in ("cold", "warm", "cached"):
+                if label != "cached":
+                    recipe_app.response_cache.clear()
+                elapsed = timed_request(client, "GET", "/bulk_export_all", query_string={"format": format_type})
+                results[f"export_{format_type}_{label}"] = summarize([elapsed], items=size, unit="recipes/s")
+
+    uploads = []
+    for n in range(args.uploads):
+        batch = synthetic_recipes(args.upload_size, args.seed, start=size + n * args.upload_size)
+        payload = "\n".join(json.dumps(recipe) for recipe in batch.values()).encode("utf-8")
+        uploads.append(timed_request(
+            client, "POST", "/upload_json", expect=(302,),
+            data={"json_file": (io.BytesIO(payload), "benchmark.ndjson")},
+            content_type="multipart/form-data",
+        ))
+    if uploads:
+        results["upload"] = summarize(uploads, items=args.uploads * args.upload_size, unit="recipes/s")
+
+    return {
+        "size": size,
+        "seed_seconds": round(seed_seconds, 2),
+        "rss_after_seed_mb": rss_after_seed,
+        "peak_rss_mb": peak_rss_mb(),
+        "firebase_calls": firebase.calls,
+        "results": results,
+    }
+
+
+# ------------------ Baselines ------------------
+def compare(current, baseline, threshold):
+    """Print how each benchmark moved against `baseline`. Returns the list of regressions."""
+    regressions = []
+    print(f"{'size':>7}  {'benchmark':<30} {'p50 ms':>18} {'p99 ms':>18}  peak RSS MB")
+    for size, run in current["sizes"].items():
+        old_run = baseline.get("sizes", {}).get(size)
+        if old_run is None:
+            print(f"{size:>7}  (not in the baseline)")
+            continue
+        for name, stats in run["results"].items():
+            old = old_run["results"].get(name)
+            if old is None:
+                continue
+            cells = []
+            for key in ("p50_ms", "p99_ms"):
+                change = (stats[key] - old[key]) / old[key] if old[key] else 0
+                cells.append(f"{old[key]:>7.1f} -> {stats[key]:>7.1f}")
+                if change > threshold:
+                    regressions.append(f"{size} {name} {key} {old[key]:.1f} -> {stats[key]:.1f} ({change:+.0%})")
+            print(f"{size:>7}  {name:<30} {cells[0]:>18} {cells[1]:>18}")
+        old_rss, rss = old_run["peak_rss_mb"], run["peak_rss_mb"]
+        print(f"{size:>7}  {'peak RSS':<30} {'':>18} {'':>18}  {old_rss} -> {rss}")
+        if old_rss and (rss - old_rss) / old_rss > threshold:
+            regressions.append(f"{size} peak RSS {old_rss} -> {rss} MB")
+    return regressions
+
+
+# ------------------ Command line ------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated collection sizes (default %(default)s)")
+    parser.add_argument("--requests", type=int, default=100, help="requests per list/search/view benchmark")
+    parser.add_argument("--uploads", type=int, default=3, help="number of JSON uploads to time")
+    parser.add_argument("--upload-size", type=int, default=1000, help="recipes per upload")
+    parser.add_argument("--export-max", type=int, default=10000, help="skip exports for larger collections")
+    parser.add_argument("--latency-ms", type=float, default=0, help="simulated Firebase round trip per call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against a results file saved earlier")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown that counts as a regression (default 0.2 = 20%%)")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker is not None:
+        print(json.dumps(run_size(args.worker, args)))
+        return 0
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "worker")},
+        "sizes": {},
+    }
+    forwarded = sys.argv[1:] if argv is None else list(argv)
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"Benchmarking {size} recipes...", file=sys.stderr)
+        env = dict(os.environ, RECIPE_STORE="firebase", RECIPE_FEED="0")
+        cache_dir = tempfile.mkdtemp(prefix="recipe_bench_")
+        env.setdefault("EXPORT_CACHE_DIR", os.path.join(cache_dir, "fragments"))
+        env.setdefault("RESPONSE_CACHE_DIR", os.path.join(cache_dir, "responses"))
+        # The background warm-up would run alongside the first timed requests
+        env.setdefault("WARMUP", "0")
+        try:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *forwarded, "--worker", str(size)],
+                env=env, check=True, stdout=subprocess.PIPE, text=True,
+            ).stdout
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        report["sizes"][str(size)] = json.loads(output.strip().splitlines()[-1])
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print("\nRegressions:", *regressions, sep="\n  ", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Near-duplicate recipes: MinHash signatures over what a recipe is made of
+(parsed ingredient names and three-word phrases of the instructions) and an
+LSH index over the signatures, so finding the recipes similar to one
+touches a handful of buckets instead of the whole collection.
+"""
+import functools
+import hashlib
+import threading
+
+import metrics
+from recipe import DEFAULTS, FIELDS, normalize
+from search_index import tokenize
+
+DUPLICATES = metrics.counter(
+    "recipes_duplicates_total",
+    "Likely duplicates found when adding recipes, by action (flagged, skipped or merged).",
+    ("action",),
+)
+
+MASK = (1 << 64) - 1
+# 10 bands of 4 rows: pairs 0.7 similar share a band ~93% of the time, 0.8
+# similar ~99%, while unrelated recipes that only share stock phrases
+# ("let it rest for", ~0.1-0.2 similar) rarely do
+BANDS = 10
+ROWS = 4
+NUM_HASHES = BANDS * ROWS
+DEFAULT_THRESHOLD = 0.7
+
+# Signatures keep the low 8 bits of each minimum, packed into one int, so a
+# signature is ~70 bytes and comparing two is a handful of int operations.
+# Unequal minimums collide 1 time in 256, which barely moves the estimate.
+BITS = 8
+LANE = (1 << BITS) - 1
+LOW_BITS = int.from_bytes(b"\x01" * NUM_HASHES, "little")
+BAND_BITS = BITS * ROWS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# A bucket shared by this many recipes holds stock phrasing, not copies; the
+# batch scan skips it (real near-duplicates nearly always share another band)
+CROWDED = 50
+
+
+def features(recipe):
+    """The set a recipe is compared by: ingredient names and word triples of the instructions."""
+    result = {ingredient.name for ingredient in recipe.parsed if ingredient.name}
+    words = tokenize(recipe.instructions)
+    result.update(zip(words, words[1:], words[2:]))
+    return result
+
+
+# Features repeat a lot between recipes (ingredient names, stock phrases)
+@functools.lru_cache(maxsize=1 << 16)
+def feature_hash(feature):
+    """
+    64-bit hash of a feature: an ingredient name or a word triple. Unlike
+    hash(), it is the same in every process and run.
+    """
+    text = feature if isinstance(feature, str) else "\0".join(feature)
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def signature(features):
+    """
+    One-permutation MinHash: each feature's hash picks one of NUM_HASHES
+    bins and the bin keeps the smallest value seen. Empty bins (recipes
+    with few features) borrow from the next filled bin, offset by the
+    distance, so they only agree when both recipes borrowed alike.
+    Returns None for an empty set.
+    """
+    if not features:
+        return None
+    bins = [MASK] * NUM_HASHES
+    for h in map(feature_hash, features):
+        b = h % NUM_HASHES
+        h //= NUM_HASHES
+        if h < bins[b]:
+            bins[b] = h
+    if MASK in bins:
+        filled = [i for i, value in enumerate(bins) if value != MASK]
+        for i in range(NUM_HASHES):
+            if bins[i] == MASK:
+                distance = min((j - i) % NUM_HASHES for j in filled)
+                bins[i] = bins[(i + distance) % NUM_HASHES] + distance
+    return int.from_bytes(bytes(value & LANE for value in bins), "little")
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of the feature sets behind two signatures."""
+    # Fold every differing byte down to its lowest bit, then count them
+    x = a ^ b
+    x |= x >> 4
+    x |= x >> 2
+    x |= x >> 1
+    return 1 - bin(x & LOW_BITS).count("1") / NUM_HASHES
+
+
+def missing_fields(recipe, duplicate):
+    """
+    The fields `duplicate` can fill in on `recipe` (both Recipes): ones
+    `recipe` lacks or has left at the default. Nothing `recipe` has is
+    replaced. Returns {field: value}, ready for store.update().
+    """
+    fields = {}
+    for field in FIELDS:
+        empty = (DEFAULTS.get(field), "", ())
+        value = getattr(duplicate, field)
+        if getattr(recipe, field) in empty and value not in empty:
+            fields[field] = list(value) if field == "ingredients" else value
+    for key, value in (duplicate.extra or {}).items():
+        if value not in (None, "") and (recipe.extra or {}).get(key) in (None, ""):
+            fields[key] = value
+    return fields
+
+
+def band_keys(sig):
+    return [(sig >> (band * BAND_BITS)) & BAND_MASK | band << BAND_BITS for band in range(BANDS)]
+
+
+class DuplicateIndex:
+    """
+    Signatures by recipe id, and LSH buckets: each signature is cut into
+    BANDS bands and recipes that agree on a whole band share a bucket.
+    Candidates from the buckets are checked against `threshold`. Kept up to
+    date as a RecipeCache listener.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._signatures = {}  # rid -> signature
+        self._contents = {}  # rid -> hash of ingredients and instructions, to skip unchanged recipes on reload
+        self._buckets = {}  # band key -> rid, or {rid} once shared
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def similar(self, recipe, threshold=None, exclude=None):
+        """
+        Indexed recipes that look like `recipe` (a Recipe or a record),
+        as [(rid, similarity)], most similar first.
+        """
+        recipe = normalize(recipe)
+        if recipe is None:
+            return []
+        sig = signature(features(recipe))
+        if sig is None:
+            return []
+        threshold = self.threshold if threshold is None else threshold
+        matches = []
+        with self._lock:
+            for rid in self._candidates(sig):
+                score = similarity(sig, self._signatures[rid])
+                if score >= threshold and rid != exclude:
+                    matches.append((rid, score))
+        matches.sort(key=lambda match: -match[1])
+        return matches
+
+    def clusters(self, threshold=None):
+        """
+        Groups of two or more indexed recipes that are similar to each
+        other, directly or through another recipe in the group. Returns
+        lists of ids, largest group first.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        parent = {}
+
+        def find(rid):
+            root = rid
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while rid != root:
+                parent[rid], rid = root, parent.get(rid, rid)
+            return root
+
+        def union(rid, other):
+            root, other_root = find(rid), find(other)
+            if root != other_root:
+                parent.setdefault(root, root)
+                parent[other_root] = root
+
+        with self._lock:
+            # Exact copies share a signature; group them first and compare one of each
+            first = {}
+            for rid, sig in self._signatures.items():
+                if sig in first:
+                    union(first[sig], rid)
+                else:
+                    first[sig] = rid
+            # Then only recipes sharing a bucket can be similar
+            for bucket in self._buckets.values():
+                if not isinstance(bucket, set):
+                    continue
+                members = [(rid, self._signatures[rid]) for rid in bucket if first[self._signatures[rid]] == rid]
+                if len(members) >= CROWDED:
+                    continue
+                for i, (rid, sig) in enumerate(members):
+                    for other, other_sig in members[i + 1:]:
+                        if similarity(sig, other_sig) >= threshold:
+                            union(rid, other)
+
+        groups = {}
+        for rid in parent:
+            groups.setdefault(find(rid), []).append(rid)
+        result = [group for group in groups.values() if len(group) > 1]
+        result.sort(key=len, reverse=True)
+        return result
+
+    # ------------------ Cache listener ------------------
+    def on_put(self, rid, data):
+        with self._lock:
+            self._remove(rid)
+            self._add(rid, data)
+
+    def on_delete(self, rid):
+        with self._lock:
+            self._remove(rid)
+
+    def on_reload(self, recipes):
+        with self._lock:
+            for rid in [rid for rid in self._signatures if rid not in recipes]:
+                self._remove(rid)
+            for rid, data in recipes.items():
+                if self._content_of(data) != self._contents.get(rid):
+                    self._remove(rid)
+                    self._add(rid, data)
+
+    # ------------------ Internals ------------------
+    @staticmethod
+    def _content_of(recipe):
+        content = "\0".join(recipe.ingredients + (recipe.instructions,))
+        return hashlib.blake2b(content.encode("utf-8"), digest_size=8).digest()
+
+    def _candidates(self, sig):
+        candidates = set()
+        for key in band_keys(sig):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            if isinstance(bucket, set):
+                candidates |= bucket
+            else:
+                candidates.add(bucket)
+        return candidates
+
+    def _add(self, rid, recipe):
+        sig = signature(features(recipe))
+        if sig is None:
+            return
+        self._signatures[rid] = sig
+        self._contents[rid] = self._content_of(recipe)
+        for key in band_keys(sig):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._buckets[key] = rid  # most buckets only ever hold one recipe
+            elif isinstance(bucket, set):
+                bucket.add(rid)
+            elif bucket != rid:
+                self._buckets[key] = {bucket, rid}
+
+    def _remove(self, rid):
+        sig = self._signatures.pop(rid, None)
+        if sig is None:
+            return
+        del self._contents[rid]
+        for key in band_keys(sig):
+            bucket = self._buckets.get(key)
+            if bucket == rid:
+                del self._buckets[key]
+            elif isinstance(bucket, set):
+                bucket.discard(rid)
+                if len(bucket) == 1:
+                    self._buckets[key] = bucket.pop()
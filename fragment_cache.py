@@ -0,0 +1,100 @@
+"""On-disk, content-addressed cache of rendered PDF fragments."""
+import os
+import threading
+from collections import Counter, OrderedDict
+
+
+class FragmentCache:
+    """
+    PDF files stored under ``directory`` as ``<key>.pdf``.
+
+    Keys are content hashes, so an entry never goes stale; it just stops
+    being asked for. Once the files add up to more than ``max_bytes`` the
+    least recently used ones are deleted. Use order is kept in the file
+    mtimes, so it survives restarts and is shared by the export workers.
+
+    Exports running at the same time pin the keys they use, and eviction
+    leaves pinned files alone until every export holding them is done.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes = None  # key -> size in bytes, least recently used first
+        self._total = 0
+        self._pins = Counter()  # key -> exports using it
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def lookup(self, key):
+        """Return the path of a cached fragment and mark it used, or None."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            sizes = self._index()
+            if key in sizes:
+                sizes.move_to_end(key)
+            else:
+                self._track(key)
+        return path
+
+    def added(self, keys):
+        """Account for fragments a worker has just written."""
+        with self._lock:
+            self._index()
+            for key in keys:
+                self._track(key)
+
+    def pin(self, keys):
+        """Keep `keys` from being evicted until they are unpinned (pins are counted)."""
+        with self._lock:
+            self._pins.update(keys)
+
+    def unpin(self, keys):
+        with self._lock:
+            self._pins.subtract(keys)
+            for key in set(keys):
+                if self._pins[key] <= 0:
+                    self._pins.pop(key, None)
+
+    def evict(self, keep=()):
+        """Delete least recently used fragments until under max_bytes, sparing `keep` and pinned keys."""
+        with self._lock:
+            sizes = self._index()
+            for key in list(sizes):
+                if self._total <= self.max_bytes:
+                    break
+                if key in keep or key in self._pins:
+                    continue
+                self._total -= sizes.pop(key)
+                try:
+                    os.remove(self.path(key))
+                except FileNotFoundError:
+                    pass
+
+    # ------------------ Internals ------------------
+    def _index(self):
+        if self._sizes is None:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".pdf") and entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+            entries.sort()
+            self._sizes = OrderedDict((key, size) for _, key, size in entries)
+            self._total = sum(self._sizes.values())
+        return self._sizes
+
+    def _track(self, key):
+        try:
+            size = os.path.getsize(self.path(key))
+        except FileNotFoundError:
+            return
+        self._total += size - self._sizes.pop(key, 0)
+        self._sizes[key] = size
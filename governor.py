@@ -0,0 +1,248 @@
+"""
+Client-side traffic control for the recipe store and the recipe sites we
+scrape: a token bucket and a circuit breaker per target, retries with
+jittered exponential backoff, and coalescing of identical concurrent calls
+into one.
+"""
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+GOVERNOR_CALLS = metrics.counter(
+    "recipes_governor_calls_total",
+    "Calls through a traffic governor, by outcome (ok, retried, failed, rejected or coalesced).",
+    ("governor", "outcome"),
+)
+GOVERNOR_WAIT_SECONDS = metrics.histogram(
+    "recipes_governor_wait_seconds", "Time calls spent waiting for a rate-limit token or a retry.", ("governor",),
+)
+CIRCUITS_OPENED = metrics.counter(
+    "recipes_governor_circuits_opened_total", "Times a target's circuit breaker opened.", ("governor",),
+)
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a target that has been failing."""
+
+    def __init__(self, target, retry_after):
+        super().__init__(f"{target} is not responding; not trying again for {retry_after:.0f}s")
+        self.target = target
+        self.retry_after = retry_after
+
+
+def http_status(error):
+    """The HTTP status behind a requests error, or None."""
+    # pyrebase re-raises requests' HTTPError wrapped in another one, without the response
+    for e in (error, *error.args[:1]):
+        response = getattr(e, "response", None)
+        if response is not None:
+            return response.status_code
+    return None
+
+
+def transient(error):
+    """Worth trying again: connection failures, timeouts, 429 and 5xx answers."""
+    import requests
+
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    status = http_status(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def retry_after(error):
+    """Seconds asked for by a Retry-After header on the error's response, or None."""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["Retry-After"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """`rate` calls per second on average, in bursts of up to `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token and return how long to wait before using it (0 when
+        one was there). Tokens can be taken ahead, so waiters go in turn.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - 1
+            self._updated = now
+            return max(-self._tokens / self.rate, 0)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` failures in a row and turns calls away for
+    `reset_after` seconds. Then one trial call is let through: if it works
+    the breaker closes again, if not it stays open for another period.
+    """
+
+    def __init__(self, failures=5, reset_after=30):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._failed = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def open(self):
+        return self._opened_at is not None
+
+    def check(self, target):
+        """Raise CircuitOpen unless a call may go ahead."""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            wait = self._opened_at + self.reset_after - time.monotonic()
+            if wait > 0 or self._trial:
+                raise CircuitOpen(target, max(wait, 1))
+            self._trial = True
+
+    def succeeded(self):
+        with self._lock:
+            self._failed = 0
+            self._opened_at = None
+            self._trial = False
+
+    def failed(self):
+        """Record a failure; returns True if that opened the breaker."""
+        with self._lock:
+            self._failed += 1
+            if self._trial or (self._opened_at is None and self._failed >= self.failures):
+                opened = self._opened_at is None
+                self._opened_at = time.monotonic()
+                self._trial = False
+                return opened
+            return False
+
+
+class Governor:
+    """
+    Runs calls to named targets (a host, a database) under that target's
+    token bucket and circuit breaker.
+
+    Calls that fail with a `retry_if` error are tried again up to `retries`
+    times, after a random delay of up to backoff * 2^attempt seconds (capped
+    at `max_backoff`, or longer if the server sent Retry-After). Those
+    failures also count toward the breaker; any other error means the
+    target answered and is raised straight away.
+
+    Calls with the same `key` that overlap share one call and its result
+    (or error), so callers must not change what they get back.
+
+    `rate=0` turns rate limiting off.
+    """
+
+    def __init__(self, name, rate=0, burst=10, retries=2, backoff=0.5, max_backoff=10,
+                 failures=5, reset_after=30, retry_if=transient):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = failures
+        self.reset_after = reset_after
+        self.retry_if = retry_if
+
+        self._buckets = {}
+        self._breakers = {}
+        self._in_flight = {}  # key -> Future
+        self._lock = threading.Lock()
+
+    def call(self, target, fn, key=None, retry=True, limit=True):
+        """
+        Return fn(). `retry=False` is for calls that are not safe to repeat
+        (a push that may have gone through before the connection dropped).
+        `limit=False` skips the rate limit, for calls someone is waiting on;
+        the breaker and retries still apply.
+        """
+        if key is None:
+            return self._call(target, fn, retry, limit)
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            GOVERNOR_CALLS.inc(1, self.name, "coalesced")
+            return future.result()
+
+        try:
+            result = self._call(target, fn, retry, limit)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def breaker(self, target):
+        with self._lock:
+            if target not in self._breakers:
+                self._breakers[target] = CircuitBreaker(self.failures, self.reset_after)
+            return self._breakers[target]
+
+    # ------------------ Internals ------------------
+    def _bucket(self, target):
+        with self._lock:
+            if target not in self._buckets:
+                self._buckets[target] = TokenBucket(self.rate, self.burst)
+            return self._buckets[target]
+
+    def _call(self, target, fn, retry, limit):
+        breaker = self.breaker(target)
+        attempt = 0
+        while True:
+            try:
+                breaker.check(target)
+            except CircuitOpen:
+                GOVERNOR_CALLS.inc(1, self.name, "rejected")
+                raise
+            if limit and self.rate > 0:
+                self._wait(self._bucket(target).reserve())
+
+            try:
+                result = fn()
+            except Exception as e:
+                if not self.retry_if(e):
+                    breaker.succeeded()  # it answered; the error is about the request
+                    raise
+                if breaker.failed():
+                    CIRCUITS_OPENED.inc(1, self.name)
+                if not retry or attempt >= self.retries or breaker.open:
+                    GOVERNOR_CALLS.inc(1, self.name, "failed")
+                    raise
+                # Full jitter, so callers that failed together don't all come back together
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                self._wait(max(delay, min(retry_after(e) or 0, self.max_backoff)))
+                attempt += 1
+                continue
+
+            breaker.succeeded()
+            GOVERNOR_CALLS.inc(1, self.name, "retried" if attempt else "ok")
+            return result
+
+    def _wait(self, seconds):
+        if seconds > 0:
+            GOVERNOR_WAIT_SECONDS.observe(seconds, self.name)
+            time.sleep(seconds)
@@ -0,0 +1,196 @@
+"""Streaming bulk import of uploaded recipe files (JSON array or NDJSON)."""
+import codecs
+import itertools
+import json
+
+READ_SIZE = 64 * 1024
+WHITESPACE = " \t\r\n"
+# How far the decoder can read past a token before failing on it (a \uXXXX
+# escape, "false", a number's exponent), with room to spare
+LOOKAHEAD = 16
+
+STRING_FIELDS = ("title", "instructions", "category", "source")
+
+
+class RecordError:
+    """Placeholder yielded for an NDJSON line that is not valid JSON."""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def _text_chunks(stream, read_size):
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    while True:
+        data = stream.read(read_size)
+        if not data:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            return
+        text = decoder.decode(data)
+        if text:
+            yield text
+
+
+def iter_records(stream, read_size=READ_SIZE):
+    """
+    Yield records from an uploaded file one at a time.
+
+    Accepts either a top-level JSON array or newline-delimited JSON objects,
+    reading `read_size` bytes at a time so the whole file is never in memory.
+    """
+    chunks = _text_chunks(stream, read_size)
+    head = ""
+    for chunk in chunks:
+        head += chunk
+        if head.strip():
+            break
+
+    first = head.lstrip()[:1]
+    chunks = itertools.chain([head], chunks)
+    if first == "[":
+        return _iter_array(chunks)
+    if first == "{":
+        return _iter_ndjson(chunks)
+    raise ValueError("JSON file content is not a list of recipes.")
+
+
+def _iter_array(chunks):
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    expect = "["  # "[" -> "value_or_end" / "value" -> "separator"
+
+    while True:
+        while pos < len(buf) and buf[pos] in WHITESPACE:
+            pos += 1
+
+        need_more = pos == len(buf)
+        if not need_more:
+            ch = buf[pos]
+            if expect == "[":
+                pos += 1
+                expect = "value_or_end"
+                continue
+            if expect == "separator" or (expect == "value_or_end" and ch == "]"):
+                if ch == "]":
+                    return
+                if ch != ",":
+                    raise json.JSONDecodeError("Expected ',' or ']'", buf, pos)
+                pos += 1
+                expect = "value"
+                continue
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # A value running to the end of the buffer may be cut short
+                need_more = end == len(buf) and not eof
+            except json.JSONDecodeError as e:
+                # Only an error at the end of what has been read can be a
+                # value cut short; anything else won't parse with more data
+                cut_short = e.msg.startswith("Unterminated string") or e.pos >= len(buf) - LOOKAHEAD
+                if eof or not cut_short:
+                    raise
+                need_more = True
+            if not need_more:
+                yield value
+                pos = end
+                expect = "separator"
+                continue
+
+        if eof:
+            raise json.JSONDecodeError("Unexpected end of JSON array", buf, pos)
+        more = next(chunks, None)
+        if more is None:
+            eof = True
+        else:
+            buf = buf[pos:] + more
+            pos = 0
+
+
+def _iter_ndjson(chunks):
+    line_no = 0
+    first_record = True
+    rest = ""
+    for chunk in itertools.chain(chunks, ["\n"]):
+        lines = (rest + chunk).split("\n")
+        rest = lines.pop()
+        for line in lines:
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                if first_record:
+                    # A pretty-printed single object, not one recipe per line
+                    raise ValueError("JSON file content is not a list of recipes.")
+                record = RecordError(f"line {line_no} is not valid JSON ({e.msg})")
+            first_record = False
+            yield record
+
+
+def validate_recipe(record):
+    """Check one uploaded record and return it, or raise ValueError."""
+    if isinstance(record, RecordError):
+        raise ValueError(record.message)
+    if not isinstance(record, dict):
+        raise ValueError("not a JSON object")
+
+    for field in STRING_FIELDS:
+        if record.get(field) is not None and not isinstance(record[field], str):
+            raise ValueError(f"'{field}' must be a string")
+
+    ingredients = record.get("ingredients")
+    if ingredients is not None:
+        if not isinstance(ingredients, list) or not all(isinstance(i, str) for i in ingredients):
+            raise ValueError("'ingredients' must be a list of strings")
+
+    if not (record.get("title") or ingredients or record.get("instructions")):
+        raise ValueError("recipe has no title, ingredients or instructions")
+    return record
+
+
+class BulkIngest:
+    """
+    Imports a stream of records in chunked multi-location writes.
+
+    Keys are generated up front with `store.generate_key()`, so each chunk
+    of `chunk_size` recipes is one batch write. `save(chunk)` does
+    the write and returns how many it kept (it may leave duplicates out);
+    `progress(done, total)` is called after each chunk. The counts
+    stay readable after a failure, so callers can say how far it got.
+    """
+
+    def __init__(self, store, save, chunk_size=500, progress=None):
+        self.store = store
+        self.save = save
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+        self.seen = 0
+        self.added = 0
+        self.errors = []
+
+    def run(self, records):
+        chunk = {}
+        for record in records:
+            self.seen += 1
+            try:
+                recipe = validate_recipe(record)
+            except ValueError as e:
+                self.errors.append(f"Record {self.seen}: {e}")
+                continue
+
+            chunk[self.store.generate_key()] = recipe
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk)
+                chunk = {}
+
+        self._flush(chunk)
+        return self
+
+    def _flush(self, chunk):
+        if chunk:
+            self.added += self.save(chunk)
+        if self.progress:
+            self.progress(self.seen, None)
@@ -0,0 +1,248 @@
+"""
+Ingredient lines parsed into quantity, unit and a normalized name.
+
+"1 1/2 cups all-purpose flour, sifted" -> 1.5, "cup", "all-purpose flour".
+Recipes parse their lines once, when they are loaded or imported (see
+recipe.normalize); the same line in many recipes is parsed once.
+"""
+import re
+from functools import lru_cache
+
+UNICODE_FRACTIONS = {
+    "½": "1/2", "⅓": "1/3", "⅔": "2/3", "¼": "1/4", "¾": "3/4", "⅕": "1/5",
+    "⅖": "2/5", "⅗": "3/5", "⅘": "4/5", "⅙": "1/6", "⅚": "5/6", "⅛": "1/8",
+    "⅜": "3/8", "⅝": "5/8", "⅞": "7/8",
+}
+FRACTION_RE = re.compile("(\\d)?([" + "".join(UNICODE_FRACTIONS) + "])")
+
+# "1", "1.5", ".5", "1/2", "1 1/2", optionally a range ("2-3", "2 to 3")
+NUMBER = r"(?:\d+\s+\d+/\d+|\d+/\d+|\d*\.\d+|\d+)"
+QUANTITY_RE = re.compile(rf"^({NUMBER})(?:\s*(?:-|–|to)\s*({NUMBER}))?\s*")
+
+# Canonical unit -> the ways it is written (plurals are added below)
+UNITS = {
+    "cup": ("cup", "c"),
+    "tbsp": ("tablespoon", "tbsp", "tbs", "tbl", "T"),
+    "tsp": ("teaspoon", "tsp", "t"),
+    "fl oz": ("fluid ounce", "fl oz", "fl. oz"),
+    "oz": ("ounce", "oz"),
+    "lb": ("pound", "lb", "lbs"),
+    "g": ("gram", "g", "gr"),
+    "kg": ("kilogram", "kg"),
+    "mg": ("milligram", "mg"),
+    "ml": ("milliliter", "millilitre", "ml"),
+    "l": ("liter", "litre", "l"),
+    "pint": ("pint", "pt"),
+    "quart": ("quart", "qt"),
+    "gallon": ("gallon", "gal"),
+    "pinch": ("pinch",),
+    "dash": ("dash",),
+    "clove": ("clove",),
+    "can": ("can",),
+    "package": ("package", "pkg", "packet"),
+    "stick": ("stick",),
+    "slice": ("slice",),
+    "bunch": ("bunch",),
+    "sprig": ("sprig",),
+    "piece": ("piece",),
+    "handful": ("handful",),
+    "jar": ("jar",),
+    "bottle": ("bottle",),
+    "head": ("head",),
+}
+CASE_SENSITIVE_UNITS = {"T", "t"}  # tablespoon vs teaspoon
+
+# Words that describe how an ingredient is prepared or bought, not what it is
+DESCRIPTORS = {
+    "chopped", "minced", "diced", "sliced", "cubed", "crushed", "grated", "shredded",
+    "peeled", "seeded", "cored", "trimmed", "halved", "quartered", "beaten", "melted",
+    "softened", "sifted", "packed", "divided", "drained", "rinsed", "thawed", "cooked",
+    "uncooked", "fresh", "freshly", "finely", "roughly", "coarsely", "thinly", "thickly",
+    "large", "medium", "small", "extra", "about", "approximately", "optional", "heaping",
+    "level", "room", "temperature", "to", "taste", "for", "serving", "garnish", "plus",
+    "more", "needed", "as", "a", "an", "of", "or",
+}
+SINGULAR_KEEP = ("ss", "us", "is")
+IRREGULAR_PLURALS = {"leaves": "leaf", "halves": "half", "loaves": "loaf", "knives": "knife"}
+
+
+def _unit_aliases():
+    aliases = {}
+    for unit, spellings in UNITS.items():
+        for spelling in spellings:
+            forms = [spelling]
+            if spelling not in CASE_SENSITIVE_UNITS and len(spelling) > 2 and not spelling.endswith("s"):
+                forms.append(spelling + ("es" if spelling.endswith(("ch", "sh")) else "s"))
+            for form in forms:
+                key = form if form in CASE_SENSITIVE_UNITS else form.lower()
+                aliases[key] = unit
+                aliases[key + "."] = unit
+    return aliases
+
+
+UNIT_ALIASES = _unit_aliases()
+# Longest first, so "fl oz" wins over "fl" and "tablespoons" over "t"
+UNIT_RE = re.compile(
+    r"^(" + "|".join(re.escape(a) for a in sorted(UNIT_ALIASES, key=len, reverse=True)) + r")(?=[\s,]|$)",
+    re.IGNORECASE,
+)
+WORD_RE = re.compile(r"[a-z][a-z'\-]*")
+NOTE_RE = re.compile(r"^(\([^)]*\))\s*")
+
+
+class Ingredient:
+    """
+    One parsed ingredient line. `quantity` is a float or None (for a range,
+    the larger number, which is what you'd want to buy, with the smaller one
+    in `low`; `low` is None for anything else), `unit` is one of
+    UNITS or None and `name` is lower case, singular and without
+    preparation words ("" if nothing is left). `text` is the line as given.
+    `tail` is what follows the amount and unit, with a leading space, so the
+    line can be written out again with a new amount.
+    """
+
+    __slots__ = ("text", "quantity", "unit", "name", "tail", "low")
+
+    def __init__(self, text, quantity=None, unit=None, name="", tail="", low=None):
+        self.text = text
+        self.quantity = quantity
+        self.unit = unit
+        self.name = name
+        self.tail = tail
+        self.low = low
+
+    def __repr__(self):
+        return f"Ingredient({self.quantity!r}, {self.unit!r}, {self.name!r})"
+
+    def to_dict(self):
+        return {"text": self.text, "quantity": self.quantity, "unit": self.unit, "name": self.name}
+
+
+def _number(text):
+    parts = text.split()
+    total = 0.0
+    for part in parts:
+        if "/" in part:
+            numerator, denominator = part.split("/")
+            if float(denominator) == 0:
+                return None
+            total += float(numerator) / float(denominator)
+        else:
+            total += float(part)
+    return total
+
+
+def _singular(word):
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith(("oes", "ches", "shes", "sses", "xes")) and len(word) > 4:
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(SINGULAR_KEEP) and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def normalize_name(text):
+    """
+    The comparable name of an ingredient: lower case, without notes in
+    parentheses or after a comma, preparation words or a trailing plural.
+    "Fresh Tomatoes (ripe), diced" -> "tomato".
+    """
+    text = re.sub(r"\([^)]*\)", " ", text.lower())
+    for part in text.split(","):
+        words = [word.strip("-'") for word in WORD_RE.findall(part)]
+        words = [word for word in words if word and word not in DESCRIPTORS]
+        if words:
+            words[-1] = _singular(words[-1])
+            return " ".join(words)
+    return ""
+
+
+def split_ingredient(text):
+    """
+    Split a line into (quantity, low, unit, note, rest): "1 (14 oz) can
+    tomatoes, drained" -> 1.0, None, "can", "(14 oz)", "tomatoes, drained".
+    `low` is the first number of a range ("2-3"). The parts parse_ingredient
+    reads, plus what it needs to put a line back together.
+    """
+    line = FRACTION_RE.sub(lambda m: (m.group(1) + " " if m.group(1) else "") + UNICODE_FRACTIONS[m.group(2)], text)
+    line = line.strip().lstrip("-•*").strip()
+
+    quantity = low = None
+    match = QUANTITY_RE.match(line)
+    if match:
+        quantity = _number(match.group(2) or match.group(1))
+        if match.group(2):
+            low = _number(match.group(1))
+        line = line[match.end():]
+    # "1 (14 oz) can tomatoes": the size note is not the unit
+    note = ""
+    match = NOTE_RE.match(line)
+    if match:
+        note = match.group(1)
+        line = line[match.end():]
+
+    unit = None
+    match = UNIT_RE.match(line)
+    if match:
+        # Exact spelling first, so "T" is a tablespoon and "t" a teaspoon
+        spelling = match.group(1)
+        unit = UNIT_ALIASES.get(spelling) or UNIT_ALIASES.get(spelling.lower())
+        line = line[match.end():].lstrip()
+    return quantity, low, unit, note, line
+
+
+@lru_cache(maxsize=65536)
+def parse_ingredient(text):
+    """Parse one ingredient line. Never raises; unparseable parts are left in the name."""
+    quantity, low, unit, note, rest = split_ingredient(text)
+    tail = "".join(" " + part for part in (note, rest) if part)
+    return Ingredient(text, quantity, unit, normalize_name(rest), tail, low)
+
+
+def format_quantity(quantity):
+    """1.5 -> "1 1/2", 0.333 -> "1/3", 2.0 -> "2"."""
+    if quantity is None:
+        return ""
+    whole = int(quantity)
+    rest = quantity - whole
+    for denominator in (2, 3, 4, 8):
+        numerator = round(rest * denominator)
+        if abs(rest * denominator - numerator) < 0.02:
+            if numerator == 0:
+                return str(whole)
+            if numerator == denominator:
+                return str(whole + 1)
+            fraction = f"{numerator}/{denominator}"
+            return f"{whole} {fraction}" if whole else fraction
+    return f"{quantity:.2f}".rstrip("0").rstrip(".")
+
+
+def shopping_list(recipes):
+    """
+    Combine the ingredients of several recipes into one list. Lines with the
+    same name and unit are added up; lines without a quantity ("salt to
+    taste") are listed once. Returns dicts (name, unit, quantity, amount,
+    recipes) sorted by name.
+    """
+    items = {}
+    for recipe in recipes:
+        for ingredient in recipe.parsed:
+            if not ingredient.name:
+                continue
+            item = items.get((ingredient.name, ingredient.unit))
+            if item is None:
+                item = items[(ingredient.name, ingredient.unit)] = {
+                    "name": ingredient.name, "unit": ingredient.unit, "quantity": None, "recipes": [],
+                }
+            if ingredient.quantity is not None:
+                item["quantity"] = (item["quantity"] or 0) + ingredient.quantity
+            if recipe.title not in item["recipes"]:
+                item["recipes"].append(recipe.title)
+
+    result = sorted(items.values(), key=lambda item: (item["name"], item["unit"] or ""))
+    for item in result:
+        item["amount"] = " ".join(part for part in (format_quantity(item["quantity"]), item["unit"]) if part)
+    return result
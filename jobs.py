@@ -0,0 +1,202 @@
+"""Local background job queue for long-running imports and exports."""
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+# Fields saved to job.json
+STATE = (
+    "id", "kind", "status", "done", "total", "message", "errors",
+    "result_path", "download_name", "created_at", "finished_at", "saved_at",
+)
+
+
+class Job:
+    """
+    One queued unit of work and its progress. With a `path`, the state is
+    also written there as JSON, so other processes can report on it.
+    Progress is saved at most every SAVE_INTERVAL seconds; `dirty` says
+    there is some not saved yet.
+    """
+
+    SAVE_INTERVAL = 0.5
+
+    def __init__(self, kind, path=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"  # queued -> running -> done | failed
+        self.done = 0
+        self.total = 0
+        self.message = ""
+        self.errors = []
+        self.result_path = None
+        self.download_name = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.saved_at = None
+        self.path = path
+        self.dirty = False
+        self._save_lock = threading.Lock()
+
+    def set_progress(self, done, total=None, message=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        self.save(force=False)
+
+    def add_error(self, error):
+        self.errors.append(str(error))
+        self.save(force=False)
+
+    def save(self, force=True):
+        if self.path is None:
+            return
+        if not force and time.time() - (self.saved_at or 0) < self.SAVE_INTERVAL:
+            self.dirty = True
+            return
+        with self._save_lock:
+            self.dirty = False
+            self.saved_at = time.time()
+            state = {name: getattr(self, name) for name in STATE}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, path):
+        """A job saved by `save()`, or None if there is none at `path`."""
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        job = cls(state["kind"])
+        for name in STATE:
+            setattr(job, name, state.get(name))
+        return job
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "message": self.message,
+            "errors": self.errors,
+            "download": self.status == "done" and self.result_path is not None,
+        }
+
+
+class JobQueue:
+    """
+    Runs jobs on a small thread pool, away from the web request threads.
+
+    A job function is called as ``func(job, *args)``. It reports progress via
+    ``job.set_progress`` and may write a file under ``job_dir(job)`` and
+    point ``job.result_path`` at it for download. Finished jobs and their
+    files are dropped after ``retention`` seconds.
+
+    Each job's state is kept in ``job.json`` in its folder under
+    ``result_dir``, so another worker process (or this one after a restart)
+    sharing that folder can report on it and serve its download. Unfinished
+    jobs are saved at least every HEARTBEAT seconds; one that hasn't been
+    for three of those was left by a process that has gone, and is reported
+    as failed.
+    """
+
+    HEARTBEAT = 30
+
+    def __init__(self, max_workers=2, result_dir=None, retention=3600):
+        self.result_dir = result_dir or os.path.join(tempfile.gettempdir(), "recipe_jobs")
+        self.retention = retention
+        os.makedirs(self.result_dir, exist_ok=True)
+
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._heartbeat = None
+
+    def submit(self, kind, func, *args):
+        self._prune()
+        job = Job(kind)
+        job.path = os.path.join(self.job_dir(job), "job.json")
+        job.save()
+        with self._lock:
+            self._jobs[job.id] = job
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name="job-heartbeat", daemon=True)
+                self._heartbeat.start()
+        self._pool.submit(self._run, job, func, args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or not JOB_ID_RE.match(job_id):
+            return job
+        # Started by another process, or before a restart
+        job = Job.load(os.path.join(self.result_dir, job_id, "job.json"))
+        if job is not None and job.status in ("queued", "running") and self._stale(job):
+            job.status = "failed"
+            job.errors.append("The job was interrupted by a restart.")
+        return job
+
+    def job_dir(self, job):
+        path = os.path.join(self.result_dir, job.id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _run(self, job, func, args):
+        job.status = "running"
+        job.save()
+        try:
+            func(job, *args)
+            job.status = "done"
+        except Exception as e:
+            traceback.print_exc()
+            job.add_error(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            job.save()
+
+    def _stale(self, job):
+        return time.time() - (job.saved_at or 0) > 3 * self.HEARTBEAT
+
+    def _beat(self):
+        # Also writes progress that set_progress held back
+        while True:
+            time.sleep(Job.SAVE_INTERVAL)
+            with self._lock:
+                unfinished = [job for job in self._jobs.values() if job.status in ("queued", "running")]
+            for job in unfinished:
+                if job.dirty or time.time() - job.saved_at >= self.HEARTBEAT:
+                    job.save()
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [j for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]
+            for job in expired:
+                del self._jobs[job.id]
+        expired = {job.id for job in expired}
+        # Jobs other processes left behind
+        for entry in os.scandir(self.result_dir):
+            if entry.name not in expired and JOB_ID_RE.match(entry.name):
+                job = Job.load(os.path.join(entry.path, "job.json"))
+                if job is not None and (job.finished_at or job.saved_at or 0) < cutoff:
+                    expired.add(entry.name)
+        for job_id in expired:
+            shutil.rmtree(os.path.join(self.result_dir, job_id), ignore_errors=True)
@@ -0,0 +1,215 @@
+"""
+Timing instrumentation, exposed at /metrics in the Prometheus text format.
+
+Modules create their metrics at import time (``histogram(...)``,
+``counter(...)``, ``gauge(...)``) and observe into them; ``install(app)``
+times every Flask request and template render and adds the /metrics route. Observing is a
+bisect and a locked increment, cheap enough to leave on in production.
+
+While a request is being handled, ``timed(..., span="db")`` blocks also add
+up per-request totals, which are sent back as a ``Server-Timing`` header
+when that is turned on.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+REGISTRY = []
+_local = threading.local()
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # label values -> total
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [count per bucket..., count over the last bucket, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def collect(self):
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                le = ("le", bound if bound == "+Inf" else _format_value(float(bound)))
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(values[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+def counter(name, help, labelnames=()):
+    metric = Counter(name, help, labelnames)
+    REGISTRY.append(metric)
+    return metric
+
+
+def gauge(name, help, labelnames=()):
+    metric = Gauge(name, help, labelnames)
+    REGISTRY.append(metric)
+    return metric
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    metric = Histogram(name, help, labelnames, buckets)
+    REGISTRY.append(metric)
+    return metric
+
+
+def render():
+    """Every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+# ------------------ Per-request timings ------------------
+def record(span, seconds):
+    """Add to the current request's Server-Timing total for `span`, if there is one."""
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        total, count = timings.get(span, (0.0, 0))
+        timings[span] = (total + seconds, count + 1)
+
+
+@contextmanager
+def timed(metric, *labels, span=None):
+    """
+    Observe how long the block (or decorated function) takes. With `span`,
+    the time also counts towards that Server-Timing entry; a span nested in
+    another one of the same name (add() calling put_many()) is counted once.
+    """
+    open_spans = getattr(_local, "open_spans", None)
+    if open_spans is None:
+        open_spans = _local.open_spans = set()
+    outer = span is not None and span not in open_spans
+    if outer:
+        open_spans.add(span)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metric.observe(elapsed, *labels)
+        if outer:
+            open_spans.discard(span)
+            record(span, elapsed)
+
+
+REQUEST_SECONDS = histogram(
+    "recipes_http_request_seconds", "Time spent handling each request, by endpoint.",
+    ("endpoint", "method", "status"),
+)
+TEMPLATE_SECONDS = histogram(
+    "recipes_template_render_seconds", "Time spent rendering each Jinja template.", ("template",),
+)
+
+
+def install(app, server_timing=False):
+    """Time every request and template render on `app` and serve /metrics."""
+    from flask import Response, before_render_template, g, request, template_rendered
+
+    @app.before_request
+    def start_timing():
+        g.metrics_started = time.perf_counter()
+        _local.timings = {}
+
+    @app.after_request
+    def finish_timing(response):
+        started = g.pop("metrics_started", None)
+        timings = getattr(_local, "timings", None) or {}
+        _local.timings = None
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        REQUEST_SECONDS.observe(elapsed, request.endpoint or "unknown", request.method, str(response.status_code))
+        if server_timing:
+            entries = [f'{span};dur={total * 1000:.1f};desc="{count} calls"' for span, (total, count) in sorted(timings.items())]
+            entries.append(f"total;dur={elapsed * 1000:.1f}")
+            response.headers["Server-Timing"] = ", ".join(entries)
+        return response
+
+    @app.teardown_request
+    def forget_timings(exc=None):
+        _local.timings = None
+
+    # blinker holds receivers weakly by default, and these only live here
+    def template_started(sender, template, context, **extra):
+        _local.template_started = time.perf_counter()
+
+    def template_finished(sender, template, context, **extra):
+        started = getattr(_local, "template_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        TEMPLATE_SECONDS.observe(elapsed, template.name or "<string>")
+        record("template", elapsed)
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
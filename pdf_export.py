@@ -0,0 +1,672 @@
+"""
+Cookbook PDF export.
+
+The story builders for the three `bulk_export_all` formats live here, plus
+ExportEngine, which renders each recipe as a cached PDF fragment (on a
+process pool when there are many to do), joins runs of fragments into
+cached segments and streams the segments into the output file. This
+module must not import app.py: the pool's worker processes import it on
+their own.
+"""
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pypdf import PdfReader
+from pypdf.generic import DictionaryObject, NameObject
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
+from reportlab.platypus import (
+    SimpleDocTemplate,
+    BaseDocTemplate,
+    PageTemplate,
+    Frame,
+    FrameBreak,
+    PageBreak,
+    Paragraph,
+    Spacer,
+    Table,
+    TableStyle,
+)
+
+import metrics
+from pdf_stream import PdfStreamWriter
+from pdf_themes import get_theme
+
+BUILD_SECONDS = metrics.histogram(
+    "recipes_pdf_build_seconds", "ReportLab doc.build time, by what was laid out.", ("kind",),
+)
+EXPORT_SECONDS = metrics.histogram(
+    "recipes_export_seconds", "Time spent in each phase of a cookbook export.", ("format", "phase"),
+)
+EXPORT_SEGMENTS = metrics.counter(
+    "recipes_export_segments_total", "Export segments, by whether they were reused or built.", ("outcome",),
+)
+
+DOWNLOAD_NAMES = {
+    "standard": "All_Recipes.pdf",
+    "category_sorted": "Category_Sorted_Recipes.pdf",
+    "cards": "Recipe_Cards.pdf", # Changed filename for clarity
+    "selected": "Selected_Recipes.pdf",
+}
+
+# Each card = 7" wide x 5" tall, centered on letter page (8.5 x 11")
+CARD_WIDTH = 7 * inch
+CARD_HEIGHT = 5 * inch
+CARD_X = (8.5 * inch - CARD_WIDTH) / 2
+CARD_TOP_Y = 11 * inch - CARD_HEIGHT - 0.5 * inch
+CARD_BOTTOM_Y = 0.5 * inch
+
+
+# ------------------ Story builders ------------------
+def recipe_flowables(recipe, styles):
+    """One full-page recipe block, as used by the standard and category formats."""
+    story = []
+    story.append(Paragraph(f"<b>{recipe['title']}</b>", styles["RecipeTitle"]))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph(f"<b>Category:</b> {recipe['category']}", styles["RecipeCategory"]))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph("<b>Ingredients:</b>", styles["RecipeSubtitle"]))
+    for ing in recipe["ingredients"]:
+        story.append(Paragraph(f"- {ing}", styles["RecipeText"]))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph("<b>Instructions:</b>", styles["RecipeSubtitle"]))
+    story.append(Paragraph(recipe["instructions"], styles["RecipeText"]))
+    story.append(Spacer(1, 12))
+    story.append(Paragraph(f"<b>Source:</b> {recipe['source']}", styles["RecipeCategory"]))
+    return story
+
+
+def category_title_flowables(category, styles):
+    """The title page that opens each category in the category_sorted format."""
+    return [
+        Spacer(1, 2 * inch), # Visually center the title
+        Paragraph(category.upper(), styles["CategoryTitlePage"]),
+    ]
+
+
+# Room inside a card's frame (Frame pads 6pt on every side)
+CARD_PADDING = 6
+CARD_INNER_WIDTH = CARD_WIDTH - 2 * CARD_PADDING
+CARD_INNER_HEIGHT = CARD_HEIGHT - 2 * CARD_PADDING
+FUZZ = 1e-6
+
+SENTENCE_END_RE = re.compile(r"[.!?]+[\"')\]]*\s+")
+TAG_RE = re.compile(r"<(/?)([a-zA-Z]+)[^>]*?(/?)>")
+
+
+def split_sentences(text):
+    """
+    Split paragraph text after each sentence, never inside markup: a cut
+    that would leave a tag open is not made.
+    """
+    pieces, start = [], 0
+    for match in SENTENCE_END_RE.finditer(text):
+        piece = text[start:match.end()]
+        if _tags_balanced(piece):
+            pieces.append(piece.strip())
+            start = match.end()
+    if start < len(text) and text[start:].strip():
+        pieces.append(text[start:].strip())
+    return pieces
+
+
+def _tags_balanced(text):
+    if "<" not in text:
+        return True
+    depth = 0
+    for closing, _, self_closing in TAG_RE.findall(text):
+        if self_closing:
+            continue
+        depth += -1 if closing else 1
+        if depth < 0:
+            return False
+    return depth == 0 and text.count("<") == len(TAG_RE.findall(text))
+
+
+class CardLayout:
+    """
+    Packs one recipe onto as few 7x5" cards as it needs. Every flowable is
+    measured with wrap() against the card's frame before it is placed, the
+    way Frame does it, so each card is known to fit and ReportLab never has
+    to retry a layout. Text is cut between steps, then between sentences,
+    and only cut mid-sentence (Paragraph.split) when a single sentence is
+    taller than a whole card.
+    """
+
+    def __init__(self, recipe, styles):
+        self.recipe = recipe
+        self.styles = styles
+        self.cards = []
+        self.story = None
+        self.used = 0
+        self.space_after = 0
+        self.empty = True  # nothing on this card yet but headings
+        self.dangling = False  # the card ends in a section label with nothing under it yet
+        self.header_height = 0
+
+    # ------------------ Measuring ------------------
+    def height(self, flowable):
+        """Height `flowable` would take next on the current card, spacing included."""
+        space = max(flowable.getSpaceBefore() - self.space_after, 0) if self.story else 0
+        _, h = flowable.wrap(CARD_INNER_WIDTH, CARD_INNER_HEIGHT)
+        return space + h
+
+    def room(self):
+        return CARD_INNER_HEIGHT - self.used
+
+    def fits(self, *flowables):
+        return sum(self.height(f) for f in flowables) <= self.room() + FUZZ
+
+    def add(self, flowable, content=True):
+        self.used += self.height(flowable)
+        self.space_after = flowable.getSpaceAfter()
+        self.used += self.space_after
+        self.story.append(flowable)
+        if content:
+            self.empty = self.dangling = False
+
+    # ------------------ Cards ------------------
+    def new_card(self, label=None):
+        """Start a card with the title and category, and `label` when a section carries on."""
+        if self.dangling:
+            self.story.pop()  # the label moves over with its section
+        self.story, self.used, self.space_after = [], 0, 0
+        self.empty, self.dangling = True, False
+        self.cards.append(self.story)
+        title = self.recipe.get("title", "Untitled")
+        self.add(Paragraph(title if len(self.cards) == 1 else f"{title} (continued)", self.styles["RecipeTitle"]), False)
+        self.add(Paragraph(self.recipe.get("category", "Uncategorized"), self.styles["RecipeCategory"]), False)
+        self.add(Spacer(1, 6), False)
+        if label:
+            self.add_label(label)
+        self.header_height = self.used
+
+    def gap(self):
+        """Space between sections, dropped at the foot of a full card."""
+        if self.fits(Spacer(1, 6)):
+            self.add(Spacer(1, 6), False)
+
+    def add_label(self, text):
+        if not self.fits(Paragraph(f"<b>{text}:</b>", self.styles["RecipeText"])):
+            self.new_card()
+        self.add(Paragraph(f"<b>{text}:</b>", self.styles["RecipeText"]), False)
+        self.dangling = True
+
+    def layout(self):
+        self.new_card()
+        ingredients = list(self.recipe.get("ingredients", []))
+        if ingredients:
+            self.layout_ingredients(ingredients)
+            self.gap()
+
+        instructions = self.recipe.get("instructions", "") or ""
+        steps = [step.strip() for step in instructions.split("\n") if step.strip()]
+        if steps:
+            self.layout_instructions(steps)
+            self.gap()
+
+        source = self.recipe.get("source", "")
+        if source:
+            line = Paragraph(f"<i>Source:</i> {source}", self.styles["RecipeCategory"])
+            if not self.fits(line):
+                self.new_card()
+            self.add(line)
+        return self.cards
+
+    def layout_ingredients(self, ingredients):
+        """Two columns, the first filled first; a list too long for the card carries on by row."""
+        half = (len(ingredients) + 1) // 2
+        col1, col2 = ingredients[:half], ingredients[half:]
+        col2 += [""] * (len(col1) - len(col2))
+        table = ingredient_table([
+            [Paragraph(f"- {c1}", self.styles["RecipeText"]), Paragraph(f"- {c2}", self.styles["RecipeText"]) if c2 else ""]
+            for c1, c2 in zip(col1, col2)
+        ])
+        self.add_label("Ingredients")
+        while True:
+            if self.fits(table):
+                self.add(table)
+                return
+            parts = table.split(CARD_INNER_WIDTH, self.room())
+            if len(parts) == 2:
+                self.add(parts[0])
+                table = parts[1]
+            elif self.empty:
+                self.add(table)  # a single row taller than a card; nothing smaller to cut
+                return
+            self.new_card("Ingredients")
+
+    def layout_instructions(self, steps):
+        style = self.styles["RecipeText"]
+        self.add_label("Instructions")
+        for step in steps:
+            sentences = split_sentences(step)
+            while sentences:
+                count = self.sentences_that_fit(sentences, style)
+                if count:
+                    self.add(Paragraph(" ".join(sentences[:count]), style))
+                    sentences = sentences[count:]
+                elif self.empty or self.taller_than_card(Paragraph(sentences[0], style)):
+                    self.split_paragraph(Paragraph(sentences.pop(0), style))
+                else:
+                    self.new_card("Instructions")
+
+    def split_paragraph(self, paragraph):
+        """A sentence taller than a card: cut it between lines, across as many cards as it takes."""
+        while not self.fits(paragraph):
+            parts = paragraph.split(CARD_INNER_WIDTH, self.room())
+            if len(parts) == 2:
+                self.add(parts[0])
+                paragraph = parts[1]
+            elif self.empty:
+                break  # not one line of it fits even an empty card
+            self.new_card("Instructions")
+        self.add(paragraph)
+
+    def taller_than_card(self, flowable):
+        """Wouldn't fit on a card of its own either, so there is no point starting one for it."""
+        return self.height(flowable) > CARD_INNER_HEIGHT - self.header_height
+
+    def sentences_that_fit(self, sentences, style):
+        """How many leading sentences fit on this card as one paragraph (a binary search on wrap())."""
+        if self.fits(Paragraph(" ".join(sentences), style)):
+            return len(sentences)
+        low, high = 0, len(sentences) - 1
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.fits(Paragraph(" ".join(sentences[:mid]), style)):
+                low = mid
+            else:
+                high = mid - 1
+        return low
+
+
+def ingredient_table(rows):
+    table = Table(rows, colWidths=[3.0*inch, 3.0*inch], splitByRow=1)
+    table.setStyle(TableStyle([
+        ('VALIGN', (0,0), (-1,-1), 'TOP'),
+        ('LEFTPADDING', (0,0), (-1,-1), 4),
+        ('RIGHTPADDING', (0,0), (-1,-1), 4),
+        ('TOPPADDING', (0,0), (-1,-1), 2),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 2),
+    ]))
+    return table
+
+
+def build_card(recipe, styles):
+    """
+    Lay a recipe out on 5x7 cards: the ingredients in two columns on the
+    first card, then the instructions, then the source, carrying on to as
+    many cards as it takes (see CardLayout). Returns one list of flowables
+    per card, each known to fit its frame.
+    """
+    return CardLayout(recipe, styles).layout()
+
+
+class TwoPerPageDoc(BaseDocTemplate):
+    """Two 5x7" cards per letter page (top + bottom)."""
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.frames = [
+            Frame(CARD_X, CARD_TOP_Y, CARD_WIDTH, CARD_HEIGHT, id="top"),
+            Frame(CARD_X, CARD_BOTTOM_Y, CARD_WIDTH, CARD_HEIGHT, id="bottom")
+        ]
+        self.addPageTemplates([PageTemplate(id="TwoPerPage", frames=self.frames)])
+
+
+class CardPageDoc(BaseDocTemplate):
+    """
+    One card per 7x5" page, with the same frame as a TwoPerPageDoc slot.
+    Shards of a card export are rendered this way and then placed two per
+    letter page when they are merged.
+    """
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(filename, pagesize=(CARD_WIDTH, CARD_HEIGHT), **kwargs)
+        frame = Frame(0, 0, CARD_WIDTH, CARD_HEIGHT, id="card")
+        self.addPageTemplates([PageTemplate(id="Card", frames=[frame])])
+
+
+# ------------------ Fragments ------------------
+# An export is a sequence of fragments that each start on a fresh page (or
+# card) and lay out the same on their own as inside the whole document:
+#   ("title", category)  the title page that opens a category
+#   ("recipe", recipe)   one recipe's pages
+#   ("card", recipe)     one recipe's cards
+# Rendered fragments are cached by content, so an export only lays out the
+# recipes that changed since the last one.
+
+# Bump when the story builders change, so cached fragments are not reused
+RENDER_VERSION = 2
+RECIPE_FIELDS = ("title", "category", "ingredients", "instructions", "source")
+
+
+def sort_by_title(recipes_list):
+    return sorted(recipes_list, key=lambda r: r.get("title", "").lower())
+
+
+def plan_fragments(recipes_list, format_type):
+    """List the fragments of an export, in output order."""
+    if format_type == "standard":
+        return [("recipe", recipe) for recipe in sort_by_title(recipes_list)]
+
+    if format_type == "category_sorted":
+        # 1. Group recipes by category
+        grouped_recipes = {}
+        for recipe in recipes_list:
+            grouped_recipes.setdefault(recipe["category"], []).append(recipe)
+
+        # 2. Sort categories and recipes within each category
+        fragments = []
+        for category in sorted(grouped_recipes.keys()):
+            fragments.append(("title", category))
+            fragments.extend(("recipe", recipe) for recipe in sort_by_title(grouped_recipes[category]))
+        return fragments
+
+    if format_type == "cards":
+        return [("card", recipe) for recipe in sort_by_title(recipes_list)]
+
+    if format_type == "selected":
+        # Recipe pages in the order they were picked
+        return [("recipe", recipe) for recipe in recipes_list]
+
+    raise ValueError(f"Unknown export format: {format_type}")
+
+
+def fragment_story(fragment, styles):
+    """Flowables for one fragment, without a break at either end."""
+    kind, value = fragment
+    if kind == "title":
+        return category_title_flowables(value, styles)
+    if kind == "recipe":
+        return recipe_flowables(value, styles)
+
+    story = []
+    for card in build_card(value, styles):
+        if story:
+            story.append(FrameBreak())
+        story.extend(card)
+    return story
+
+
+def export_story(fragments, format_type, styles):
+    """Join fragment stories into the single-document story."""
+    separator = FrameBreak if format_type == "cards" else PageBreak
+    story = []
+    for fragment in fragments:
+        if story:
+            story.append(separator())
+        story.extend(fragment_story(fragment, styles))
+    return story
+
+
+def fragment_key(fragment, signature):
+    """Content hash of everything that goes into a rendered fragment."""
+    kind, value = fragment
+    if kind != "title":
+        value = [value.get(field) for field in RECIPE_FIELDS]
+    payload = json.dumps([RENDER_VERSION, kind, value, signature], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def plan_segments(fragments, keys, size):
+    """
+    Split an export's fragments into segments, as [(start, end)] index
+    ranges. A segment ends before each category title page and after any
+    fragment whose key hashes to a multiple of `size` (so segments average
+    `size` fragments). The cut points depend on content, not position: a
+    recipe added or edited only changes the segment it lands in.
+    """
+    segments, start = [], 0
+    for i, (fragment, key) in enumerate(zip(fragments, keys)):
+        if fragment[0] == "title" and i > start:
+            segments.append((start, i))
+            start = i
+        if int(key[:8], 16) % size == 0:
+            segments.append((start, i + 1))
+            start = i + 1
+    if start < len(fragments):
+        segments.append((start, len(fragments)))
+    return segments
+
+
+def segment_key(keys):
+    """Cache key of a segment: the fragments it joins, in order."""
+    return hashlib.sha256(json.dumps(["segment", keys]).encode("utf-8")).hexdigest()
+
+
+def render_export(recipes_list, format_type, output, theme=None):
+    """Render the whole cookbook in one document in this process. Returns the download file name."""
+    fragments = plan_fragments(recipes_list, format_type)
+    styles = get_theme(theme).styles
+    if format_type == "cards":
+        doc = TwoPerPageDoc(output, pagesize=letter)
+    else:
+        doc = SimpleDocTemplate(output, pagesize=letter)
+    with metrics.timed(BUILD_SECONDS, "document"):
+        doc.build(export_story(fragments, format_type, styles))
+    return DOWNLOAD_NAMES[format_type]
+
+
+def render_fragments(jobs, theme_name=None, theme_spec=None):
+    """
+    Lay out each (fragment, path) pair into its own PDF. Runs in the pool
+    workers as well as in-process. Files are written under a temporary name
+    and renamed, so a half-written fragment is never picked up from the cache.
+    Returns [(fragment kind, doc.build seconds)] for the caller to record,
+    since a worker's own metrics never reach /metrics.
+    """
+    styles = get_theme(theme_name, theme_spec).styles
+    timings = []
+    for fragment, path in jobs:
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if fragment[0] == "card":
+            doc = CardPageDoc(tmp_path)
+        else:
+            doc = SimpleDocTemplate(tmp_path, pagesize=letter)
+        started = time.perf_counter()
+        doc.build(fragment_story(fragment, styles))
+        timings.append((fragment[0], time.perf_counter() - started))
+        os.replace(tmp_path, path)
+    return timings
+
+
+def merge_fragments(paths, format_type, output):
+    """
+    Concatenate fragment (or segment) PDFs into `output`, one file at a
+    time. For "cards" the card pages are placed two per letter page; any
+    other format_type copies pages as they are, which is how segments keep
+    cards card-sized until the final merge.
+    """
+    writer = PdfStreamWriter(output)
+    if format_type == "cards":
+        pending = []
+
+        def place_cards():
+            xobjects = DictionaryObject()
+            ops = []
+            for slot, (form, y) in enumerate(zip(pending, (CARD_TOP_Y, CARD_BOTTOM_Y))):
+                name = f"/Card{slot}"
+                xobjects[NameObject(name)] = form
+                ops.append(f"q 1 0 0 1 {CARD_X:g} {y:g} cm {name} Do Q")
+            resources = DictionaryObject({NameObject("/XObject"): xobjects})
+            writer.add_blank_page(letter[0], letter[1], resources, "\n".join(ops).encode("ascii"))
+            pending.clear()
+
+        for path in paths:
+            for card in PdfReader(path).pages:
+                pending.append(writer.add_form(card))
+                if len(pending) == 2:
+                    place_cards()
+        if pending:
+            place_cards()
+    else:
+        for path in paths:
+            for page in PdfReader(path).pages:
+                writer.add_page(page)
+    writer.close()
+
+
+def write_segment(paths, path):
+    """Join fragment PDFs into one segment file, renamed into place once complete."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as output:
+        merge_fragments(paths, "pages", output)
+    os.replace(tmp_path, path)
+
+
+# ------------------ Export engine ------------------
+class ExportEngine:
+    """
+    Renders cookbook exports from per-recipe fragments.
+
+    Fragments found in `cache` (a FragmentCache) are reused as they are; the
+    rest are laid out, across a process pool once there are at least
+    `min_parallel` of them, and everything is merged in order. Without a
+    cache, exports smaller than `min_parallel` recipes are rendered as one
+    document in memory; anything larger always goes through fragments, so
+    memory use does not grow with the size of the cookbook.
+
+    With a cache, fragments are also joined into segments (see
+    plan_segments) that are cached too, and the export is assembled from
+    those. Every fragment and segment is saved as soon as it is finished,
+    so an export that dies partway is resumed by running it again, and an
+    export after an edit rebuilds only the segment the edit is in.
+    """
+
+    def __init__(self, processes=None, min_parallel=200, max_batch_size=100, cache=None, segment_size=100):
+        self.processes = processes or os.cpu_count() or 1
+        self.min_parallel = min_parallel
+        self.max_batch_size = max_batch_size
+        self.cache = cache
+        self.segment_size = max(1, segment_size)
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            # spawn, not fork: the web process runs threads that may hold locks
+            context = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+        return self._pool
+
+    def batch_size(self, count):
+        # About four batches per process keeps the workers evenly loaded
+        return max(10, min(self.max_batch_size, math.ceil(count / (self.processes * 4))))
+
+    def render(self, recipes_list, format_type, output, progress=None, theme=None):
+        """
+        Render an export into `output` with the named theme (see pdf_themes).
+        `progress(done, total)` is called as fragments are ready. Returns the
+        download file name.
+        """
+        theme = get_theme(theme)
+        total = len(recipes_list)
+        if self.cache is None and total < self.min_parallel:
+            with metrics.timed(EXPORT_SECONDS, format_type, "document", span="export"):
+                name = render_export(recipes_list, format_type, output, theme.name)
+            if progress:
+                progress(total, total)
+            return name
+
+        fragments = plan_fragments(recipes_list, format_type)
+        if self.cache is not None:
+            return self._render_segments(fragments, format_type, output, theme, progress, total)
+
+        workdir = tempfile.mkdtemp(prefix="recipe_export_")
+        try:
+            paths = [os.path.join(workdir, f"{i:05d}.pdf") for i in range(len(fragments))]
+            if progress:
+                progress(0, total)
+            with metrics.timed(EXPORT_SECONDS, format_type, "render", span="export"):
+                self._render_missing(list(zip(fragments, paths)), theme, progress, 0, total)
+            with metrics.timed(EXPORT_SECONDS, format_type, "merge", span="export"):
+                merge_fragments(paths, format_type, output)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return DOWNLOAD_NAMES[format_type]
+
+    def _render_segments(self, fragments, format_type, output, theme, progress, total):
+        keys = [fragment_key(fragment, theme.signature) for fragment in fragments]
+        segments = [(start, end, segment_key(keys[start:end])) for start, end in plan_segments(fragments, keys, self.segment_size)]
+        # Pinned before the first lookup, so another export's eviction can't
+        # remove a file between this one finding it and merging it
+        used = keys + [segment for _, _, segment in segments]
+        self.cache.pin(used)
+        segment_paths, pending = [], []  # pending: (segment path, fragment paths) to build
+        missing = {}  # fragment path -> fragment; identical recipes share a fragment
+        try:
+            for start, end, segment in segments:
+                path = self.cache.lookup(segment)
+                if path is not None:
+                    EXPORT_SEGMENTS.inc(1, "reused")
+                    segment_paths.append(path)
+                    continue
+                paths = []
+                for fragment, key in zip(fragments[start:end], keys[start:end]):
+                    fragment_path = self.cache.lookup(key)
+                    if fragment_path is None:
+                        fragment_path = self.cache.path(key)
+                        missing.setdefault(fragment_path, fragment)
+                    paths.append(fragment_path)
+                path = self.cache.path(segment)
+                segment_paths.append(path)
+                pending.append((path, paths))
+            missing = [(fragment, path) for path, fragment in missing.items()]
+
+            done = total - sum(1 for fragment, _ in missing if fragment[0] != "title")
+            if progress:
+                progress(done, total)
+            with metrics.timed(EXPORT_SECONDS, format_type, "render", span="export"):
+                self._render_missing(missing, theme, progress, done, total)
+            self.cache.added(os.path.basename(path)[:-4] for _, path in missing)
+
+            with metrics.timed(EXPORT_SECONDS, format_type, "segment", span="export"):
+                for path, paths in pending:
+                    write_segment(paths, path)
+                    self.cache.added([os.path.basename(path)[:-4]])
+                    EXPORT_SEGMENTS.inc(1, "built")
+            with metrics.timed(EXPORT_SECONDS, format_type, "merge", span="export"):
+                merge_fragments(segment_paths, format_type, output)
+        finally:
+            self.cache.unpin(used)
+            self.cache.evict()
+        return DOWNLOAD_NAMES[format_type]
+
+    def _render_missing(self, missing, theme, progress, done, total):
+        def recipes_in(batch):
+            return sum(1 for fragment, _ in batch if fragment[0] != "title")
+
+        if self.processes <= 1 or len(missing) < self.min_parallel:
+            size = self.batch_size(len(missing))
+            for i in range(0, len(missing), size):
+                batch = missing[i:i + size]
+                self._record(render_fragments(batch, theme.name, theme.spec))
+                done += recipes_in(batch)
+                if progress:
+                    progress(done, total)
+            return
+
+        size = self.batch_size(len(missing))
+        batches = [missing[i:i + size] for i in range(0, len(missing), size)]
+        futures = {self.pool.submit(render_fragments, batch, theme.name, theme.spec): batch for batch in batches}
+        for future in as_completed(futures):
+            self._record(future.result())
+            done += recipes_in(futures[future])
+            if progress:
+                progress(done, total)
+
+    @staticmethod
+    def _record(timings):
+        for kind, seconds in timings:
+            BUILD_SECONDS.observe(seconds, kind)
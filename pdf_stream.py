@@ -0,0 +1,141 @@
+"""Write a PDF to a file page by page, without holding the document in memory."""
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    FloatObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+)
+
+
+class _CountingWriter:
+    def __init__(self, output):
+        self.output = output
+        self.position = 0
+
+    def write(self, data):
+        self.output.write(data)
+        self.position += len(data)
+        return len(data)
+
+
+class PdfStreamWriter:
+    """
+    Appends pages copied from other PDFs straight to `output`.
+
+    Each page's objects are written out as soon as it is added, so memory
+    use is one source page plus an offset per object, however long the
+    document gets. Call `close()` to write the page tree and xref table.
+    Source objects are renumbered in place, so a reader should not be used
+    for anything else once its pages have been added.
+    """
+
+    def __init__(self, output):
+        self.out = _CountingWriter(output)
+        self.offsets = [None]  # object number -> byte offset
+        self.page_refs = []
+        self._source = (None, {})  # last source PDF and its object number map
+        self.out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.pages_ref = self._reserve()
+
+    def add_page(self, page):
+        """Copy a page (and everything it uses) from a PdfReader."""
+        refs = self._refs_for(page)
+        ref = self._reserve()
+        if page.indirect_reference is not None:
+            refs[page.indirect_reference.idnum] = ref
+        dict.pop(page, "/Parent", None)
+        self._renumber(page, refs)
+        page[NameObject("/Parent")] = self.pages_ref
+        self._write(ref, page)
+        self.page_refs.append(ref)
+
+    def add_form(self, page):
+        """Copy a page from a PdfReader as a Form XObject. Returns its reference."""
+        contents = page["/Contents"]
+        if isinstance(contents, ArrayObject):
+            form = DecodedStreamObject()
+            form.set_data(b"\n".join(part.get_object().get_data() for part in contents))
+        else:
+            form = contents
+        form.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): ArrayObject([FloatObject(v) for v in page.mediabox]),
+            NameObject("/Resources"): dict.get(page, "/Resources", DictionaryObject()),
+        })
+        return self.add_object(form, self._refs_for(page))
+
+    def add_object(self, obj, refs=None):
+        """Write a new object, copying anything it refers to. Returns its reference."""
+        ref = self._reserve()
+        self._write(ref, self._renumber(obj, refs if refs is not None else {}))
+        return ref
+
+    def add_blank_page(self, width, height, resources, content):
+        """Add a page drawn by the `content` operators (bytes)."""
+        stream = DecodedStreamObject()
+        stream.set_data(content)
+        page = DictionaryObject({
+            NameObject("/Type"): NameObject("/Page"),
+            NameObject("/Parent"): self.pages_ref,
+            NameObject("/MediaBox"): ArrayObject([NumberObject(0), NumberObject(0), FloatObject(width), FloatObject(height)]),
+            NameObject("/Resources"): resources,
+            NameObject("/Contents"): self.add_object(stream),
+        })
+        self.page_refs.append(self.add_object(page))
+
+    def close(self):
+        self._write(self.pages_ref, DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(self.page_refs),
+            NameObject("/Count"): NumberObject(len(self.page_refs)),
+        }))
+        root = self.add_object(DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): self.pages_ref,
+        }))
+
+        xref_at = self.out.position
+        lines = [f"xref\n0 {len(self.offsets)}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{offset:010d} 00000 n \n" for offset in self.offsets[1:])
+        lines.append(f"trailer\n<< /Size {len(self.offsets)} /Root {root.idnum} 0 R >>\n")
+        lines.append(f"startxref\n{xref_at}\n%%EOF\n")
+        self.out.write("".join(lines).encode("ascii"))
+
+    # ------------------ Internals ------------------
+    def _reserve(self):
+        self.offsets.append(None)
+        return IndirectObject(len(self.offsets) - 1, 0, self)
+
+    def _refs_for(self, page):
+        # Objects shared by pages of the same source (fonts) are copied once
+        if self._source[0] is not page.pdf:
+            self._source = (page.pdf, {})
+        return self._source[1]
+
+    def _write(self, ref, obj):
+        self.offsets[ref.idnum] = self.out.position
+        self.out.write(f"{ref.idnum} 0 obj\n".encode("ascii"))
+        obj.write_to_stream(self.out)
+        self.out.write(b"\nendobj\n")
+
+    def _renumber(self, obj, refs):
+        """Point obj's references at objects in this file, writing them out on first use."""
+        if isinstance(obj, IndirectObject):
+            if obj.pdf is self:
+                return obj
+            ref = refs.get(obj.idnum)
+            if ref is None:
+                ref = refs[obj.idnum] = self._reserve()
+                self._write(ref, self._renumber(obj.get_object(), refs))
+            return ref
+        if isinstance(obj, DictionaryObject):
+            for key, value in list(dict.items(obj)):
+                obj[key] = self._renumber(value, refs)
+        elif isinstance(obj, ArrayObject):
+            for i, value in enumerate(list.__iter__(obj)):
+                obj[i] = self._renumber(value, refs)
+        return obj
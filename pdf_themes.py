@@ -0,0 +1,113 @@
+"""
+Export themes: the fonts and paragraph styles a cookbook export is laid out with.
+
+A theme is a small spec (font, optional TrueType file, size scale, muted
+text colour). Its stylesheet is built the first time the theme is used in
+a process and then shared by every export, so fonts are parsed and
+registered once and per-export setup is a dict lookup. Registering more
+themes costs nothing until one of them is used, and ReportLab itself is
+only imported then.
+"""
+import threading
+from types import MappingProxyType
+
+DEFAULT_THEME = "classic"
+
+# name -> spec; see register_theme
+THEMES = {
+    # Place baskerville.ttf in the project folder to use it; otherwise Times
+    "classic": {"font": "Baskerville", "font_file": "baskerville.ttf", "fallback_font": "Times-Roman", "muted": "grey"},
+    "modern": {"font": "Helvetica", "muted": "#555555"},
+    "large_print": {"font": "Helvetica", "scale": 1.3, "muted": "black"},
+}
+
+# Style names the exports use, and the settings of theirs that affect layout
+STYLE_NAMES = ("RecipeTitle", "RecipeCategory", "RecipeText", "RecipeSubtitle", "CategoryTitlePage")
+LAYOUT_ATTRS = ("fontName", "fontSize", "leading", "alignment", "textColor", "spaceBefore", "spaceAfter")
+
+_built = {}  # name -> Theme
+_fonts = {}  # font name -> name to use (the font itself, or the fallback if it failed to load)
+_lock = threading.Lock()
+
+
+class Theme:
+    """
+    A built theme. `styles` is a read-only mapping of style name to
+    ParagraphStyle (the ReportLab sample styles plus the export styles);
+    the styles are shared, so do not change them. `signature` is what goes
+    into fragment cache keys.
+    """
+
+    def __init__(self, name, spec):
+        from reportlab.lib import colors
+        from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+
+        self.name = name
+        self.spec = dict(spec)
+        font = _load_font(spec.get("font", "Times-Roman"), spec.get("font_file"), spec.get("fallback_font", "Times-Roman"))
+        scale = float(spec.get("scale", 1.0))
+        muted = colors.toColor(spec.get("muted", "grey"))
+
+        styles = getSampleStyleSheet()
+        styles.add(ParagraphStyle(name="RecipeTitle", fontName=font, fontSize=16 * scale, leading=18 * scale, alignment=1))
+        styles.add(ParagraphStyle(name="RecipeCategory", fontName=font, fontSize=10 * scale, leading=12 * scale, textColor=muted))
+        styles.add(ParagraphStyle(name="RecipeText", fontName=font, fontSize=10 * scale, leading=12 * scale))
+        styles.add(ParagraphStyle(name="RecipeSubtitle", fontName=font, fontSize=12 * scale, leading=12 * scale))
+        styles.add(ParagraphStyle(name="CategoryTitlePage", fontName=font, fontSize=48 * scale, leading=50 * scale, alignment=1, spaceAfter=50))
+        self.styles = MappingProxyType({name: styles[name] for name in styles.byName})
+        self.signature = [[repr(getattr(self.styles[n], attr)) for attr in LAYOUT_ATTRS] for n in STYLE_NAMES]
+
+    def __repr__(self):
+        return f"Theme({self.name!r})"
+
+
+def _load_font(name, font_file, fallback):
+    """Register a TrueType font once per process; returns the font name to use."""
+    if not font_file:
+        return name
+    if name not in _fonts:
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFError, TTFont
+
+        try:
+            pdfmetrics.registerFont(TTFont(name, font_file))
+            _fonts[name] = name
+        except (OSError, TTFError):
+            _fonts[name] = fallback
+    return _fonts[name]
+
+
+def register_theme(name, font="Times-Roman", font_file=None, fallback_font="Times-Roman", scale=1.0, muted="grey"):
+    """
+    Add (or replace) a theme. `font` is a standard PDF font, or the name to
+    register `font_file` (a .ttf) under; `fallback_font` is used if the
+    file can't be loaded. `scale` multiplies every font size and `muted`
+    (a ReportLab colour name or "#rrggbb") is the category/source colour.
+    """
+    from reportlab.lib import colors
+
+    spec = {"font": font, "font_file": font_file, "fallback_font": fallback_font, "scale": scale, "muted": muted}
+    colors.toColor(muted)  # fail now rather than at export time
+    with _lock:
+        THEMES[name] = spec
+        _built.pop(name, None)
+
+
+def get_theme(name=None, spec=None):
+    """
+    The built Theme for `name` (default: DEFAULT_THEME). `spec` registers
+    the theme first if this process doesn't know it, which is how pool
+    workers get themes registered in the web process. Raises KeyError for
+    an unknown theme.
+    """
+    name = name or DEFAULT_THEME
+    theme = _built.get(name)
+    if theme is not None and (spec is None or spec == theme.spec):
+        return theme
+    with _lock:
+        if spec is not None and THEMES.get(name) != spec:
+            THEMES[name] = dict(spec)
+            _built.pop(name, None)
+        if name not in _built:
+            _built[name] = Theme(name, THEMES[name])
+        return _built[name]
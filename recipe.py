@@ -0,0 +1,121 @@
+"""The normalized in-memory form of a recipe."""
+import json
+import sys
+
+from ingredients import parse_ingredient
+
+FIELDS = ("title", "ingredients", "instructions", "category", "source")
+DEFAULTS = {"title": "Untitled Recipe", "instructions": "", "category": "Uncategorized", "source": ""}
+
+
+class Recipe:
+    """
+    One recipe, normalized once when it is loaded or imported.
+
+    Every field is present (missing ones get the usual defaults), ingredients
+    are a tuple and categories are interned, so recipes in the same category
+    share one string. Instances are shared between callers and treated as
+    read-only; use `replace()` for a changed copy. `recipe["title"]` and
+    `recipe.get("title")` work as they do on the stored dicts. Fields this
+    class does not know about are kept in `extra`.
+
+    `parsed` holds each ingredient line parsed into quantity, unit and name
+    (ingredients.Ingredient), next to the raw lines in `ingredients`. It is
+    derived, so it is not part of `to_dict()` and is never stored. Code that
+    already has the parsed lines (scaling.py) can pass them in.
+    """
+
+    __slots__ = ("id", "title", "ingredients", "instructions", "category", "source", "extra", "parsed")
+
+    def __init__(self, id, title, ingredients, instructions, category, source, extra=None, parsed=None):
+        self.id = id
+        self.title = title
+        self.ingredients = ingredients
+        self.instructions = instructions
+        self.category = category
+        self.source = source
+        self.extra = extra
+        self.parsed = tuple(map(parse_ingredient, ingredients)) if parsed is None else parsed
+
+    def __repr__(self):
+        return f"Recipe({self.id!r}, {self.title!r})"
+
+    def __getitem__(self, key):
+        if key in FIELDS or key == "id":
+            return getattr(self, key)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        """The recipe as a plain dict, as it is stored (without the id)."""
+        data = dict(self.extra or ())
+        data.update(
+            title=self.title,
+            ingredients=list(self.ingredients),
+            instructions=self.instructions,
+            category=self.category,
+            source=self.source,
+        )
+        return data
+
+    def same(self, other):
+        """Whether `other` holds the same stored content (the id aside)."""
+        return other is not None and self.fingerprint() == other.fingerprint()
+
+    def fingerprint(self):
+        """Hashable stand-in for the stored content."""
+        extra = json.dumps(self.extra, sort_keys=True, default=str) if self.extra else None
+        return (self.title, self.ingredients, self.instructions, self.category, self.source, extra)
+
+    def replace(self, **fields):
+        return normalize(dict(self.to_dict(), **fields), self.id)
+
+
+def _text(value, default):
+    if value is None:
+        return default
+    return value if isinstance(value, str) else str(value)
+
+
+def normalize(data, rid=None):
+    """Build a Recipe from a stored record, or return None if it is not a recipe."""
+    if isinstance(data, Recipe):
+        return data
+    if not isinstance(data, dict):
+        return None
+
+    ingredients = data.get("ingredients")
+    if ingredients is None:
+        ingredients = ()
+    elif isinstance(ingredients, str):
+        ingredients = (ingredients,)
+    else:
+        ingredients = tuple(i if isinstance(i, str) else str(i) for i in ingredients)
+
+    extra = {key: value for key, value in data.items() if key not in FIELDS} or None
+    return Recipe(
+        rid,
+        _text(data.get("title"), DEFAULTS["title"]),
+        ingredients,
+        _text(data.get("instructions"), DEFAULTS["instructions"]),
+        sys.intern(_text(data.get("category"), DEFAULTS["category"])),
+        _text(data.get("source"), DEFAULTS["source"]),
+        extra,
+    )
+
+
+def normalize_all(records):
+    """Normalize {rid: record} in one pass, dropping records that are not recipes."""
+    recipes = {}
+    for rid, data in records.items():
+        recipe = normalize(data, rid)
+        if recipe is not None:
+            recipes[rid] = recipe
+    return recipes
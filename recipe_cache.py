@@ -0,0 +1,266 @@
+"""In-process write-through cache for the Firebase ``recipes`` node."""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from recipe import normalize, normalize_all
+
+log = logging.getLogger(__name__)
+
+
+class RecipeCache:
+    """
+    Recipe cache keyed by recipe id.
+
+    Entries are filled on the first read and updated in place by the write
+    routes. Once an entry (or the full collection) is older than ``ttl``
+    seconds the stale copy is still served while a background refresh runs.
+    At most ``max_size`` recipes are kept; when the collection is larger than
+    that, list reads fall back to Firebase every time, and listeners only
+    hear about a full load when one is due on the TTL. ``max_size=0``
+    disables caching altogether.
+
+    Records are normalized into Recipe objects as they come in, and the same
+    objects are handed to every reader and listener, so they must not be
+    changed in place (``Recipe.replace`` makes a changed copy). Records that
+    are not recipes at all are left out.
+
+    ``fetch_many(rids)``, if given, loads several missing recipes in one
+    go for ``get_many``; otherwise they are fetched one at a time.
+
+    ``listeners`` (e.g. the search index) are told about every change with
+    ``on_put(rid, data)``, ``on_delete(rid)`` and ``on_reload(recipes)`` so
+    they can stay in step without rescanning the collection. With the cache
+    disabled they are told nothing and stay empty. Evicting an
+    entry from the cache is not a change and is not reported. ``version``
+    goes up with every change to the recipes, for anything derived from
+    them (the response cache is keyed on it); reloads and refreshes that
+    bring back the same content leave it alone.
+
+    While ``live`` is set (a RecipeFeed is applying Firebase's change
+    events) entries never go stale, so nothing is re-fetched on the TTL.
+    """
+
+    def __init__(self, fetch_all, fetch_one, ttl=30, max_size=10000, listeners=None, fetch_many=None):
+        self.fetch_all = fetch_all
+        self.fetch_one = fetch_one
+        self.fetch_many = fetch_many
+        self.ttl = ttl
+        self.max_size = max_size
+        self.listeners = list(listeners or [])
+
+        self._entries = OrderedDict()  # rid -> (recipe_data, loaded_at)
+        self._lock = threading.RLock()
+        self._synced_at = None  # when the full collection was last loaded
+        self._complete = False  # whether _entries holds every recipe
+        self._refreshing = set()
+        self._digest = None  # content of the last reload, when it didn't all fit
+        self.version = 0
+        self.live = False
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    # ------------------ Reads ------------------
+    def get(self, rid):
+        """Return one recipe, or None if it does not exist."""
+        with self._lock:
+            entry = self._entries.get(rid)
+            if entry is not None:
+                self._entries.move_to_end(rid)
+                data, loaded_at = entry
+                if self._is_stale(loaded_at):
+                    self._refresh_later(rid)
+                return data
+
+        data = normalize(self.fetch_one(rid), rid)
+        if data is None:
+            return None
+        self._store(rid, data, fill=True)
+        self._notify("on_put", rid, data)
+        return data
+
+    def peek(self, rid):
+        """The cached recipe, or None if it isn't cached; never fetches."""
+        with self._lock:
+            entry = self._entries.get(rid)
+        return entry[0] if entry is not None else None
+
+    def get_many(self, rids):
+        """
+        Return ``({rid: recipe}, missing_rids)`` for a list of ids, in the
+        order given. Cached recipes are served directly and the rest are
+        fetched as one batch.
+        """
+        rids = list(dict.fromkeys(rids))
+        found, misses = {}, []
+        with self._lock:
+            for rid in rids:
+                entry = self._entries.get(rid)
+                if entry is None:
+                    misses.append(rid)
+                    continue
+                self._entries.move_to_end(rid)
+                data, loaded_at = entry
+                if self._is_stale(loaded_at):
+                    self._refresh_later(rid)
+                found[rid] = data
+
+        if misses:
+            if self.fetch_many:
+                fetched = self.fetch_many(misses)
+            else:
+                fetched = {rid: self.fetch_one(rid) for rid in misses}
+            for rid, data in fetched.items():
+                data = normalize(data, rid)
+                if data is None:
+                    continue
+                self._store(rid, data, fill=True)
+                self._notify("on_put", rid, data)
+                found[rid] = data
+
+        ordered = {rid: found[rid] for rid in rids if rid in found}
+        return ordered, [rid for rid in misses if rid not in found]
+
+    def all(self):
+        """Return ``{rid: recipe}`` for the whole collection."""
+        with self._lock:
+            if self._complete:
+                self.sync()
+                return {rid: data for rid, (data, _) in self._entries.items()}
+            loaded = self._synced_at is not None and not self._is_stale(self._synced_at)
+
+        if loaded:
+            # Too big to keep, so read it again, but the listeners are current
+            return normalize_all(self.fetch_all())
+        return dict(self._load_all())
+
+    def sync(self):
+        """
+        Make sure the full collection has been loaded once, so listeners are
+        populated, and refresh it in the background once it is stale.
+        """
+        with self._lock:
+            if self._synced_at is not None:
+                if self._is_stale(self._synced_at):
+                    self._refresh_later(None)
+                return
+        self._load_all()
+
+    # ------------------ Writes ------------------
+    def put(self, rid, data):
+        """Store a full recipe after it has been written to Firebase."""
+        data = normalize(data, rid)
+        if data is None:
+            return
+        self._store(rid, data)
+        self._notify("on_put", rid, data)
+
+    def delete(self, rid):
+        with self._lock:
+            if self._entries.pop(rid, None) is not None or not self._complete:
+                self.version += 1
+        self._notify("on_delete", rid)
+
+    def refresh(self, rid):
+        """Load one recipe from the store again, in the background."""
+        self._refresh_later(rid)
+
+    def reload(self, recipes):
+        """Replace the whole collection with `recipes` ({rid: recipe})."""
+        recipes = normalize_all(recipes)
+        now = time.monotonic()
+        with self._lock:
+            self._synced_at = now
+            if len(recipes) <= self.max_size:
+                changed = not self._complete or self._changed(recipes)
+                self._entries = OrderedDict((rid, (data, now)) for rid, data in recipes.items())
+                self._complete = True
+                self._digest = None
+            else:
+                # Most of it isn't kept to compare with, so compare a digest
+                digest = hash(frozenset((rid, data.fingerprint()) for rid, data in recipes.items()))
+                changed = digest != self._digest
+                self._digest = digest
+                self._complete = False
+                # Keep what was cached (as loaded now) and fill up to max_size
+                kept = [rid for rid in self._entries if rid in recipes]
+                kept += [rid for rid in recipes if rid not in self._entries][:self.max_size - len(kept)]
+                self._entries = OrderedDict((rid, (recipes[rid], now)) for rid in kept)
+            if changed:
+                self.version += 1
+            self._notify("on_reload", recipes)
+        return recipes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._synced_at = None
+            self._complete = False
+
+    # ------------------ Internals ------------------
+    def _is_stale(self, loaded_at):
+        return not self.live and time.monotonic() - loaded_at > self.ttl
+
+    def _notify(self, event, *args):
+        if not self.enabled:
+            return  # nothing reads the indexes without the cache; don't keep a copy of everything in them
+        for listener in self.listeners:
+            getattr(listener, event)(*args)
+
+    def _changed(self, recipes):
+        if len(recipes) != len(self._entries):
+            return True
+        for rid, data in recipes.items():
+            entry = self._entries.get(rid)
+            if entry is None or not entry[0].same(data):
+                return True
+        return False
+
+    def _store(self, rid, data, fill=False):
+        """Cache a recipe. `fill` is one loaded on a miss: only new if the cache held every recipe."""
+        with self._lock:
+            entry = self._entries.get(rid)
+            if entry is None:
+                changed = not fill or self._complete
+            else:
+                changed = not entry[0].same(data)
+            if changed:
+                self.version += 1
+                self._digest = None
+            self._entries[rid] = (data, time.monotonic())
+            self._entries.move_to_end(rid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                # Something was evicted, so the cache no longer holds every recipe
+                self._complete = False
+
+    def _load_all(self):
+        return self.reload(self.fetch_all())
+
+    def _refresh_later(self, rid):
+        """Refresh one recipe (or everything when rid is None) in the background."""
+        key = rid if rid is not None else "*"
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        def run():
+            try:
+                if rid is None:
+                    self._load_all()
+                else:
+                    data = self.fetch_one(rid)
+                    if data is None:
+                        self.delete(rid)
+                    else:
+                        self.put(rid, data)
+            except Exception as e:
+                log.warning("Recipe cache refresh failed: %s", e)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,329 @@
+"""Keeps the recipe cache in step with Firebase through its realtime event stream."""
+import codecs
+import copy
+import http.client
+import json
+import logging
+import queue
+import random
+import socket
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+log = logging.getLogger(__name__)
+
+
+class RecipeFeed:
+    """
+    Background subscriber that applies ``recipes`` change events to a
+    RecipeCache.
+
+    ``connect(handler)`` opens a stream and returns an object with a
+    ``thread`` and ``close()``, like FirebaseStore.stream (EventStream); the
+    handler is called with ``{"event", "path", "data"}`` messages. Firebase
+    starts every stream with a ``put`` of the whole node, so each
+    (re)connect is also a full resync. While that snapshot is current the
+    cache is marked live and stops polling on its TTL.
+
+    If the stream dies, is cancelled or goes quiet for ``idle_timeout``
+    seconds (Firebase sends a keep-alive every 30), it is reopened after a
+    jittered backoff of up to ``max_delay`` seconds.
+    """
+
+    def __init__(self, cache, connect, flatten=None, idle_timeout=90, max_delay=60):
+        self.cache = cache
+        self.connect = connect
+        self.flatten = flatten or (lambda data: data)
+        self.idle_timeout = idle_timeout
+        self.max_delay = max_delay
+
+        self.connected = False
+        self.events = 0
+        self._last_event = None
+        self._stop = threading.Event()
+        self._restart = threading.Event()
+        self._thread = None
+
+    @property
+    def version(self):
+        return self.cache.version
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="recipe-feed", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # ------------------ Connection ------------------
+    def _run(self):
+        delay = 1
+        while not self._stop.is_set():
+            opened_at = time.monotonic()
+            try:
+                self._follow(self.connect(self._handle))
+            except Exception as e:
+                log.warning("Recipe feed error: %s", e)
+            self._set_live(False)
+            if self._stop.is_set():
+                break
+
+            if time.monotonic() - opened_at > self.max_delay:
+                delay = 1  # it was up for a while, so reconnect quickly
+            self._stop.wait(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, self.max_delay)
+
+    def _follow(self, stream):
+        """Wait until the stream ends, is stopped, or needs restarting."""
+        self._restart.clear()
+        self._last_event = time.monotonic()
+        try:
+            while stream.thread.is_alive():
+                if self._stop.is_set() or self._restart.is_set():
+                    break
+                if time.monotonic() - self._last_event > self.idle_timeout:
+                    log.warning("Recipe feed went quiet, reconnecting")
+                    break
+                stream.thread.join(timeout=1)
+        finally:
+            if stream.thread.is_alive():
+                stream.close()
+
+    def _set_live(self, live):
+        self.connected = live
+        self.cache.live = live
+
+    # ------------------ Events ------------------
+    def _handle(self, message):
+        self._last_event = time.monotonic()
+        event = message.get("event")
+        if event in ("cancel", "auth_revoked"):
+            log.warning("Recipe feed %s, reconnecting", event)
+            self._set_live(False)
+            self._restart.set()
+            return
+        if event not in ("put", "patch"):
+            return  # keep-alive
+
+        self.events += 1
+        try:
+            parts = [p for p in (message.get("path") or "/").split("/") if p]
+            data = message.get("data")
+            if event == "put":
+                self._set(parts, data)
+            else:
+                for key, value in (data or {}).items():
+                    self._set(parts + [p for p in key.split("/") if p], value)
+        except Exception as e:
+            # The mirror may be off now; resync from a fresh stream
+            log.warning("Recipe feed could not apply %s at %s: %s", event, message.get("path"), e)
+            self._set_live(False)
+            self._restart.set()
+
+    def _set(self, parts, value):
+        if not parts:
+            recipes = {rid: self.flatten(data) for rid, data in (value or {}).items()}
+            self.cache.reload(recipes)
+            self._set_live(True)
+            return
+
+        rid, rest = parts[0], parts[1:]
+        if not rest:
+            if value is None:
+                self.cache.delete(rid)
+            else:
+                self.cache.put(rid, self.flatten(value))
+            return
+
+        # A change to one field of a recipe
+        cached = self.cache.peek(rid)
+        if cached is None:
+            # Not cached, so there is nothing to apply it to: load the whole
+            # recipe in the background instead of blocking the stream on it
+            self.cache.refresh(rid)
+            return
+        recipe = cached.to_dict()
+        node = recipe
+        for key in rest[:-1]:
+            node = node.setdefault(key, {})
+        if value is None:
+            node.pop(rest[-1], None)
+        else:
+            node[rest[-1]] = value
+        self.cache.put(rid, recipe)
+
+
+class EventStream:
+    """
+    Reads a Firebase REST event stream (server-sent events) on a thread and
+    calls ``handler`` with ``{"event", "path", "data"}`` messages, the
+    interface RecipeFeed expects from ``connect``.
+
+    Used instead of pyrebase's Stream, which drops Firebase's keep-alives
+    (``data: null``) before they reach the handler, so a quiet but healthy
+    stream looked dead. Keep-alives are passed on as ``{"event":
+    "keep-alive"}``. ``timeout`` is the (connect, read) timeout; the read
+    timeout only has to outlast the 30s between keep-alives.
+
+    The stream is read with http.client rather than requests, whose reads
+    wait for a whole chunk of the asked-for size: ``read1`` returns whatever
+    has arrived, chunked or not.
+    """
+
+    MAX_REDIRECTS = 5
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, url, headers, handler, timeout=(10, 120)):
+        self.url = url
+        self.headers = headers
+        self.handler = handler
+        self.timeout = timeout
+        self._closed = threading.Event()
+        self._connection = None
+        self._sock = None  # kept here: http.client lets go of it once a response owns it
+        self.thread = threading.Thread(target=self._run, name="recipe-stream", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self._closed.set()
+        # Closing the connection from here would wait on the reader's lock for
+        # as long as it is blocked on the socket, so wake it by shutting that down
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if threading.current_thread() is not self.thread:
+            # Otherwise the read ends on its timeout; nothing is handled after close
+            self.thread.join(timeout=1)
+
+    def _run(self):
+        try:
+            response = self._open()
+            for event, data in self._events(response):
+                if self._closed.is_set():
+                    return
+                self._dispatch(event, data)
+        except Exception as e:
+            if not self._closed.is_set():
+                log.warning("Recipe stream error: %s", e)
+        finally:
+            if self._connection is not None:
+                self._connection.close()
+            if self._sock is not None:
+                self._sock.close()
+
+    def _open(self):
+        """GET the stream, following redirects (Firebase may send one to the database's own host)."""
+        connect_timeout, read_timeout = self.timeout
+        url = self.url
+        for _ in range(self.MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            connection = self._connection = connection_class(parts.netloc, timeout=connect_timeout)
+            if self._closed.is_set():
+                raise ConnectionError("closed")
+            connection.connect()
+            self._sock = connection.sock
+            self._sock.settimeout(read_timeout)
+            target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+            connection.request("GET", target, headers=dict(self.headers, Accept="text/event-stream"))
+            response = connection.getresponse()
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                url = urljoin(url, response.getheader("Location"))
+                response.close()
+                connection.close()
+                continue
+            if response.status >= 400:
+                raise ConnectionError(f"HTTP {response.status} {response.reason} from {parts.netloc}")
+            return response
+        raise ConnectionError("too many redirects")
+
+    @classmethod
+    def _events(cls, response):
+        """(event, data) pairs as each one is complete."""
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        partial, event, data = "", None, []
+        for chunk in iter(lambda: response.read1(cls.READ_SIZE), b""):
+            text = decoder.decode(chunk)
+            if "\n" not in text:
+                partial += text  # the snapshot is one long line
+                continue
+            lines = (partial + text).split("\n")
+            partial = lines.pop()
+            for line in lines:
+                line = line.rstrip("\r")
+                if not line:
+                    if event:
+                        yield event, "\n".join(data)
+                    event, data = None, []
+                    continue
+                field, _, value = line.partition(":")
+                value = value[1:] if value.startswith(" ") else value
+                if field == "event":
+                    event = value
+                elif field == "data":
+                    data.append(value)
+
+    def _dispatch(self, event, data):
+        if event in ("put", "patch"):
+            payload = json.loads(data)
+            self.handler({"event": event, "path": payload.get("path"), "data": payload.get("data")})
+        else:
+            # keep-alive, cancel, auth_revoked
+            self.handler({"event": event, "data": data})
+
+
+class LocalEventSource:
+    """
+    In-process stand-in for the Firebase event stream, for running the feed
+    without a live database. Each connection starts with a ``put`` of
+    ``data``; ``emit()`` sends an event to every open connection.
+    """
+
+    def __init__(self, data=None):
+        self.data = data if data is not None else {}
+        self._streams = []
+
+    def __call__(self, handler):
+        stream = _LocalStream(handler)
+        self._streams.append(stream)
+        stream.queue.put({"event": "put", "path": "/", "data": copy.deepcopy(self.data)})
+        return stream
+
+    def emit(self, event, path, data):
+        for stream in self._streams:
+            stream.queue.put({"event": event, "path": path, "data": copy.deepcopy(data)})
+
+    def disconnect(self):
+        """Drop every open connection, as a network failure would."""
+        streams, self._streams = self._streams, []
+        for stream in streams:
+            stream.close()
+
+
+class _LocalStream:
+    def __init__(self, handler):
+        self.handler = handler
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                return
+            self.handler(message)
+
+    def close(self):
+        self.queue.put(None)
+        if threading.current_thread() is not self.thread:
+            self.thread.join()
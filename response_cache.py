@@ -0,0 +1,145 @@
+"""
+Server-side cache of rendered pages and PDF downloads, served with strong
+ETags and Last-Modified so repeat requests can be answered with 304.
+"""
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, request, send_file
+
+import metrics
+from fragment_cache import FragmentCache
+
+RESPONSES = metrics.counter(
+    "recipes_response_cache_total",
+    "Cacheable responses, by kind (page or file) and outcome (hit, miss, not_modified or uncached).",
+    ("kind", "outcome"),
+)
+
+
+def fingerprint(*parts):
+    """Hash of JSON-able parts, e.g. a recipe's fields for a per-recipe cache key."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Rendered responses keyed by whatever the caller puts in `key(...)`,
+    normally the route, its parameters and a data version.
+
+    Up to `max_pages` HTML bodies are kept in memory, least recently used
+    first out. Files (PDF downloads) are kept in `directory`, up to
+    `max_bytes`; with no directory they are not cached. ETags are hashes of
+    the bytes sent, so they stay valid across restarts and processes, but
+    cache keys include a per-process salt: versions start over in every
+    process, so a key from an earlier run must never match.
+
+    Every response is sent with ``Cache-Control: no-cache``, so browsers
+    revalidate each time instead of guessing how long a page stays fresh.
+    """
+
+    def __init__(self, max_pages=512, directory=None, max_bytes=256 * 1024 * 1024):
+        self.max_pages = max_pages
+        self.files = FragmentCache(directory, max_bytes) if directory and max_bytes > 0 else None
+        self._salt = secrets.token_hex(8)
+        self._pages = OrderedDict()  # key -> (body, etag, last_modified)
+        self._file_info = {}  # key -> (etag, last_modified, download_name)
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Forget every cached response; files on disk are left to eviction."""
+        with self._lock:
+            self._pages.clear()
+            self._file_info.clear()
+
+    def key(self, *parts):
+        return fingerprint(self._salt, *parts)
+
+    def page(self, key, render):
+        """
+        The HTML from `render()`, cached under `key`. Anything other than a
+        string (an error tuple, a redirect) is returned as it is, uncached.
+        """
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is not None:
+                self._pages.move_to_end(key)
+        outcome = "hit"
+        if entry is None:
+            body = render()
+            if not isinstance(body, str):
+                RESPONSES.inc(1, "page", "uncached")
+                return body
+            entry = (body, hashlib.sha256(body.encode("utf-8")).hexdigest()[:32], int(time.time()))
+            outcome = "miss"
+            if self.max_pages > 0:
+                with self._lock:
+                    self._pages[key] = entry
+                    while len(self._pages) > self.max_pages:
+                        self._pages.popitem(last=False)
+
+        body, etag, last_modified = entry
+        response = Response(body, mimetype="text/html")
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.make_conditional(request)
+        return self._finish(response, "page", outcome)
+
+    def file(self, key, render, download_name=None, mimetype="application/pdf", conditional=True):
+        """
+        Send the file `render(output)` writes (it may return the download
+        name), cached on disk under `key`. Needs a directory. With
+        `conditional=False` (for POSTs, which browsers never revalidate) it
+        is sent without an ETag or Last-Modified and never as a 304.
+        """
+        with self._lock:
+            info = self._file_info.get(key)
+        if info is not None and self.files.lookup(key) is not None:
+            try:
+                return self._send(key, info, mimetype, "hit", conditional)
+            except FileNotFoundError:
+                pass  # evicted since the lookup
+
+        path = self.files.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as output:
+                download_name = render(output) or download_name
+            digest = hashlib.sha256()
+            with open(tmp_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        info = (digest.hexdigest()[:32], int(time.time()), download_name)
+        with self._lock:
+            self._file_info[key] = info
+        self.files.added([key])
+        self.files.evict(keep={key})
+        return self._send(key, info, mimetype, "miss", conditional)
+
+    def _send(self, key, info, mimetype, outcome, conditional=True):
+        etag, last_modified, download_name = info
+        # send_file answers If-None-Match / If-Modified-Since (and Range) itself
+        response = send_file(
+            self.files.path(key), as_attachment=True, download_name=download_name, mimetype=mimetype,
+            etag=etag if conditional else False, last_modified=last_modified, conditional=conditional,
+        )
+        if not conditional:
+            response.headers.pop("Last-Modified", None)
+        return self._finish(response, "file", outcome)
+
+    @staticmethod
+    def _finish(response, kind, outcome):
+        response.headers["Cache-Control"] = "no-cache"
+        if response.status_code == 304:
+            outcome = "not_modified"
+        RESPONSES.inc(1, kind, outcome)
+        return response
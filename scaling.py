@@ -0,0 +1,222 @@
+"""
+Scaling recipes to a number of servings and converting their units, for a
+whole export at once.
+
+The parsed lines of every recipe (Recipe.parsed) are laid out as NumPy
+arrays of quantities, unit codes and per-recipe factors, so the arithmetic
+is a few array operations however many lines there are. The lines whose
+amount changes are written back out together: each distinct amount is
+formatted once and joined to the rest of its line (Ingredient.tail, kept
+from parsing), so Python only loops once per recipe.
+"""
+import math
+import re
+from itertools import chain
+from operator import attrgetter
+
+from ingredients import UNITS, Ingredient, format_quantity
+from recipe import Recipe
+
+UNIT_SYSTEMS = ("metric", "us")
+MAX_SERVINGS = 100
+
+# Unit -> (kind, size in ml or g, system)
+UNIT_SIZES = {
+    "tsp": ("volume", 4.92892, "us"),
+    "tbsp": ("volume", 14.7868, "us"),
+    "fl oz": ("volume", 29.5735, "us"),
+    "cup": ("volume", 236.588, "us"),
+    "pint": ("volume", 473.176, "us"),
+    "quart": ("volume", 946.353, "us"),
+    "gallon": ("volume", 3785.41, "us"),
+    "ml": ("volume", 1.0, "metric"),
+    "l": ("volume", 1000.0, "metric"),
+    "oz": ("mass", 28.3495, "us"),
+    "lb": ("mass", 453.592, "us"),
+    "mg": ("mass", 0.001, "metric"),
+    "g": ("mass", 1.0, "metric"),
+    "kg": ("mass", 1000.0, "metric"),
+}
+# Converted amounts use the first unit, in order, that they are smaller than
+# the limit of (in ml or g)
+TARGET_UNITS = {
+    ("metric", "volume"): (("ml", 1000.0), ("l", math.inf)),
+    ("metric", "mass"): (("g", 1000.0), ("kg", math.inf)),
+    ("us", "volume"): (("tsp", 14.7868), ("tbsp", 59.147), ("cup", math.inf)),
+    ("us", "mass"): (("oz", 453.592), ("lb", math.inf)),
+}
+# Written as they are whatever the amount; the rest get a plural
+ABBREVIATIONS = {"tsp", "tbsp", "fl oz", "oz", "lb", "ml", "l", "mg", "g", "kg"}
+
+# Unit codes used in the arrays: 0 is no unit
+UNIT_NAMES = (None,) + tuple(UNITS)
+UNIT_CODES = {name: code for code, name in enumerate(UNIT_NAMES)}
+
+SERVINGS_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def recipe_servings(recipe):
+    """How many a recipe serves, from a "servings" or "yields" field ("4 servings"), or None."""
+    for field in ("servings", "yields"):
+        value = recipe.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value) if value > 0 else None
+        if isinstance(value, str):
+            match = SERVINGS_RE.search(value)
+            if match and float(match.group()) > 0:
+                return float(match.group())
+    return None
+
+
+def format_amount(quantity, unit, low=None):
+    """12.0, "g" -> "12 g"; 1.5, "cup" -> "1 1/2 cups"; with `low` a range, "2-3 cloves"."""
+    if UNIT_SIZES.get(unit, (None, None, None))[2] == "metric":
+        number = f"{quantity:g}" if low is None else f"{low:g}-{quantity:g}"
+    else:
+        number = format_quantity(quantity) if low is None else f"{format_quantity(low)}-{format_quantity(quantity)}"
+    if unit is None:
+        return number
+    if unit not in ABBREVIATIONS and quantity > 1:
+        unit += "es" if unit.endswith(("ch", "sh")) else "s"
+    return f"{number} {unit}"
+
+
+def _round_metric(values):
+    """Three significant figures: 236.588 -> 237, 4.92892 -> 4.93."""
+    import numpy as np
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        digits = np.floor(np.log10(np.abs(values)))
+        shift = np.where(np.isfinite(digits), 2 - digits, 0)
+        # Multiplying by 0.1 would leave 44.400000000000006; divide by 10 instead
+        scale = 10.0 ** np.abs(shift)
+        rounded = np.where(shift > 0, np.round(values * scale) / scale, np.round(values / scale) * scale)
+        return np.where(values > 0, rounded, values)
+
+
+def _round_us(values):
+    """The nearest eighth or third, whichever is closer: 0.3 -> 1/3, 0.35 -> 3/8, 0.04 -> 0."""
+    import numpy as np
+
+    eighths = np.round(values * 8) / 8
+    thirds = np.round(values * 3) / 3
+    return np.where(np.abs(thirds - values) < np.abs(eighths - values), thirds, eighths)
+
+
+def scale_recipes(recipes, servings=None, units=None):
+    """
+    `recipes` scaled to `servings` and/or with US and metric amounts
+    converted to `units` ("metric" or "us"), in the same order. Recipes
+    that don't say how many they serve are only converted; recipes with
+    nothing to change are returned as they are.
+    """
+    recipes = list(recipes)
+    if not recipes or (servings is None and units is None):
+        return recipes
+
+    import numpy as np
+
+    lines = list(chain.from_iterable(recipe.parsed for recipe in recipes))
+    if not lines:
+        return recipes
+    counts = np.fromiter((len(recipe.parsed) for recipe in recipes), dtype=np.intp, count=len(recipes))
+    # None (no amount) comes out as NaN; so does `low` for lines that aren't a range
+    quantities = np.array(list(map(attrgetter("quantity"), lines)), dtype=np.float64)
+    lows = np.array(list(map(attrgetter("low"), lines)), dtype=np.float64)
+    codes = np.fromiter(map(UNIT_CODES.__getitem__, map(attrgetter("unit"), lines)), dtype=np.intp, count=len(lines))
+
+    # Per-recipe factors, repeated out to one per line
+    factors = np.ones(len(recipes))
+    if servings is not None:
+        for i, recipe in enumerate(recipes):
+            serves = recipe_servings(recipe)
+            if serves:
+                factors[i] = servings / serves
+    line_factors = np.repeat(factors, counts)
+    amounts = quantities * line_factors
+    lows = lows * line_factors
+    scaled = amounts, lows, codes
+
+    # Lookup tables indexed by unit code
+    sizes = np.array([UNIT_SIZES.get(name, (None, 0.0))[1] for name in UNIT_NAMES])
+    is_metric = np.array([UNIT_SIZES.get(name, (None, None, None))[2] == "metric" for name in UNIT_NAMES])
+    converted = np.zeros(len(lines), dtype=bool)
+    if units is not None:
+        for (system, kind), targets in TARGET_UNITS.items():
+            if system != units:
+                continue
+            # Lines in a unit of this kind from the other system
+            sources = [
+                UNIT_CODES[name] for name, (unit_kind, _, unit_system) in UNIT_SIZES.items()
+                if unit_kind == kind and unit_system != system
+            ]
+            mask = np.isin(codes, sources) & ~np.isnan(amounts)
+            base = amounts * sizes[codes]
+            conditions = [base < limit for _, limit in targets]
+            target_codes = np.select(conditions, [UNIT_CODES[name] for name, _ in targets], default=codes)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                amounts = np.where(mask, base / sizes[target_codes], amounts)
+                lows = np.where(mask, lows * sizes[codes] / sizes[target_codes], lows)
+            codes = np.where(mask, target_codes, codes)
+            converted |= mask
+
+    # Converted to cups, ounces and so on: kitchen fractions. An amount too
+    # small to write that way (a gram of yeast) keeps its metric unit.
+    to_us = converted & ~is_metric[codes]
+    amounts = np.where(to_us, _round_us(amounts), amounts)
+    lows = np.where(to_us, _round_us(lows), lows)
+    too_small = to_us & (amounts == 0)
+    if too_small.any():
+        amounts, lows, codes = (np.where(too_small, before, after) for before, after in zip(scaled, (amounts, lows, codes)))
+        converted &= ~too_small
+
+    changed = ~np.isnan(amounts) & ((line_factors != 1) | converted)
+    amounts = np.where(changed & is_metric[codes], _round_metric(amounts), amounts)
+    lows = np.where(changed & is_metric[codes], _round_metric(lows), lows)
+    # A range that rounds to one number is written as that number
+    lows = np.where(lows == amounts, np.nan, lows)
+
+    ends = np.cumsum(counts)
+    changed_before = np.concatenate(([0], np.cumsum(changed)))
+    changed_per_recipe = changed_before[ends] - changed_before[ends - counts]
+    rows = np.flatnonzero(changed)
+    if not len(rows):
+        return recipes
+
+    # Each distinct (amount, unit) is formatted once, then the changed lines
+    # are rebuilt together as object arrays: amount text + the line's tail
+    # (amount, unit code) pairs as one complex number each, for a 1-D unique
+    pairs, inverse = np.unique(amounts[rows] + 1j * codes[rows], return_inverse=True)
+    amount_text = np.array(
+        [format_amount(pair.real, UNIT_NAMES[int(pair.imag)]) for pair in pairs.tolist()], dtype=object,
+    )[inverse]
+    # Ranges are few; they are written one by one
+    row_lows = lows[rows]
+    for i in np.flatnonzero(~np.isnan(row_lows)).tolist():
+        amount_text[i] = format_amount(amounts[rows[i]], UNIT_NAMES[codes[rows[i]]], row_lows[i])
+    row_lows = [None if math.isnan(low) else low for low in row_lows.tolist()]
+    texts = np.fromiter(chain.from_iterable(recipe.ingredients for recipe in recipes), dtype=object, count=len(lines))
+    parsed = np.fromiter(lines, dtype=object, count=len(lines))
+    tails = np.fromiter(map(attrgetter("tail"), parsed[rows]), dtype=object, count=len(rows))
+    new_texts = amount_text + tails
+    texts[rows] = new_texts
+    parsed[rows] = list(map(
+        Ingredient, new_texts, amounts[rows].tolist(), map(UNIT_NAMES.__getitem__, codes[rows].tolist()),
+        map(attrgetter("name"), parsed[rows]), tails, row_lows,
+    ))
+
+    # Back to Python once per recipe, for the recipes with a changed line
+    result = []
+    texts, parsed = texts.tolist(), parsed.tolist()
+    for recipe, start, end, n in zip(recipes, (ends - counts).tolist(), ends.tolist(), changed_per_recipe.tolist()):
+        if not n:
+            result.append(recipe)
+            continue
+        extra = recipe.extra
+        if servings is not None and recipe_servings(recipe):
+            extra = dict(extra or (), servings=servings)
+        result.append(Recipe(
+            recipe.id, recipe.title, tuple(texts[start:end]), recipe.instructions, recipe.category, recipe.source,
+            extra, parsed=tuple(parsed[start:end]),
+        ))
+    return result
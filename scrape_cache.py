@@ -0,0 +1,118 @@
+"""Persistent cache of parsed recipe pages, so re-imported URLs are not downloaded and parsed again."""
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid")
+
+
+def normalize_url(url):
+    """
+    Key for a recipe page URL. Scheme (http/https), host case, a leading
+    "www.", default ports, fragments, trailing slashes, tracking
+    parameters and query order all point at the same page.
+    """
+    url = (url or "").strip()
+    try:
+        parts = urlsplit(url if "//" in url else "//" + url)
+        host = (parts.hostname or "").lower()
+        port = parts.port
+    except ValueError:
+        return url
+    if host.startswith("www."):
+        host = host[4:]
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    path = parts.path.rstrip("/") or "/"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+class ScrapeCache:
+    """
+    Parsed title, ingredients, instructions and yields per normalized URL,
+    kept in a SQLite file with the page's ETag, Last-Modified and a hash of its body.
+
+    Entries younger than `fresh_for` seconds are used without any request;
+    older ones are revalidated by the Scraper with a conditional GET.
+    Connections are per thread, as the scraper's workers share the cache.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pages (
+            url_key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            title TEXT,
+            ingredients TEXT,
+            instructions TEXT,
+            yields TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            digest TEXT,
+            fetched_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path, fresh_for=86400):
+        self.path = path
+        self.fresh_for = fresh_for
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """
+        The cached page for a normalized URL as a dict (recipe, etag,
+        last_modified, digest, fresh), or None.
+        """
+        row = self._conn().execute(
+            "SELECT title, ingredients, instructions, yields, etag, last_modified, digest, fetched_at"
+            " FROM pages WHERE url_key = ?", (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        title, ingredients, instructions, yields, etag, last_modified, digest, fetched_at = row
+        recipe = {"title": title, "ingredients": json.loads(ingredients), "instructions": instructions}
+        if yields is not None:
+            recipe["yields"] = yields
+        return {
+            "recipe": recipe,
+            "etag": etag,
+            "last_modified": last_modified,
+            "digest": digest,
+            "fresh": time.time() - fetched_at < self.fresh_for,
+        }
+
+    def put(self, key, url, recipe, etag=None, last_modified=None, digest=None):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pages"
+                " (url_key, url, title, ingredients, instructions, yields, etag, last_modified, digest, fetched_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, recipe.get("title"), json.dumps(recipe.get("ingredients") or []),
+                 recipe.get("instructions"), recipe.get("yields"), etag, last_modified, digest, time.time()),
+            )
+
+    def touch(self, key, etag=None, last_modified=None):
+        """Mark a page as just revalidated, keeping any validators the server didn't resend."""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE pages SET fetched_at = ?, etag = coalesce(?, etag),"
+                " last_modified = coalesce(?, last_modified) WHERE url_key = ?",
+                (time.time(), etag, last_modified, key),
+            )
@@ -0,0 +1,178 @@
+"""Concurrent recipe scraping for bulk URL imports."""
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import metrics
+from governor import CircuitOpen, Governor, transient
+from scrape_cache import normalize_url
+
+SCRAPE_SECONDS = metrics.histogram(
+    "recipes_scrape_seconds", "Time spent fetching and parsing recipe pages.", ("phase",),
+)
+SCRAPES = metrics.counter(
+    "recipes_scrapes_total",
+    "Recipe URLs scraped, by outcome (parsed, cached, not_modified, unchanged, stale or error).",
+    ("outcome",),
+)
+
+
+class ScrapeResult:
+    """
+    Outcome of scraping one URL: either `recipe` or `error` is set.
+    `cached` is true when the page was not parsed again.
+    """
+
+    def __init__(self, url, recipe=None, error=None, cached=False):
+        self.url = url
+        self.recipe = recipe
+        self.error = error
+        self.cached = cached
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class Scraper:
+    """
+    Fetches and parses recipe URLs in parallel.
+
+    At most `max_workers` URLs are in flight at once and at most `per_host`
+    of them against the same site. `timeout` is the connect/read timeout for
+    each page fetch. Fetches go through `governor` with the site's host as
+    the target: a rate limit per site, retries with backoff when it fails or
+    answers 429/5xx, and a circuit breaker that stops fetching from a site
+    that keeps failing. Scrapes made with `limit=False` (someone is waiting
+    on the page) skip the rate limit and are only held to `per_host`.
+
+    With a ScrapeCache, pages parsed before are reused: fresh entries
+    without a request, older ones after a conditional GET (or when the body
+    hashes the same as last time). When the site can't be reached, the
+    cached copy is used however old it is.
+
+    requests and recipe-scrapers are imported by the first scrape, not when
+    the app starts.
+    """
+
+    def __init__(self, max_workers=8, per_host=2, timeout=15, cache=None, governor=None):
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.cache = cache
+        self.governor = governor or Governor("scrape", rate=1, burst=3)
+
+        self._session = None
+        self._host_limits = {}
+        self._host_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._host_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def _host_limit(self, host):
+        with self._host_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.Semaphore(self.per_host)
+            return self._host_limits[host]
+
+    def fetch(self, url, headers=None, limit=True):
+        host = urlparse(url).netloc.lower()
+        with self._host_limit(host):
+            return self.governor.call(host, lambda: self._get(url, headers), limit=limit)
+
+    def _get(self, url, headers):
+        from recipe_scrapers import HEADERS
+
+        with metrics.timed(SCRAPE_SECONDS, "fetch", span="scrape"):
+            response = self.session.get(url, headers={**HEADERS, **(headers or {})}, timeout=self.timeout)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    def scrape(self, url, category, limit=True):
+        """Scrape one URL into a recipe dict. Never raises."""
+        try:
+            parsed, outcome = self._parsed_page(url, limit)
+        except Exception as e:
+            SCRAPES.inc(1, "error")
+            return ScrapeResult(url, error=e)
+        SCRAPES.inc(1, outcome)
+        recipe = dict(parsed, category=category, source=url)
+        return ScrapeResult(url, recipe=recipe, cached=outcome != "parsed")
+
+    def _parsed_page(self, url, limit):
+        """Title, ingredients, instructions (and yields) for a URL, and how they were got."""
+        key = normalize_url(url)
+        entry = self.cache.get(key) if self.cache else None
+        if entry and entry["fresh"]:
+            return entry["recipe"], "cached"
+
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            response = self.fetch(url, headers, limit)
+        except Exception as e:
+            # The site is down or turning us away: an old copy beats an error
+            if entry and (isinstance(e, CircuitOpen) or transient(e)):
+                return entry["recipe"], "stale"
+            raise
+        etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        if response.status_code == 304:
+            if not entry:
+                raise ValueError("server answered 304 Not Modified to a plain GET")
+            self.cache.touch(key, etag, last_modified)
+            return entry["recipe"], "not_modified"
+
+        digest = hashlib.sha256(response.content).hexdigest()
+        if entry and entry["digest"] == digest:
+            self.cache.touch(key, etag, last_modified)
+            return entry["recipe"], "unchanged"
+
+        from recipe_scrapers import scrape_html
+
+        with metrics.timed(SCRAPE_SECONDS, "parse", span="scrape"):
+            scraper = scrape_html(response.text, org_url=url)
+            parsed = {
+                "title": scraper.title(),
+                "ingredients": scraper.ingredients(),
+                "instructions": scraper.instructions(),
+            }
+            # "4 servings", for scaling; plenty of pages don't say
+            try:
+                parsed["yields"] = scraper.yields()
+            except Exception:
+                pass
+        if self.cache:
+            self.cache.put(key, url, parsed, etag, last_modified, digest)
+        return parsed, "parsed"
+
+    def scrape_all(self, urls, category, progress=None, limit=True):
+        """
+        Scrape every URL concurrently. Results keep the order of `urls`.
+        `progress(done, total)` is called as each URL finishes.
+        """
+        if not urls:
+            return []
+        workers = min(self.max_workers, len(urls))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self.scrape, url, category, limit) for url in urls]
+            for done, _ in enumerate(as_completed(futures), start=1):
+                if progress:
+                    progress(done, len(urls))
+            return [f.result() for f in futures]
@@ -0,0 +1,454 @@
+"""In-memory indexes for recipe search, title-ordered listing, source URLs and ingredients."""
+import base64
+import itertools
+import json
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+from ingredients import normalize_name
+from recipe import Recipe
+from scrape_cache import normalize_url
+
+TOKEN_RE = re.compile(r"[^\W_]+")
+STOPWORDS = {"and", "&"}
+FIELDS = ("title", "ingredient", "category")
+
+# Assumed to be in every kitchen when asking what can be made
+PANTRY = ("salt", "pepper", "black pepper", "salt and pepper", "water", "ice")
+
+# Once a query has narrowed things down to this many recipes, remaining terms
+# are checked against each recipe's own tokens instead of merging postings.
+SCAN_LIMIT = 256
+
+
+def tokenize(text):
+    if text is None:
+        return []
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def parse_query(query):
+    """
+    Turn a search string into a list of (fields, term, prefix) clauses, all
+    of which must match. The last term is still being typed, so it matches
+    any token that starts with it.
+
+      "chicken soup"           -> title, ingredient or category
+      "has chicken and lemon"  -> ingredients only
+      "category:dessert"       -> a single field
+    """
+    query = (query or "").strip().lower()
+    default_fields = FIELDS
+    for prefix in ("has ", "with "):
+        if query.startswith(prefix):
+            query = query[len(prefix):]
+            default_fields = ("ingredient",)
+            break
+
+    clauses = []
+    for word in query.split():
+        fields = default_fields
+        field, sep, rest = word.partition(":")
+        if sep and field in FIELDS:
+            fields, word = (field,), rest
+        elif sep and field == "ingredients":
+            fields, word = ("ingredient",), rest
+        for term in tokenize(word):
+            if term not in STOPWORDS:
+                clauses.append((fields, term, False))
+    if clauses:
+        fields, term, _ = clauses[-1]
+        clauses[-1] = (fields, term, True)
+    return clauses
+
+
+class RecipeIndex:
+    """
+    Token/prefix index over recipe titles, ingredients and categories.
+
+    Kept up to date incrementally as a RecipeCache listener. Postings are
+    sets of recipe ids per token; a sorted vocabulary per field gives prefix
+    lookups with bisect.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {field: {} for field in FIELDS}  # field -> token -> {rid}
+        self._vocab = {field: [] for field in FIELDS}  # field -> sorted tokens
+        self._docs = {}  # rid -> {field: frozenset(tokens)}
+        self._categories = {}  # exact category value -> {rid}
+        self._doc_category = {}  # rid -> exact category value
+
+    def __len__(self):
+        return len(self._docs)
+
+    # ------------------ Cache listener ------------------
+    def on_put(self, rid, data):
+        with self._lock:
+            self._remove(rid)
+            self._add(rid, data)
+
+    def on_delete(self, rid):
+        with self._lock:
+            self._remove(rid)
+
+    def on_reload(self, recipes):
+        with self._lock:
+            for rid in [rid for rid in self._docs if rid not in recipes]:
+                self._remove(rid)
+            for rid, data in recipes.items():
+                if self._doc_tokens(data) != self._docs.get(rid) or self._doc_category.get(rid) != self._category_of(data):
+                    self._remove(rid)
+                    self._add(rid, data)
+
+    # ------------------ Queries ------------------
+    def search(self, query, category=None):
+        """Return the set of recipe ids matching `query` (and `category`, if given)."""
+        clauses = parse_query(query)
+        with self._lock:
+            candidates = None
+            if category:
+                candidates = set(self._categories.get(category, ()))
+            if not clauses:
+                return candidates if candidates is not None else set(self._docs)
+
+            # Exact terms first, then longer prefixes, which expand to fewer tokens
+            for fields, term, prefix in sorted(clauses, key=lambda c: (c[2], -len(c[1]))):
+                # A finished word that is not a whole token anywhere is most
+                # likely cut short ("chick soup"), so fall back to a prefix match
+                prefix = prefix or not any(term in self._postings[field] for field in fields)
+                if candidates is not None and len(candidates) <= SCAN_LIMIT:
+                    candidates = {rid for rid in candidates if self._doc_matches(rid, fields, term, prefix)}
+                else:
+                    matches = set()
+                    for field in fields:
+                        if prefix:
+                            matches |= self._prefix_postings(field, term)
+                        else:
+                            matches |= self._postings[field].get(term, set())
+                    candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    break
+            return candidates
+
+    def categories(self):
+        with self._lock:
+            return sorted(c for c in self._categories if c is not None)
+
+    # ------------------ Internals ------------------
+    @staticmethod
+    def _category_of(recipe):
+        return recipe.category
+
+    @staticmethod
+    def _doc_tokens(recipe):
+        ingredient_tokens = set()
+        for line in recipe.ingredients:
+            # Quantities are noise for ingredient search
+            ingredient_tokens.update(t for t in tokenize(line) if not t.isdigit())
+        return {
+            "title": frozenset(tokenize(recipe.title)),
+            "ingredient": frozenset(ingredient_tokens),
+            "category": frozenset(tokenize(recipe.category)),
+        }
+
+    def _add(self, rid, data):
+        tokens = self._doc_tokens(data)
+        self._docs[rid] = tokens
+        for field, field_tokens in tokens.items():
+            postings = self._postings[field]
+            for token in field_tokens:
+                if token not in postings:
+                    postings[token] = set()
+                    insort(self._vocab[field], token)
+                postings[token].add(rid)
+
+        category = self._category_of(data)
+        self._doc_category[rid] = category
+        self._categories.setdefault(category, set()).add(rid)
+
+    def _remove(self, rid):
+        tokens = self._docs.pop(rid, None)
+        if tokens is None:
+            return
+        for field, field_tokens in tokens.items():
+            postings = self._postings[field]
+            for token in field_tokens:
+                rids = postings[token]
+                rids.discard(rid)
+                if not rids:
+                    del postings[token]
+                    vocab = self._vocab[field]
+                    del vocab[bisect_left(vocab, token)]
+
+        category = self._doc_category.pop(rid)
+        rids = self._categories[category]
+        rids.discard(rid)
+        if not rids:
+            del self._categories[category]
+
+    def _prefix_postings(self, field, term):
+        vocab = self._vocab[field]
+        postings = self._postings[field]
+        exact = postings.get(term)
+        i = bisect_left(vocab, term)
+        if exact is not None:
+            i += 1
+        extra = []
+        while i < len(vocab) and vocab[i].startswith(term):
+            extra.append(postings[vocab[i]])
+            i += 1
+        if not extra:
+            return set(exact) if exact is not None else set()
+        return set(exact or ()).union(*extra)
+
+    def _doc_matches(self, rid, fields, term, prefix):
+        tokens = self._docs[rid]
+        if not prefix:
+            return any(term in tokens[field] for field in fields)
+        return any(token.startswith(term) for field in fields for token in tokens[field])
+
+
+def title_key(data):
+    """Sort key used for listing: the lowercased title."""
+    if isinstance(data, Recipe):
+        return data.title.lower()
+    if not isinstance(data, dict):
+        return ""
+    return str(data.get("title", "Untitled Recipe")).lower()
+
+
+def encode_cursor(key):
+    """Opaque cursor for the (title_key, rid) pair a page ended on."""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError for a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        title, rid = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return (str(title), str(rid))
+
+
+class TitleOrder:
+    """
+    Recipe ids kept sorted by (lowercased title, id), so a page of the list
+    is a slice instead of a sort of the whole collection. Kept up to date as
+    a RecipeCache listener.
+    """
+
+    # Filtered pages sort the matching ids directly when there are at most
+    # this many; larger result sets are walked in title order instead.
+    SORT_LIMIT = 2000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []  # sorted (title_key, rid)
+        self._key_of = {}  # rid -> (title_key, rid)
+
+    def __len__(self):
+        return len(self._keys)
+
+    # ------------------ Cache listener ------------------
+    def on_put(self, rid, data):
+        key = (title_key(data), rid)
+        with self._lock:
+            if self._key_of.get(rid) == key:
+                return
+            self._remove(rid)
+            self._key_of[rid] = key
+            insort(self._keys, key)
+
+    def on_delete(self, rid):
+        with self._lock:
+            self._remove(rid)
+
+    def on_reload(self, recipes):
+        key_of = {rid: (title_key(data), rid) for rid, data in recipes.items()}
+        with self._lock:
+            if key_of != self._key_of:
+                self._key_of = key_of
+                self._keys = sorted(key_of.values())
+
+    # ------------------ Paging ------------------
+    def page(self, limit, offset=0, after=None, only=None):
+        """
+        Return (rids, has_more) for one page in title order.
+
+        `after` is a (title_key, rid) cursor to continue from; `offset` skips
+        that many rows past it. `only` restricts the listing to a set of ids,
+        e.g. search results.
+        """
+        with self._lock:
+            keys = self._keys
+            if only is not None and len(only) <= self.SORT_LIMIT:
+                keys = sorted(self._key_of[rid] for rid in only if rid in self._key_of)
+                only = None
+
+            start = bisect_right(keys, after) if after else 0
+            if only is None:
+                rows = keys[start + offset:start + offset + limit + 1]
+            else:
+                rows = []
+                skipped = 0
+                for key in itertools.islice(keys, start, None):
+                    if key[1] not in only:
+                        continue
+                    if skipped < offset:
+                        skipped += 1
+                        continue
+                    rows.append(key)
+                    if len(rows) > limit:
+                        break
+
+        return [rid for _, rid in rows[:limit]], len(rows) > limit
+
+    def key(self, rid):
+        return self._key_of.get(rid)
+
+    def _remove(self, rid):
+        key = self._key_of.pop(rid, None)
+        if key is not None:
+            del self._keys[bisect_left(self._keys, key)]
+
+
+class SourceIndex:
+    """
+    Recipe ids by normalized source URL, so URL imports can skip pages that
+    were imported before. Kept up to date as a RecipeCache listener.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rids = {}  # normalized source -> {rid}
+        self._source_of = {}  # rid -> normalized source
+
+    def __len__(self):
+        return len(self._source_of)
+
+    def find(self, url):
+        """The id of a recipe imported from `url`, or None."""
+        with self._lock:
+            rids = self._rids.get(normalize_url(url))
+            return next(iter(rids)) if rids else None
+
+    # ------------------ Cache listener ------------------
+    def on_put(self, rid, data):
+        with self._lock:
+            self._remove(rid)
+            self._add(rid, data)
+
+    def on_delete(self, rid):
+        with self._lock:
+            self._remove(rid)
+
+    def on_reload(self, recipes):
+        with self._lock:
+            self._rids, self._source_of = {}, {}
+            for rid, data in recipes.items():
+                self._add(rid, data)
+
+    def _add(self, rid, recipe):
+        if recipe.source:
+            key = normalize_url(recipe.source)
+            self._source_of[rid] = key
+            self._rids.setdefault(key, set()).add(rid)
+
+    def _remove(self, rid):
+        key = self._source_of.pop(rid, None)
+        if key is not None:
+            rids = self._rids[key]
+            rids.discard(rid)
+            if not rids:
+                del self._rids[key]
+
+
+class IngredientIndex:
+    """
+    Recipe ids by the words of their parsed ingredient names (Recipe.parsed),
+    for "what can I make with ..." queries. Having "chicken" covers "chicken
+    breast", as every word of what you have is in the ingredient. Kept up to
+    date as a RecipeCache listener.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = {}  # word -> {rid}
+        self._needs = {}  # rid -> ((name, frozenset(words)), ...), one per distinct ingredient
+
+    def __len__(self):
+        return len(self._needs)
+
+    def can_make(self, have, pantry=PANTRY, max_missing=0):
+        """
+        Recipes that use at least one of `have` (ingredient names as typed)
+        and need nothing beyond `have` and `pantry`, or at most `max_missing`
+        other ingredients. Returns [(rid, [missing names])], fewest missing
+        first.
+        """
+        terms = {frozenset(normalize_name(name).split()) for name in have} - {frozenset()}
+        pantry = {normalize_name(name) for name in pantry}
+        results = []
+        with self._lock:
+            candidates = set()
+            for term in terms:
+                candidates |= set.intersection(*(self._postings.get(word, set()) for word in term))
+            for rid in candidates:
+                missing = [
+                    name for name, words in self._needs[rid]
+                    if name not in pantry and not any(term <= words for term in terms)
+                ]
+                if len(missing) <= max_missing:
+                    results.append((rid, missing))
+        results.sort(key=lambda result: len(result[1]))
+        return results
+
+    # ------------------ Cache listener ------------------
+    def on_put(self, rid, data):
+        with self._lock:
+            self._remove(rid)
+            self._add(rid, data)
+
+    def on_delete(self, rid):
+        with self._lock:
+            self._remove(rid)
+
+    def on_reload(self, recipes):
+        with self._lock:
+            for rid in [rid for rid in self._needs if rid not in recipes]:
+                self._remove(rid)
+            for rid, data in recipes.items():
+                if self._needs_of(data) != self._needs.get(rid):
+                    self._remove(rid)
+                    self._add(rid, data)
+
+    # ------------------ Internals ------------------
+    @staticmethod
+    def _needs_of(recipe):
+        names = dict.fromkeys(ingredient.name for ingredient in recipe.parsed if ingredient.name)
+        return tuple((name, frozenset(name.split())) for name in names)
+
+    def _add(self, rid, recipe):
+        needs = self._needs_of(recipe)
+        if not needs:
+            return
+        self._needs[rid] = needs
+        for _, words in needs:
+            for word in words:
+                self._postings.setdefault(word, set()).add(rid)
+
+    def _remove(self, rid):
+        needs = self._needs.pop(rid, None)
+        if needs is None:
+            return
+        for _, words in needs:
+            for word in words:
+                rids = self._postings.get(word)
+                if rids is not None:
+                    rids.discard(rid)
+                    if not rids:
+                        del self._postings[word]
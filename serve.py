@@ -0,0 +1,12 @@
+"""
+Runs the web app (`python serve.py`, or `python app.py`, which hands over to
+this). The app is imported only below: the export pool's spawned workers
+import this module again, and they must not run the app's startup.
+"""
+import os
+
+if __name__ == "__main__":
+    from app import app
+
+    port = int(os.environ.get("PORT", 10000))  # Render expects port 10000 by default
+    app.run(host="0.0.0.0", port=port, debug=False)
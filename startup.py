@@ -0,0 +1,103 @@
+"""
+Cold-start helpers: values built on first use, a background warm-up, and a
+report of how long each startup phase took.
+
+Import this before anything heavy; the report's clock starts here.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+STARTED = time.perf_counter()
+
+STARTUP_SECONDS = metrics.gauge(
+    "recipes_startup_seconds", "Time spent in each startup, first-use and warm-up phase.", ("phase",),
+)
+
+
+class StartupReport:
+    """Named phase timings, printed as one line and exported at /metrics."""
+
+    def __init__(self, started=STARTED):
+        self.phases = []  # (name, seconds)
+        self._last = started
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.phases.append((name, seconds))
+        STARTUP_SECONDS.set(round(seconds, 4), name)
+
+    def mark(self, name):
+        """Record the time since the previous mark (or process start) as `name`."""
+        now = time.perf_counter()
+        self.add(name, now - self._last)
+        self._last = now
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def summary(self, title="Startup"):
+        with self._lock:
+            phases = list(self.phases)
+        parts = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in phases)
+        return f"{title}: {parts}"
+
+
+class Lazy:
+    """
+    A value made by `factory()` the first time `get()` is called, then kept.
+    Safe to call from several threads; the factory runs once. With a
+    `report`, the first-use time is recorded under `name`.
+    """
+
+    def __init__(self, factory, name=None, report=None):
+        self.factory = factory
+        self.name = name or getattr(factory, "__name__", "lazy")
+        self.report = report
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if self._loaded:
+            return self._value
+        with self._lock:
+            if not self._loaded:
+                started = time.perf_counter()
+                self._value = self.factory()
+                self._loaded = True
+                if self.report is not None:
+                    self.report.add(f"load {self.name}", time.perf_counter() - started)
+        return self._value
+
+
+def warm_up(steps, report):
+    """
+    Run `steps` ([(name, fn)]) one after another in a background thread,
+    timing each, then print the report. A failing step is printed and
+    skipped; whatever it was meant to load is loaded on first use instead.
+    """
+    def run():
+        for name, step in steps:
+            try:
+                with report.phase(f"warm-up {name}"):
+                    step()
+            except Exception as e:
+                print(f"Warm-up step {name} failed: {e}")
+        print(report.summary("Warm-up done"))
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
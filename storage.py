@@ -0,0 +1,445 @@
+"""
+Recipe storage backends.
+
+Both stores hold {rid: recipe} and have the same methods, so app.py can
+use either:
+
+  get(rid), get_many(rids), all()       reads
+  query(after, limit, search, category, offset) one title-ordered page
+  generate_key(), add(recipe)           new recipes
+  put_many(recipes), update(rid, fields), delete(rid)
+
+FirebaseStore also has stream(handler) for the change feed
+(live_updates = True).
+
+Results may be shared between callers (FirebaseStore coalesces identical
+concurrent reads), so they must not be changed in place.
+"""
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from governor import Governor
+from recipe_feed import EventStream
+from search_index import parse_query, title_key, tokenize
+
+DB_SECONDS = metrics.histogram(
+    "recipes_db_call_seconds", "Time spent in each recipe store call.", ("backend", "op"),
+)
+FIREBASE_HTTP_SECONDS = metrics.histogram(
+    "recipes_firebase_http_seconds", "Firebase REST round trips, up to the response headers.", ("method",),
+)
+FIREBASE_BYTES = metrics.counter(
+    "recipes_firebase_response_bytes_total", "Bytes received from Firebase REST calls.", ("method",),
+)
+
+
+def search_words(recipe):
+    """A recipe's search tokens by search_index field, each as one space-separated string."""
+    ingredients = recipe.get("ingredients") or []
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+    category = recipe.get("category", "Uncategorized")
+    return {
+        "title": " ".join(tokenize(recipe.get("title", ""))),
+        # Quantities are noise for ingredient search, as in the in-memory index
+        "ingredient": " ".join(t for line in ingredients for t in tokenize(line) if not t.isdigit()),
+        "category": " ".join(tokenize(category if isinstance(category, str) else "")),
+    }
+
+
+def flatten_recipe(recipe_data):
+    """Flatten nested dicts from Firebase if needed."""
+    if isinstance(recipe_data, dict) and "ingredients" not in recipe_data and len(recipe_data) == 1:
+        inner = list(recipe_data.values())[0]
+        if isinstance(inner, dict):
+            return inner
+    return recipe_data
+
+
+class FirebaseStore:
+    """
+    Recipes under the ``recipes`` node of a Firebase Realtime Database.
+
+    Firebase only orders by stored values, and compares them case-sensitively,
+    so each recipe's lowercased title and its category are also kept under
+    ``recipe_titles`` ({rid: {"title_key", "category", "words"}}) for paging.
+    "words" holds the recipe's search tokens, so filtered pages take the same
+    search syntax as the other stores without fetching every recipe. Every
+    write here updates both nodes at once; recipes written some other way are
+    added to it the first time a page is asked for.
+
+    `connect()` returns the pyrebase app. It is called on first use rather
+    than here, so starting the web app doesn't wait for the Firebase client.
+
+    Every REST call goes through `governor` (rate limit, retries, circuit
+    breaker), and identical reads that overlap are made once: a burst of
+    requests that all need the whole recipes node share one download.
+    `timeout` bounds each connect and read, which pyrebase leaves unset.
+    The change stream is not governed.
+    """
+
+    live_updates = True
+
+    def __init__(self, connect, fetch_workers=16, page_batch=200, timeout=10, governor=None):
+        self.connect = connect
+        self.fetch_workers = fetch_workers
+        self.page_batch = page_batch
+        self.timeout = timeout
+        self.governor = governor or Governor("firebase")
+        self._writes = 0
+        self._titles_checked = False
+        self._titles_lock = threading.Lock()
+        self._firebase = None
+        self._connect_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix="recipe-fetch")
+
+    @property
+    def firebase(self):
+        if self._firebase is None:
+            with self._connect_lock:
+                if self._firebase is None:
+                    self._firebase = self._setup(self.connect())
+        return self._firebase
+
+    def _setup(self, firebase):
+        from requests.adapters import HTTPAdapter
+
+        store = self
+
+        class TimeoutAdapter(HTTPAdapter):
+            # pyrebase never passes a timeout, so a stalled Firebase would hang the caller
+            def send(self, request, timeout=None, **kwargs):
+                return super().send(request, timeout=timeout or store.timeout, **kwargs)
+
+        # Multi-id reads fetch in parallel; give pyrebase's shared session
+        # enough pooled connections for that
+        for scheme in ("http://", "https://"):
+            firebase.requests.mount(scheme, TimeoutAdapter(pool_maxsize=self.fetch_workers))
+        firebase.requests.hooks["response"].append(self._count_response)
+        return firebase
+
+    @staticmethod
+    def _count_response(response, *args, **kwargs):
+        method = response.request.method
+        FIREBASE_HTTP_SECONDS.observe(response.elapsed.total_seconds(), method)
+        FIREBASE_BYTES.inc(len(response.content), method)
+
+    def _recipes(self):
+        # A fresh database handle per call: pyrebase keeps the query path on
+        # the handle, so a shared one is not safe across threads.
+        return self.firebase.database().child("recipes")
+
+    def _titles(self):
+        return self.firebase.database().child("recipe_titles")
+
+    def _read(self, fn, key):
+        # A read that starts after a write has begun doesn't join one from before it
+        return self.governor.call("firebase", fn, key=(self._writes,) + key)
+
+    def _write(self, fn, retry=True):
+        self._writes += 1
+        return self.governor.call("firebase", fn, retry=retry)
+
+    # ------------------ Reads ------------------
+    @metrics.timed(DB_SECONDS, "firebase", "get", span="db")
+    def get(self, rid):
+        """Load one recipe, or None if it does not exist."""
+        data = self._read(lambda: self._recipes().child(rid).get().val(), ("get", rid))
+        return flatten_recipe(data) if data else None
+
+    @metrics.timed(DB_SECONDS, "firebase", "get_many", span="db")
+    def get_many(self, rids):
+        """Load several recipes concurrently, leaving out ids that do not exist."""
+        results = self._pool.map(self.get, rids)
+        return {rid: data for rid, data in zip(rids, results) if data is not None}
+
+    @metrics.timed(DB_SECONDS, "firebase", "all", span="db")
+    def all(self):
+        all_recipes = self._read(lambda: self._recipes().get().val(), ("all",)) or {}
+        return {rid: flatten_recipe(data) for rid, data in all_recipes.items()}
+
+    @metrics.timed(DB_SECONDS, "firebase", "query", span="db")
+    def query(self, after, limit, search=None, category=None, offset=0):
+        """
+        One page ordered by (lowercased title, id), like SQLiteStore.query:
+        recipe_titles is read in batches with orderByChild/limitToFirst and
+        filtered (search uses the same syntax as the
+        in-memory index) until the page is full, skipping the first `offset` matches,
+        then the page's recipes are fetched. Returns ([(rid, recipe)],
+        next_cursor_key or None).
+        """
+        self._check_titles()
+        clauses = parse_query(search)
+        keys = []
+        while True:
+            start = after[0] if after else None
+            batch = self._read(lambda: self._batch(start), ("query", start, self.page_batch)) or {}
+
+            rows = sorted(((str(entry.get("title_key", "")), rid), entry) for rid, entry in batch.items() if isinstance(entry, dict))
+            progressed = False
+            for key, entry in rows:
+                if after and key <= after:
+                    continue
+                progressed = True
+                after = key
+                if category and category != entry.get("category", "Uncategorized"):
+                    continue
+                if clauses and not self._matches(entry.get("words") or {}, clauses):
+                    continue
+                if offset:
+                    offset -= 1
+                    continue
+                if len(keys) == limit:
+                    return self._page(keys), keys[-1]
+                keys.append(key)
+
+            # A short batch is the end of the collection. A batch with nothing past
+            # the cursor means one title fills a whole batch, so stop there too.
+            if len(batch) < self.page_batch or not progressed:
+                return self._page(keys), None
+
+    def _batch(self, start):
+        query = self._titles().order_by_child("title_key")
+        if start is not None:
+            query = query.start_at(start)
+        return query.limit_to_first(self.page_batch).get().val()
+
+    def _page(self, keys):
+        # Recipes deleted since their title was read are left out
+        recipes = self.get_many([rid for _, rid in keys])
+        return [(rid, recipes[rid]) for _, rid in keys if rid in recipes]
+
+    @staticmethod
+    def _matches(words, clauses):
+        # Whole tokens, and a prefix for the last term, like SQLiteStore's FTS query
+        for fields, term, prefix in clauses:
+            tokens = [token for field in fields for token in str(words.get(field, "")).split()]
+            if not any(token.startswith(term) if prefix else token == term for token in tokens):
+                return False
+        return True
+
+    @staticmethod
+    def _title_entry(recipe):
+        recipe = flatten_recipe(recipe)
+        return {
+            "title_key": title_key(recipe),
+            "category": recipe.get("category", "Uncategorized"),
+            "words": search_words(recipe),
+        }
+
+    def _check_titles(self):
+        """Add recipe_titles entries for recipes that have none, and drop ones for deleted recipes."""
+        if self._titles_checked:
+            return
+        with self._titles_lock:
+            if self._titles_checked:
+                return
+            rids = set(self._read(lambda: self._recipes().shallow().get().val(), ("shallow", "recipes")) or ())
+            titled = set(self._read(lambda: self._titles().shallow().get().val(), ("shallow", "recipe_titles")) or ())
+            missing = rids - titled
+            if len(missing) > self.page_batch:
+                recipes = self.all()
+            else:
+                recipes = self.get_many(list(missing))
+            paths = {f"recipe_titles/{rid}": self._title_entry(recipes[rid])
+                     for rid in missing if isinstance(recipes.get(rid), dict)}
+            paths.update({f"recipe_titles/{rid}": None for rid in titled - rids})
+            if paths:
+                self._write(lambda: self.firebase.database().update(paths))
+            self._titles_checked = True
+
+    def stream(self, handler):
+        database = self._recipes()
+        return EventStream(database.build_request_url(None), database.build_headers(), handler)
+
+    # ------------------ Writes ------------------
+    def generate_key(self):
+        return self.firebase.database().generate_key()
+
+    @metrics.timed(DB_SECONDS, "firebase", "add", span="db")
+    def add(self, recipe):
+        # A key made here rather than a push, so the write can be retried safely
+        rid = self.generate_key()
+        self.put_many({rid: recipe})
+        return rid
+
+    @metrics.timed(DB_SECONDS, "firebase", "put_many", span="db")
+    def put_many(self, recipes):
+        """Write {rid: recipe} and their recipe_titles entries in one multi-path update."""
+        paths = {}
+        for rid, recipe in recipes.items():
+            paths[f"recipes/{rid}"] = recipe
+            paths[f"recipe_titles/{rid}"] = self._title_entry(recipe)
+        self._write(lambda: self.firebase.database().update(paths))
+
+    @metrics.timed(DB_SECONDS, "firebase", "update", span="db")
+    def update(self, rid, fields):
+        paths = {f"recipes/{rid}/{key}": value for key, value in fields.items()}
+        if "title" in fields:
+            paths[f"recipe_titles/{rid}/title_key"] = title_key(fields)
+        if "category" in fields:
+            paths[f"recipe_titles/{rid}/category"] = fields["category"]
+        words = search_words(fields)
+        for field, key in (("title", "title"), ("ingredient", "ingredients"), ("category", "category")):
+            if key in fields:
+                paths[f"recipe_titles/{rid}/words/{field}"] = words[field]
+        self._write(lambda: self.firebase.database().update(paths))
+
+    @metrics.timed(DB_SECONDS, "firebase", "delete", span="db")
+    def delete(self, rid):
+        self._write(lambda: self.firebase.database().update({f"recipes/{rid}": None, f"recipe_titles/{rid}": None}))
+
+
+class SQLiteStore:
+    """
+    Recipes in a local SQLite database.
+
+    Each recipe is stored as JSON next to indexed title and category
+    columns, and an FTS5 table covers titles, categories, ingredients and
+    instructions, so filtered pages are answered by the database instead of
+    scanning every recipe. Connections are per thread.
+    """
+
+    live_updates = False
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS recipes (
+            id TEXT PRIMARY KEY,
+            title_key TEXT NOT NULL,
+            category TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS recipes_by_title ON recipes (title_key, id);
+        CREATE INDEX IF NOT EXISTS recipes_by_category ON recipes (category, title_key, id);
+        CREATE VIRTUAL TABLE IF NOT EXISTS recipes_fts USING fts5(title, category, ingredients, instructions);
+    """
+    # search_index field names -> FTS columns
+    FTS_COLUMNS = {"title": "title", "ingredient": "ingredients", "category": "category"}
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ------------------ Reads ------------------
+    @metrics.timed(DB_SECONDS, "sqlite", "get", span="db")
+    def get(self, rid):
+        row = self._conn().execute("SELECT data FROM recipes WHERE id = ?", (rid,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    @metrics.timed(DB_SECONDS, "sqlite", "get_many", span="db")
+    def get_many(self, rids):
+        found = {}
+        rids = list(rids)
+        for i in range(0, len(rids), 500):
+            chunk = rids[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for rid, data in self._conn().execute(f"SELECT id, data FROM recipes WHERE id IN ({marks})", chunk):
+                found[rid] = json.loads(data)
+        return {rid: found[rid] for rid in rids if rid in found}
+
+    @metrics.timed(DB_SECONDS, "sqlite", "all", span="db")
+    def all(self):
+        return {rid: json.loads(data) for rid, data in self._conn().execute("SELECT id, data FROM recipes")}
+
+    @metrics.timed(DB_SECONDS, "sqlite", "query", span="db")
+    def query(self, after, limit, search=None, category=None, offset=0):
+        """
+        One page ordered by (lowercased title, id), filtered in SQL, after
+        skipping the first `offset` matches.
+        `search` uses the same syntax as the in-memory index. Returns
+        ([(rid, recipe)], next_cursor_key or None).
+        """
+        where, params = [], []
+        match = self._fts_query(search)
+        if match:
+            where.append("rowid IN (SELECT rowid FROM recipes_fts WHERE recipes_fts MATCH ?)")
+            params.append(match)
+        if category:
+            where.append("category = ?")
+            params.append(category)
+        if after:
+            where.append("(title_key, id) > (?, ?)")
+            params.extend(after)
+
+        sql = "SELECT id, title_key, data FROM recipes"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY title_key, id LIMIT ? OFFSET ?"
+        rows = self._conn().execute(sql, params + [limit + 1, offset]).fetchall()
+
+        page = [(rid, json.loads(data)) for rid, _, data in rows[:limit]]
+        next_key = (rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+        return page, next_key
+
+    def _fts_query(self, search):
+        terms = []
+        for fields, term, prefix in parse_query(search):
+            columns = " ".join(self.FTS_COLUMNS[field] for field in fields)
+            terms.append(f'{{{columns}}} : "{term}"' + ("*" if prefix else ""))
+        return " AND ".join(terms)
+
+    # ------------------ Writes ------------------
+    def generate_key(self):
+        # Time-ordered like Firebase push ids, so newer recipes sort last
+        return "%013x%s" % (int(time.time() * 1000), secrets.token_hex(5))
+
+    @metrics.timed(DB_SECONDS, "sqlite", "add", span="db")
+    def add(self, recipe):
+        rid = self.generate_key()
+        self.put_many({rid: recipe})
+        return rid
+
+    @metrics.timed(DB_SECONDS, "sqlite", "put_many", span="db")
+    def put_many(self, recipes):
+        """Insert or replace {rid: recipe} in one transaction."""
+        with self._conn() as conn:
+            for rid, recipe in recipes.items():
+                self._put(conn, rid, recipe)
+
+    @metrics.timed(DB_SECONDS, "sqlite", "update", span="db")
+    def update(self, rid, fields):
+        with self._conn() as conn:
+            row = conn.execute("SELECT data FROM recipes WHERE id = ?", (rid,)).fetchone()
+            recipe = json.loads(row[0]) if row else {}
+            recipe.update(fields)
+            self._put(conn, rid, recipe)
+
+    @metrics.timed(DB_SECONDS, "sqlite", "delete", span="db")
+    def delete(self, rid):
+        with self._conn() as conn:
+            row = conn.execute("DELETE FROM recipes WHERE id = ? RETURNING rowid", (rid,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM recipes_fts WHERE rowid = ?", row)
+
+    @staticmethod
+    def _put(conn, rid, recipe):
+        category = recipe.get("category", "Uncategorized")
+        category = category if isinstance(category, str) else None
+        (rowid,) = conn.execute(
+            "INSERT INTO recipes (id, title_key, category, data) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (id) DO UPDATE SET title_key = excluded.title_key,"
+            " category = excluded.category, data = excluded.data RETURNING rowid",
+            (rid, title_key(recipe), category, json.dumps(recipe)),
+        ).fetchone()
+
+        conn.execute("DELETE FROM recipes_fts WHERE rowid = ?", (rowid,))
+        conn.execute(
+            "INSERT INTO recipes_fts (rowid, title, category, ingredients, instructions) VALUES (?, ?, ?, ?, ?)",
+            (rowid, str(recipe.get("title", "")), category or "", search_words(recipe)["ingredient"], str(recipe.get("instructions", ""))),
+        )
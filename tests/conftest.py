@@ -0,0 +1,36 @@
+import pytest
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """app.py on a SQLite store in a temp folder, imported once for the whole run."""
+    folder = tmp_path_factory.mktemp("app")
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv("RECIPE_STORE", "sqlite")
+        env.setenv("RECIPE_DB", str(folder / "recipes.db"))
+        env.setenv("SCRAPE_CACHE_DB", str(folder / "scrape_cache.db"))
+        env.setenv("RESPONSE_CACHE_DIR", str(folder / "responses"))
+        env.setenv("EXPORT_CACHE_DIR", str(folder / "fragments"))
+        env.setenv("JOB_DIR", str(folder / "jobs"))
+        env.setenv("EXPORT_PROCESSES", "1")
+        env.setenv("WARMUP", "0")
+        import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def load_recipes(app_module):
+    """Replace everything in the app's store and caches with {rid: recipe}."""
+    def load(recipes):
+        store = app_module.store
+        for rid in store.all():
+            store.delete(rid)
+        store.put_many(recipes)
+        app_module.recipe_cache.reload(store.all())
+        app_module.response_cache.clear()
+    return load
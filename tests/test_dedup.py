@@ -0,0 +1,135 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+from dedup import DuplicateIndex, features, missing_fields, signature
+from recipe import normalize
+
+INSTRUCTIONS = (
+    "Heat the oil in a large pan over medium heat. Add the onion and cook for five minutes. "
+    "Stir in the garlic, ginger and curry paste and cook until fragrant. Pour in the coconut milk "
+    "and simmer gently for twenty minutes until the chickpeas are tender. Season and serve with rice."
+)
+
+
+def curry(rid, **fields):
+    data = {
+        "title": "Chickpea Curry",
+        "ingredients": [
+            "2 tbsp oil", "1 onion, diced", "3 cloves garlic", "1 tbsp ginger", "2 tbsp curry paste",
+            "1 can coconut milk", "2 cans chickpeas", "1 cup rice",
+        ],
+        "instructions": INSTRUCTIONS,
+    }
+    data.update(fields)
+    return normalize(data, rid)
+
+
+def cake(rid):
+    return normalize({
+        "title": "Sponge Cake",
+        "ingredients": ["200 g flour", "200 g sugar", "200 g butter", "4 eggs", "1 tsp baking powder"],
+        "instructions": "Cream the butter and sugar until pale. Beat in the eggs one at a time, "
+                        "then fold in the flour and baking powder. Bake for 25 minutes until golden.",
+    }, rid)
+
+
+def index_of(*recipes):
+    index = DuplicateIndex()
+    for recipe in recipes:
+        index.on_put(recipe.id, recipe)
+    return index
+
+
+def test_a_copy_with_small_changes_is_similar():
+    index = index_of(curry("a"), cake("b"))
+    copy = curry("c", title="Easy Chickpea Curry", ingredients=curry("x").ingredients[:-1] + ("1 cup basmati rice",))
+    matches = index.similar(copy)
+    assert [rid for rid, _ in matches] == ["a"]
+    assert matches[0][1] >= 0.7
+
+
+def test_unrelated_recipes_are_not_similar():
+    index = index_of(curry("a"))
+    assert index.similar(cake("b")) == []
+
+
+def test_similar_leaves_out_the_recipe_itself():
+    recipe = curry("a")
+    index = index_of(recipe)
+    assert index.similar(recipe, exclude="a") == []
+    assert index.similar(recipe) == [("a", 1.0)]
+
+
+def test_clusters_group_copies_together():
+    index = index_of(curry("a"), curry("b"), cake("c"), cake("d"), curry("e", instructions="Cook it all."))
+    clusters = [sorted(cluster) for cluster in index.clusters()]
+    assert sorted(clusters) == [["a", "b"], ["c", "d"]]
+
+
+def test_deleted_and_reloaded_recipes_leave_the_index():
+    index = index_of(curry("a"), curry("b"))
+    index.on_delete("b")
+    assert index.similar(curry("c")) == [("a", 1.0)]
+    index.on_reload({"d": cake("d")})
+    assert len(index) == 1
+    assert index.similar(curry("c")) == []
+
+
+def test_signatures_are_the_same_in_every_process():
+    # hash() of a str changes from run to run; signatures must not
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {key: value for key, value in os.environ.items() if key != "PYTHONHASHSEED"}
+    code = "from dedup import features, signature; from tests.test_dedup import curry; print(signature(features(curry('a'))))"
+    runs = {
+        subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True, check=True).stdout
+        for _ in range(2)
+    }
+    assert runs == {f"{signature(features(curry('a')))}\n"}
+
+
+def test_missing_fields_only_fills_gaps():
+    recipe = curry("a", category="Curries", servings=4)
+    copy = curry("b", title="Easy Curry", category="Dinner", source="https://example.com/curry", servings=2, image="curry.jpg")
+    assert missing_fields(recipe, copy) == {"source": "https://example.com/curry", "image": "curry.jpg"}
+    assert missing_fields(copy, recipe) == {}
+    assert missing_fields(normalize({"title": "Curry"}), recipe) == {
+        "ingredients": list(recipe.ingredients), "instructions": INSTRUCTIONS, "category": "Curries", "servings": 4,
+    }
+
+
+def upload(client, records):
+    client.post("/upload_json", data={"json_file": (io.BytesIO(json.dumps(records).encode()), "recipes.json")})
+    with client.session_transaction() as session:
+        return [message for _, message in session.pop("_flashes", [])]
+
+
+def test_merge_mode_fills_in_the_recipe_a_duplicate_copies(app_module, client, load_recipes, monkeypatch):
+    monkeypatch.setattr(app_module, "DEDUP_MODE", "merge")
+    load_recipes({"a": curry("a").to_dict()})
+    copy = dict(curry("x").to_dict(), title="Easy Chickpea Curry", category="Curries", source="https://example.com/curry")
+    again = dict(copy, title="Chickpea Curry Again", servings=4)
+    messages = upload(client, [copy, cake("b").to_dict(), again])
+
+    assert messages == [
+        "Successfully uploaded 1 recipes.",
+        "Merged 'Easy Chickpea Curry' into 'Chickpea Curry'; added its category, source.",
+        "Merged 'Chickpea Curry Again' into 'Chickpea Curry'; added its servings.",
+    ]
+    stored = app_module.store.get("a")
+    assert (stored["title"], stored["category"], stored["servings"]) == ("Chickpea Curry", "Curries", 4)
+    assert app_module.recipe_cache.get("a").source == "https://example.com/curry"
+    assert sorted(recipe["title"] for recipe in app_module.store.all().values()) == ["Chickpea Curry", "Sponge Cake"]
+
+
+def test_merge_mode_within_one_upload(app_module, client, load_recipes, monkeypatch):
+    monkeypatch.setattr(app_module, "DEDUP_MODE", "merge")
+    load_recipes({})
+    first = curry("x").to_dict()
+    second = dict(first, title="Curry", category="Curries")
+    third = dict(first, title="Curry Again", servings=2)
+    assert upload(client, [first, second, third])[0] == "Successfully uploaded 1 recipes."
+    stored, = app_module.store.all().values()
+    assert (stored["title"], stored["category"], stored["servings"]) == ("Chickpea Curry", "Curries", 2)
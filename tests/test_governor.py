@@ -0,0 +1,198 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from governor import CircuitBreaker, CircuitOpen, Governor, TokenBucket, retry_after, transient
+
+
+def http_error(status, retry_after=None):
+    response = requests.Response()
+    response.status_code = status
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+class Flaky:
+    """Raises each of `errors` in turn, then returns "ok"."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture
+def waits(monkeypatch):
+    waits = []
+    monkeypatch.setattr(Governor, "_wait", lambda self, seconds: waits.append(seconds))
+    return waits
+
+
+def test_transient_errors():
+    assert transient(requests.ConnectionError())
+    assert transient(requests.Timeout())
+    assert transient(http_error(503))
+    assert transient(http_error(429))
+    assert not transient(http_error(404))
+    assert not transient(ValueError("bad recipe"))
+    # The way pyrebase wraps them, without the response on the outer error
+    assert transient(requests.HTTPError(http_error(502), "{}"))
+    assert retry_after(http_error(429, "3")) == 3.0
+    assert retry_after(http_error(429, "soon")) is None
+
+
+def test_transient_failures_are_retried(waits):
+    fn = Flaky(requests.ConnectionError(), http_error(503))
+    assert Governor("test", retries=2, backoff=0.5).call("db", fn) == "ok"
+    assert fn.calls == 3
+    assert len(waits) == 2 and 0 <= waits[0] <= 0.5 and 0 <= waits[1] <= 1.0
+
+
+def test_retries_run_out(waits):
+    fn = Flaky(*[requests.Timeout()] * 5)
+    with pytest.raises(requests.Timeout):
+        Governor("test", retries=2).call("db", fn)
+    assert fn.calls == 3
+
+
+def test_other_errors_and_unsafe_calls_are_not_retried(waits):
+    fn = Flaky(http_error(404))
+    with pytest.raises(requests.HTTPError):
+        Governor("test").call("db", fn)
+    fn = Flaky(requests.ConnectionError())
+    with pytest.raises(requests.ConnectionError):
+        Governor("test").call("db", fn, retry=False)
+    assert fn.calls == 1
+    assert waits == []
+
+
+def test_retry_after_is_honoured_up_to_max_backoff(waits):
+    governor = Governor("test", backoff=0.01, max_backoff=5)
+    governor.call("db", Flaky(http_error(429, "2")))
+    governor.call("db", Flaky(http_error(429, "60")))
+    assert waits == [2.0, 5]
+
+
+def test_the_circuit_opens_then_lets_one_trial_through(waits):
+    governor = Governor("test", retries=0, failures=3, reset_after=0.05)
+    down = Flaky(*[requests.ConnectionError()] * 4)
+    for _ in range(3):
+        with pytest.raises(requests.ConnectionError):
+            governor.call("db", down)
+    with pytest.raises(CircuitOpen):
+        governor.call("db", down)
+    assert down.calls == 3
+    assert governor.call("other", lambda: "ok") == "ok"  # one breaker per target
+
+    time.sleep(0.06)
+    with pytest.raises(requests.ConnectionError):
+        governor.call("db", down)  # the trial call, which fails
+    with pytest.raises(CircuitOpen):
+        governor.call("db", down)
+
+    time.sleep(0.06)
+    assert governor.call("db", down) == "ok"
+    assert not governor.breaker("db").open
+
+
+def test_an_answer_resets_the_failure_count(waits):
+    governor = Governor("test", retries=0, failures=2)
+    with pytest.raises(requests.ConnectionError):
+        governor.call("db", Flaky(requests.ConnectionError()))
+    with pytest.raises(requests.HTTPError):
+        governor.call("db", Flaky(http_error(404)))
+    with pytest.raises(requests.ConnectionError):
+        governor.call("db", Flaky(requests.ConnectionError()))
+    assert not governor.breaker("db").open
+
+
+def test_only_one_trial_call_at_a_time():
+    breaker = CircuitBreaker(failures=1, reset_after=0)
+    assert breaker.failed()
+    breaker.check("db")
+    with pytest.raises(CircuitOpen):
+        breaker.check("db")
+
+
+def test_token_bucket_spaces_out_calls_after_a_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits[:2] == [0, 0]
+    assert waits[2] == pytest.approx(0.1, abs=0.02)
+    assert waits[3] == pytest.approx(0.2, abs=0.02)
+
+
+def test_rate_limit_can_be_skipped(waits):
+    governor = Governor("test", rate=1, burst=1)
+    for _ in range(3):
+        governor.call("site", lambda: "ok", limit=False)
+    assert waits == []
+    governor.call("site", lambda: "ok")
+    governor.call("site", lambda: "ok")
+    assert waits[0] == 0 and waits[1] > 0.9  # the second waits for a token
+
+
+def test_overlapping_calls_with_one_key_share_a_call():
+    governor = Governor("test")
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"r1": "Apple Pie"}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(governor.call("db", slow, key="all")))
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(governor.call("db", slow, key="all")))
+    follower.start()
+    time.sleep(0.05)  # waiting on the leader's call
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert calls == [1]
+    assert results == [{"r1": "Apple Pie"}] * 2 and results[0] is results[1]
+
+    # Once it is done, the next call is a call of its own
+    assert governor.call("db", slow, key="all") == {"r1": "Apple Pie"}
+    assert calls == [1, 1]
+
+
+def test_a_shared_call_shares_its_error(waits):
+    governor = Governor("test", retries=0)
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise http_error(404)
+
+    errors = []
+
+    def call():
+        try:
+            governor.call("db", failing, key="r1")
+        except requests.HTTPError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    started.wait(5)
+    threads.append(threading.Thread(target=call))
+    threads[1].start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 2 and errors[0] is errors[1]
@@ -0,0 +1,118 @@
+import io
+import json
+
+import pytest
+
+from ingest import BulkIngest, iter_records, validate_recipe
+
+RECIPES = [
+    {"title": "Café Au Lait", "ingredients": ["1 cup milk", "1 cup coffee"], "instructions": "Mix."},
+    {"title": "Tea", "ingredients": ["1 tea bag"], "instructions": "Steep.\n\"Don't\" stew it."},
+    {"title": "Toast", "ingredients": [], "instructions": "Toast.", "servings": 1.5, "rating": None},
+]
+
+
+class CountingStream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def records(text, read_size=64 * 1024):
+    return list(iter_records(io.BytesIO(text.encode("utf-8")), read_size))
+
+
+@pytest.mark.parametrize("read_size", [1, 3, 7, 64 * 1024])
+def test_json_array_whatever_the_read_size(read_size):
+    text = "\ufeff \n" + json.dumps(RECIPES, ensure_ascii=False, indent=2)
+    assert records(text, read_size) == RECIPES
+    assert records("[]", read_size) == []
+
+
+@pytest.mark.parametrize("read_size", [1, 5, 64 * 1024])
+def test_ndjson_whatever_the_read_size(read_size):
+    text = "\n".join(json.dumps(r) for r in RECIPES) + "\n\n"
+    assert records(text, read_size) == RECIPES
+
+
+def test_bad_ndjson_lines_are_reported_and_skipped():
+    text = json.dumps(RECIPES[0]) + "\n{oops\n" + json.dumps(RECIPES[1])
+    first, bad, second = records(text)
+    assert (first, second) == (RECIPES[0], RECIPES[1])
+    with pytest.raises(ValueError, match="line 2 is not valid JSON"):
+        validate_recipe(bad)
+
+
+@pytest.mark.parametrize("text", ['"recipes"', '{\n  "title": "Tea"\n}', "   "])
+def test_other_files_are_not_recipe_lists(text):
+    with pytest.raises(ValueError, match="not a list of recipes"):
+        records(text)
+
+
+@pytest.mark.parametrize("text", ['[{"title": "Tea"} {"title": "Toast"}]', '[{"title": "Tea"}', '[{"title": "Te'])
+def test_broken_arrays(text):
+    with pytest.raises(json.JSONDecodeError):
+        records(text, read_size=4)
+
+
+def test_a_malformed_element_fails_without_reading_the_rest():
+    rest = ", ".join([json.dumps(RECIPES[0])] * 10000)
+    stream = CountingStream(f'[{{"title": "Tea"}}, {{"title": nope}}, {rest}]'.encode("utf-8"))
+    parsed = iter_records(stream, read_size=64)
+    assert next(parsed) == {"title": "Tea"}
+    with pytest.raises(json.JSONDecodeError, match="Expecting value"):
+        next(parsed)
+    assert stream.reads < 5
+
+
+def test_validate_recipe():
+    assert validate_recipe(RECIPES[0]) is RECIPES[0]
+    assert validate_recipe({"instructions": "Mix."})
+    for record, message in [
+        ([1, 2], "not a JSON object"),
+        ({"title": 5}, "'title' must be a string"),
+        ({"title": "Tea", "ingredients": "tea"}, "'ingredients' must be a list of strings"),
+        ({"title": "Tea", "ingredients": [1]}, "'ingredients' must be a list of strings"),
+        ({"category": "Drinks"}, "no title, ingredients or instructions"),
+    ]:
+        with pytest.raises(ValueError, match=message):
+            validate_recipe(record)
+
+
+class KeyStore:
+    def __init__(self):
+        self.keys = 0
+
+    def generate_key(self):
+        self.keys += 1
+        return f"k{self.keys}"
+
+
+def test_bulk_ingest_saves_in_chunks():
+    saved, progress = [], []
+
+    def save(chunk):
+        saved.append(chunk)
+        return len(chunk) - 1  # leaves one out, as a duplicate
+
+    records = RECIPES + [{"title": 1}] + RECIPES
+    ingest = BulkIngest(KeyStore(), save, chunk_size=4, progress=lambda done, total: progress.append(done)).run(records)
+    assert [list(chunk) for chunk in saved] == [["k1", "k2", "k3", "k4"], ["k5", "k6"]]
+    assert saved[0]["k4"] == RECIPES[0]
+    assert (ingest.seen, ingest.added) == (7, 4)
+    assert ingest.errors == ["Record 4: 'title' must be a string"]
+    assert progress == [5, 7]
+
+
+def test_bulk_ingest_counts_stay_after_a_failure():
+    def save(chunk):
+        raise RuntimeError("store is down")
+
+    ingest = BulkIngest(KeyStore(), save, chunk_size=2)
+    with pytest.raises(RuntimeError):
+        ingest.run(RECIPES)
+    assert (ingest.seen, ingest.added) == (2, 0)
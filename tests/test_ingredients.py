@@ -0,0 +1,60 @@
+import pytest
+
+from ingredients import format_quantity, normalize_name, parse_ingredient, shopping_list
+from recipe import normalize
+
+
+@pytest.mark.parametrize("text, quantity, unit, name", [
+    ("1 1/2 cups all-purpose flour, sifted", 1.5, "cup", "all-purpose flour"),
+    ("2 T sugar", 2.0, "tbsp", "sugar"),
+    ("1 t salt", 1.0, "tsp", "salt"),
+    ("½ tsp vanilla", 0.5, "tsp", "vanilla"),
+    ("2-3 cloves garlic", 3.0, "clove", "garlic"),
+    ("1 (14 oz) can coconut milk", 1.0, "can", "coconut milk"),
+    ("3 large eggs", 3.0, None, "egg"),
+    ("200 g butter", 200.0, "g", "butter"),
+    ("salt to taste", None, None, "salt"),
+])
+def test_parse_ingredient(text, quantity, unit, name):
+    ingredient = parse_ingredient(text)
+    assert (ingredient.text, ingredient.quantity, ingredient.unit, ingredient.name) == (text, quantity, unit, name)
+
+
+def test_parse_keeps_both_ends_of_a_range():
+    assert (parse_ingredient("2-3 cloves garlic").low, parse_ingredient("2-3 cloves garlic").quantity) == (2.0, 3.0)
+    assert parse_ingredient("1/2 to 1 cup milk").low == 0.5
+    assert parse_ingredient("3 eggs").low is None
+
+
+def test_parse_keeps_the_rest_of_the_line():
+    assert parse_ingredient("1 1/2 cups all-purpose flour, sifted").tail == " all-purpose flour, sifted"
+    assert parse_ingredient("1 (14 oz) can coconut milk").tail == " (14 oz) coconut milk"
+    assert parse_ingredient("salt to taste").tail == " salt to taste"
+
+
+def test_normalize_name():
+    assert normalize_name("Fresh Tomatoes (ripe), diced") == "tomato"
+    assert normalize_name("chicken breasts") == "chicken breast"
+    assert normalize_name("to taste") == ""
+
+
+@pytest.mark.parametrize("quantity, text", [(1.5, "1 1/2"), (0.333, "1/3"), (2.0, "2"), (0.25, "1/4"), (2.7, "2.7"), (None, "")])
+def test_format_quantity(quantity, text):
+    assert format_quantity(quantity) == text
+
+
+def test_format_quantity_parses_back():
+    for quantity in (0.5, 0.75, 1.25, 2.5, 3.0):
+        assert parse_ingredient(f"{format_quantity(quantity)} cups milk").quantity == quantity
+
+
+def test_shopping_list_adds_up_lines_with_the_same_name_and_unit():
+    pancakes = normalize({"title": "Pancakes", "ingredients": ["1 cup flour", "2 eggs", "salt to taste"]}, "a")
+    bread = normalize({"title": "Bread", "ingredients": ["2 cups flour", "1 tsp salt"]}, "b")
+    items = {(item["name"], item["unit"]): item for item in shopping_list([pancakes, bread])}
+
+    assert items[("flour", "cup")]["quantity"] == 3.0
+    assert items[("flour", "cup")]["amount"] == "3 cup"
+    assert items[("flour", "cup")]["recipes"] == ["Pancakes", "Bread"]
+    assert items[("salt", None)]["quantity"] is None
+    assert items[("salt", "tsp")]["quantity"] == 1.0
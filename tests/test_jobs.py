@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from jobs import Job, JobQueue
+
+
+def wait_for(job_queue, job_id, status, message=None, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = job_queue.get(job_id)
+        if job.status == status and message in (None, job.message):
+            return job
+        assert time.monotonic() < deadline, "timed out waiting for the job"
+        time.sleep(0.01)
+
+
+def export(job, job_queue, text):
+    job.set_progress(1, 2, "Writing")
+    path = os.path.join(job_queue.job_dir(job), "out.txt")
+    with open(path, "w") as f:
+        f.write(text)
+    job.result_path = path
+    job.download_name = "out.txt"
+    job.set_progress(2)
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    return JobQueue(max_workers=1, result_dir=str(tmp_path))
+
+
+def test_a_job_runs_and_reports_progress(job_queue):
+    job = job_queue.submit("export", export, job_queue, "hello")
+    job = wait_for(job_queue, job.id, "done")
+    assert job.to_dict() == {
+        "id": job.id, "kind": "export", "status": "done", "done": 2, "total": 2,
+        "message": "Writing", "errors": [], "download": True,
+    }
+    with open(job.result_path) as f:
+        assert f.read() == "hello"
+
+
+def test_a_failed_job_keeps_its_error(job_queue):
+    def fail(job):
+        raise ValueError("no recipes")
+    job = wait_for(job_queue, job_queue.submit("export", fail).id, "failed")
+    assert job.errors == ["no recipes"]
+
+
+def test_other_processes_see_the_job(job_queue, tmp_path):
+    released = threading.Event()
+
+    def slow(job):
+        job.set_progress(0, 3, "Starting")
+        released.wait(5)
+        export(job, job_queue, "hi")
+
+    job = job_queue.submit("export", slow)
+    elsewhere = JobQueue(result_dir=str(tmp_path))  # another worker, or after a restart
+    assert wait_for(elsewhere, job.id, "running", message="Starting").total == 3
+
+    released.set()
+    wait_for(job_queue, job.id, "done")
+    seen = elsewhere.get(job.id)
+    assert seen is not job_queue.get(job.id)
+    assert seen.to_dict() == job_queue.get(job.id).to_dict()
+    assert (seen.result_path, seen.download_name) == (job.result_path, "out.txt")
+
+
+def test_a_job_left_unfinished_by_a_gone_process_has_failed(tmp_path):
+    job = Job("import", path=None)
+    os.makedirs(tmp_path / job.id)
+    job.path = str(tmp_path / job.id / "job.json")
+    job.status = "running"
+    job.save()
+
+    job_queue = JobQueue(result_dir=str(tmp_path))
+    assert job_queue.get(job.id).status == "running"  # still heard from recently
+
+    with open(job.path) as f:
+        state = json.load(f)
+    state["saved_at"] -= 4 * JobQueue.HEARTBEAT
+    with open(job.path, "w") as f:
+        json.dump(state, f)
+    seen = job_queue.get(job.id)
+    assert seen.status == "failed"
+    assert seen.errors == ["The job was interrupted by a restart."]
+
+
+def test_unknown_ids(job_queue):
+    assert job_queue.get("0" * 32) is None
+    assert job_queue.get("../etc") is None
+
+
+def test_finished_jobs_are_dropped_after_retention(job_queue, tmp_path):
+    job = wait_for(job_queue, job_queue.submit("export", export, job_queue, "old").id, "done")
+    job_queue.retention = 0
+    time.sleep(0.01)
+    wait_for(job_queue, job_queue.submit("export", export, job_queue, "new").id, "done")
+    assert job_queue.get(job.id) is None
+    assert not os.path.exists(tmp_path / job.id)
@@ -0,0 +1,303 @@
+import io
+import os
+import time
+
+import pytest
+from pypdf import PdfReader
+
+import pdf_export
+from fragment_cache import FragmentCache
+from pdf_export import (
+    CARD_INNER_HEIGHT, CARD_INNER_WIDTH, ExportEngine, build_card, fragment_key, plan_fragments, plan_segments,
+    render_export, render_fragments,
+)
+from pdf_themes import get_theme
+from recipe import normalize
+
+
+def make_recipes(count, instructions="Mix.\nBake."):
+    return [
+        normalize({
+            "title": f"Recipe {i:02d}",
+            "ingredients": [f"{i} cups flour", "1 egg"],
+            "instructions": instructions,
+            "category": "Baking" if i % 2 else "Soups",
+        }, f"r{i}")
+        for i in range(count)
+    ]
+
+
+def pages(data):
+    """The text of each page, whitespace aside."""
+    return [" ".join(page.extract_text().split()) for page in PdfReader(io.BytesIO(data)).pages]
+
+
+def one_document(recipes, format_type):
+    output = io.BytesIO()
+    render_export(recipes, format_type, output)
+    return pages(output.getvalue())
+
+
+def render(engine, recipes, format_type):
+    output, progress = io.BytesIO(), []
+    name = engine.render(recipes, format_type, output, progress=lambda done, total: progress.append((done, total)))
+    return name, pages(output.getvalue()), progress
+
+
+# ------------------ Sharding ------------------
+@pytest.fixture(scope="module")
+def pool_engine():
+    engine = ExportEngine(processes=2, min_parallel=5)
+    yield engine
+    if engine._pool is not None:
+        engine._pool.shutdown()
+
+
+@pytest.mark.parametrize("format_type, name", [
+    ("standard", "All_Recipes.pdf"),
+    ("category_sorted", "Category_Sorted_Recipes.pdf"),
+    ("cards", "Recipe_Cards.pdf"),
+])
+def test_sharded_export_matches_one_document(pool_engine, format_type, name):
+    recipes = make_recipes(12)
+    assert render(pool_engine, recipes, format_type)[:2] == (name, one_document(recipes, format_type))
+    assert pool_engine._pool is not None  # rendered by the worker processes
+
+
+def test_sharded_export_reports_progress(pool_engine):
+    _, _, progress = render(pool_engine, make_recipes(25), "category_sorted")
+    assert progress[0] == (0, 25) and progress[-1] == (25, 25)
+    assert [done for done, _ in progress] == sorted(done for done, _ in progress)
+
+
+def test_small_exports_are_one_document():
+    engine = ExportEngine(processes=2, min_parallel=50)
+    recipes = make_recipes(3)
+    assert render(engine, recipes, "standard") == ("All_Recipes.pdf", one_document(recipes, "standard"), [(3, 3)])
+    assert engine._pool is None
+
+
+def test_unknown_format(pool_engine):
+    with pytest.raises(ValueError, match="Unknown export format"):
+        render(pool_engine, make_recipes(12), "poster")
+
+
+# ------------------ Fragment cache ------------------
+@pytest.fixture
+def rendered(monkeypatch):
+    """Kinds of the fragments laid out, in the order they were."""
+    kinds = []
+    render_fragments = pdf_export.render_fragments
+
+    def counting(jobs, *args):
+        kinds.extend(fragment[0] for fragment, _ in jobs)
+        return render_fragments(jobs, *args)
+    monkeypatch.setattr(pdf_export, "render_fragments", counting)
+    return kinds
+
+
+@pytest.fixture
+def cached_engine(tmp_path):
+    return ExportEngine(processes=1, cache=FragmentCache(str(tmp_path / "fragments"), 10 ** 9))
+
+
+@pytest.mark.parametrize("format_type", ["standard", "category_sorted", "cards"])
+def test_cached_export_matches_one_document(cached_engine, format_type):
+    recipes = make_recipes(12)
+    assert render(cached_engine, recipes, format_type)[1] == one_document(recipes, format_type)
+    assert render(cached_engine, recipes, format_type)[1] == one_document(recipes, format_type)
+
+
+def test_only_changed_recipes_are_laid_out_again(cached_engine, rendered):
+    recipes = make_recipes(12)
+    render(cached_engine, recipes, "category_sorted")
+    assert sorted(rendered) == ["recipe"] * 12 + ["title"] * 2
+
+    rendered.clear()
+    recipes[3] = recipes[3].replace(instructions="Mix well.")
+    _, result, progress = render(cached_engine, recipes, "category_sorted")
+    assert rendered == ["recipe"]
+    assert progress[0] == (11, 12)  # the rest came from the cache
+    assert result == one_document(recipes, "category_sorted")
+
+    # Same recipes, other layout: "standard" shares the recipe pages
+    rendered.clear()
+    render(cached_engine, recipes, "standard")
+    assert rendered == []
+
+
+def test_a_theme_has_fragments_of_its_own(cached_engine, rendered):
+    recipes = make_recipes(3)
+    cached_engine.render(recipes, "standard", io.BytesIO(), theme="classic")
+    cached_engine.render(recipes, "standard", io.BytesIO(), theme="modern")
+    cached_engine.render(recipes, "standard", io.BytesIO(), theme="classic")
+    assert rendered == ["recipe"] * 6
+
+
+def fill(cache, *keys):
+    for i, key in enumerate(keys):
+        with open(cache.path(key), "wb") as f:
+            f.write(b"x" * 100)
+        os.utime(cache.path(key), (i, i))  # oldest first
+    cache.added(keys)
+
+
+def test_least_recently_used_fragments_are_evicted(tmp_path):
+    cache = FragmentCache(str(tmp_path), 250)
+    fill(cache, "a", "b", "c", "d")
+    assert cache.lookup("a") is not None  # now the most recent
+    cache.evict()
+    assert [key for key in "abcd" if cache.lookup(key)] == ["a", "d"]
+    assert cache.lookup("missing") is None
+
+
+def test_pinned_fragments_are_kept(tmp_path):
+    cache = FragmentCache(str(tmp_path), 50)
+    fill(cache, "a", "b", "c")
+    cache.pin(["a", "b"])
+    cache.pin(["a"])  # two exports use it
+    cache.evict()
+    assert sorted(os.listdir(tmp_path)) == ["a.pdf", "b.pdf"]
+    cache.unpin(["a", "b"])
+    cache.evict()
+    assert os.listdir(tmp_path) == ["a.pdf"]
+    cache.unpin(["a"])
+    cache.evict()
+    assert os.listdir(tmp_path) == []
+
+
+def test_use_order_survives_a_restart(tmp_path):
+    fill(FragmentCache(str(tmp_path), 10 ** 9), "a", "b", "c")
+    os.utime(tmp_path / "a.pdf", (time.time(), time.time()))  # used since
+    cache = FragmentCache(str(tmp_path), 250)
+    cache.evict()
+    assert sorted(os.listdir(tmp_path)) == ["a.pdf", "c.pdf"]
+
+
+# ------------------ Segments ------------------
+def segments_of(recipes, format_type="category_sorted", size=4):
+    fragments = plan_fragments(recipes, format_type)
+    keys = [fragment_key(fragment, "theme") for fragment in fragments]
+    return [[fragment[1].id if fragment[0] != "title" else fragment[1] for fragment in fragments[start:end]]
+            for start, end in plan_segments(fragments, keys, size)]
+
+
+def test_segments_cover_the_export_and_break_at_categories():
+    recipes = make_recipes(40)
+    segments = segments_of(recipes)
+    flat = [item for segment in segments for item in segment]
+    assert flat == [f[1].id if f[0] != "title" else f[1] for f in plan_fragments(recipes, "category_sorted")]
+    assert [segment[0] for segment in segments if segment[0] in ("Baking", "Soups")] == ["Baking", "Soups"]
+    assert all(item not in ("Baking", "Soups") for segment in segments for item in segment[1:])
+    assert 5 <= len(segments) <= 20  # about 4 fragments each
+
+
+def test_an_added_recipe_only_changes_its_own_segment():
+    recipes = make_recipes(40)
+    before = segments_of(recipes, "standard")
+    added = normalize({"title": "Recipe 20a", "ingredients": ["1 pear"], "instructions": "Eat.", "category": "Baking"}, "new")
+    after = segments_of(recipes + [added], "standard")
+    changed = [segment for segment in after if segment not in before]
+    assert len(changed) == 1 and "new" in changed[0]
+    assert len(after) - len(before) in (0, 1)  # the new key may cut its segment in two
+
+
+@pytest.fixture
+def segments_built(monkeypatch):
+    paths = []
+    write_segment = pdf_export.write_segment
+
+    def counting(fragment_paths, path):
+        paths.append(path)
+        write_segment(fragment_paths, path)
+    monkeypatch.setattr(pdf_export, "write_segment", counting)
+    return paths
+
+
+def test_an_edit_rebuilds_one_segment(tmp_path, segments_built):
+    engine = ExportEngine(processes=1, cache=FragmentCache(str(tmp_path), 10 ** 9), segment_size=4)
+    recipes = make_recipes(40)
+    render(engine, recipes, "standard")
+    assert len(segments_built) > 3
+
+    segments_built.clear()
+    recipes[17] = recipes[17].replace(title="Recipe 17 (new)")
+    assert render(engine, recipes, "standard")[1] == one_document(recipes, "standard")
+    assert len(segments_built) == 1
+
+
+def test_an_export_that_died_carries_on_where_it_stopped(tmp_path, monkeypatch, rendered):
+    engine = ExportEngine(processes=1, cache=FragmentCache(str(tmp_path), 10 ** 9), segment_size=4)
+    recipes = make_recipes(40)
+    render_fragments = pdf_export.render_fragments
+    batches = []
+
+    def dies_on_the_third_batch(jobs, *args):
+        batches.append(len(jobs))
+        if len(batches) == 3:
+            raise MemoryError("worker died")
+        return render_fragments(jobs, *args)
+    monkeypatch.setattr(pdf_export, "render_fragments", dies_on_the_third_batch)
+    with pytest.raises(MemoryError):
+        render(engine, recipes, "standard")
+    assert len(rendered) == 20
+
+    monkeypatch.setattr(pdf_export, "render_fragments", render_fragments)
+    rendered.clear()
+    _, result, progress = render(engine, recipes, "standard")
+    assert len(rendered) == 20  # only what the first run didn't finish
+    assert progress[0] == (20, 40)
+    assert result == one_document(recipes, "standard")
+
+
+# ------------------ Cards ------------------
+SENTENCE = "Stir the {} into the pan and cook over a low heat until it has softened, about five minutes."
+LONG_SENTENCE = " ".join(f"then add the {i}th spice, stirring," for i in range(300)) + " and serve."
+
+CARD_RECIPES = {
+    "short": {"title": "Toast", "ingredients": ["1 slice bread"], "instructions": "Toast it."},
+    "long steps": {"title": "Stew", "ingredients": ["1 onion"], "instructions": "\n".join(
+        " ".join(SENTENCE.format(f"{step}-{n}") for n in range(4)) for step in range(30))},
+    "many ingredients": {"title": "Paella", "ingredients": [f"{i} g ingredient number {i}" for i in range(120)],
+                         "instructions": "Cook.", "source": "https://example.com/paella"},
+    "one huge sentence": {"title": "Curry", "ingredients": ["1 spice"], "instructions": LONG_SENTENCE},
+}
+
+
+def card_pages(recipe, tmp_path):
+    path = str(tmp_path / "card.pdf")
+    render_fragments([(("card", recipe), path)])
+    return [page.extract_text() for page in PdfReader(path).pages]
+
+
+@pytest.mark.parametrize("name", list(CARD_RECIPES))
+def test_cards_fit_and_keep_everything(name, tmp_path):
+    recipe = normalize(dict(CARD_RECIPES[name], category="Dinner"), name)
+    cards = build_card(recipe, get_theme().styles)
+    for card in cards:
+        assert sum(f.wrap(CARD_INNER_WIDTH, CARD_INNER_HEIGHT)[1] for f in card) <= CARD_INNER_HEIGHT + 1
+
+    # ReportLab never had to move anything to another card
+    texts = card_pages(recipe, tmp_path)
+    assert len(texts) == len(cards)
+    words = " ".join(texts).split()
+    for text in list(recipe.ingredients) + recipe.instructions.split("\n"):
+        for word in text.split():
+            assert word in words
+    if len(cards) > 1:
+        assert all(text.startswith(f"{recipe.title} (continued)") for text in texts[1:])
+
+
+def test_card_counts():
+    counts = {name: len(build_card(normalize(data, name), get_theme().styles)) for name, data in CARD_RECIPES.items()}
+    assert counts["short"] == 1
+    assert all(count > 1 for name, count in counts.items() if name != "short")
+
+
+def test_steps_carry_on_whole_sentences(tmp_path):
+    recipe = normalize(CARD_RECIPES["long steps"], "stew")
+    texts = card_pages(recipe, tmp_path)
+    for text in texts[1:]:
+        lines = text.split("\n")
+        assert lines[2] == "Instructions:"  # after the title and category
+        assert lines[3].startswith("Stir the ")
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from recipe_cache import RecipeCache
+
+
+def recipe(title):
+    return {"title": title, "ingredients": ["1 egg"], "instructions": "Cook."}
+
+
+class Store:
+    """A dict of recipes that counts how often the cache reads it."""
+
+    def __init__(self, count=3):
+        self.recipes = {f"r{i}": recipe(f"Recipe {i}") for i in range(count)}
+        self.full_loads = 0
+        self.fetched = []
+
+    def all(self):
+        self.full_loads += 1
+        return dict(self.recipes)
+
+    def get(self, rid):
+        self.fetched.append(rid)
+        return self.recipes.get(rid)
+
+
+class Listener:
+    def __init__(self):
+        self.events = []
+
+    def on_put(self, rid, data):
+        self.events.append(("put", rid))
+
+    def on_delete(self, rid):
+        self.events.append(("delete", rid))
+
+    def on_reload(self, recipes):
+        self.events.append(("reload", len(recipes)))
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def store():
+    return Store()
+
+
+@pytest.fixture
+def listener():
+    return Listener()
+
+
+def test_reads_are_served_from_memory(store, listener):
+    cache = RecipeCache(store.all, store.get, listeners=[listener])
+    assert set(cache.all()) == {"r0", "r1", "r2"}
+    assert cache.get("r1").title == "Recipe 1"
+    assert cache.get_many(["r2", "missing", "r0"]) == ({"r2": cache.get("r2"), "r0": cache.get("r0")}, ["missing"])
+    cache.all()
+    assert store.full_loads == 1
+    assert store.fetched == ["missing"]
+    assert listener.events == [("reload", 3)]
+
+
+def test_writes_update_the_cache_and_the_version(store, listener):
+    cache = RecipeCache(store.all, store.get, listeners=[listener])
+    cache.sync()
+    version = cache.version
+    cache.put("r3", recipe("New"))
+    cache.delete("r0")
+    assert sorted(cache.all()) == ["r1", "r2", "r3"]
+    assert cache.version == version + 2
+    assert listener.events[1:] == [("put", "r3"), ("delete", "r0")]
+
+    # A reload that brings back the same recipes is not a change
+    version = cache.version
+    cache.reload({rid: data.to_dict() for rid, data in cache.all().items()})
+    assert cache.version == version
+
+
+def test_stale_entries_are_served_while_they_refresh(store):
+    cache = RecipeCache(store.all, store.get, ttl=0)
+    assert cache.get("r1").title == "Recipe 1"
+    store.recipes["r1"] = recipe("Changed")
+    assert cache.get("r1").title == "Recipe 1"  # the stale copy, refreshed behind it
+    wait_for(lambda: cache.peek("r1").title == "Changed")
+
+
+def test_records_that_are_not_recipes_are_left_out(store):
+    store.recipes["bad"] = "not a recipe"
+    cache = RecipeCache(store.all, store.get)
+    assert "bad" not in cache.all()
+    assert cache.get("bad") is None
+
+
+def test_a_collection_bigger_than_the_cache(listener):
+    store = Store(count=5)
+    cache = RecipeCache(store.all, store.get, max_size=3, listeners=[listener])
+    assert len(cache.all()) == 5
+    # Read from the store each time, but the listeners aren't told again
+    # until a reload is due
+    assert len(cache.all()) == 5
+    assert store.full_loads == 2
+    assert listener.events == [("reload", 5)]
+
+    # What is kept is a bounded snapshot of the last load
+    cached = [rid for rid in store.recipes if cache.peek(rid) is not None]
+    assert len(cached) == 3
+    store.recipes[cached[0]] = recipe("Changed")
+    cache.reload(store.all())
+    assert cache.peek(cached[0]).title == "Changed"
+    assert store.fetched == []
+
+
+def test_disabled_cache_tells_listeners_nothing(store, listener):
+    cache = RecipeCache(store.all, store.get, max_size=0, listeners=[listener])
+    assert not cache.enabled
+    cache.all()
+    cache.put("r3", recipe("New"))
+    assert listener.events == []
@@ -0,0 +1,196 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from recipe_cache import RecipeCache
+from recipe_feed import EventStream, LocalEventSource, RecipeFeed
+from search_index import TitleOrder
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the feed"
+        time.sleep(0.01)
+
+
+def not_fetched(*args):
+    raise AssertionError("the feed should have supplied this")
+
+
+@pytest.fixture
+def source():
+    return LocalEventSource({
+        "r1": {"title": "Apple Pie", "ingredients": ["6 apples"], "instructions": "Bake.", "category": "Baking"},
+        "r2": {"title": "Chicken Soup", "ingredients": ["1 chicken"], "instructions": "Simmer.", "category": "Soups"},
+    })
+
+
+@pytest.fixture
+def order():
+    return TitleOrder()
+
+
+@pytest.fixture
+def cache(source, order):
+    cache = RecipeCache(not_fetched, not_fetched, listeners=[order])
+    feed = RecipeFeed(cache, source).start()
+    wait_for(lambda: feed.connected)
+    yield cache
+    feed.stop()
+
+
+def titles(cache):
+    return sorted(recipe.title for recipe in cache.all().values())
+
+
+def test_first_snapshot_fills_the_cache(cache, order):
+    assert cache.live
+    assert titles(cache) == ["Apple Pie", "Chicken Soup"]
+    assert order.page(10)[0] == ["r1", "r2"]
+
+
+def test_put_adds_replaces_and_deletes(source, cache, order):
+    source.emit("put", "/r3", {"title": "Banana Bread", "ingredients": ["3 bananas"], "instructions": "Bake."})
+    wait_for(lambda: "r3" in cache.all())
+    assert order.page(10)[0] == ["r1", "r3", "r2"]
+
+    source.emit("put", "/r1", {"title": "Pear Tart", "ingredients": ["4 pears"], "instructions": "Bake."})
+    wait_for(lambda: cache.get("r1").title == "Pear Tart")
+    assert cache.get("r1").ingredients == ("4 pears",)
+
+    version = cache.version
+    source.emit("put", "/r2", None)
+    wait_for(lambda: cache.version != version)
+    assert titles(cache) == ["Banana Bread", "Pear Tart"]
+    assert order.page(10)[0] == ["r3", "r1"]
+
+
+def test_put_of_one_field(source, cache):
+    source.emit("put", "/r2/category", "Dinner")
+    wait_for(lambda: cache.get("r2").category == "Dinner")
+    assert cache.get("r2").title == "Chicken Soup"
+
+
+def test_patch_changes_several_recipes(source, cache):
+    version = cache.version
+    source.emit("patch", "/", {
+        "r1/title": "Apple Crumble",
+        "r2": None,
+        "r4": {"title": "Carrot Cake", "ingredients": ["3 carrots"], "instructions": "Bake."},
+    })
+    wait_for(lambda: cache.version >= version + 3)
+    assert titles(cache) == ["Apple Crumble", "Carrot Cake"]
+    assert cache.get("r1").ingredients == ("6 apples",)
+
+
+def test_keep_alive_changes_nothing(source, cache):
+    version = cache.version
+    source.emit("keep-alive", None, None)
+    source.emit("put", "/r1/category", "Pies")  # events are handled in order
+    wait_for(lambda: cache.get("r1").category == "Pies")
+    assert cache.version == version + 1
+    assert cache.live
+
+
+def test_reconnect_resyncs_the_whole_collection(source, cache, order):
+    # Changes made while the feed was away only arrive with the next snapshot
+    source.data = {
+        "r2": {"title": "Chicken Soup", "ingredients": ["1 chicken"], "instructions": "Simmer.", "category": "Soups"},
+        "r5": {"title": "Dal", "ingredients": ["1 cup lentils"], "instructions": "Simmer.", "category": "Soups"},
+    }
+    source.disconnect()
+    wait_for(lambda: "r5" in cache.all())
+    assert cache.live
+    assert titles(cache) == ["Chicken Soup", "Dal"]
+    assert order.page(10)[0] == ["r2", "r5"]
+
+
+def test_a_field_of_an_uncached_recipe_loads_the_whole_recipe(source, order):
+    stored = {"r9": {"title": "Dal", "ingredients": ["1 cup lentils"], "instructions": "Simmer.", "category": "Soups"}}
+    released = threading.Event()
+
+    def slow_fetch(rid):
+        released.wait(5)
+        return stored.get(rid)
+
+    cache = RecipeCache(not_fetched, slow_fetch, listeners=[order])
+    feed = RecipeFeed(cache, source).start()
+    try:
+        wait_for(lambda: feed.connected)
+        source.emit("put", "/r9/category", "Soups")
+        # The stream carries on while the recipe is fetched
+        source.emit("put", "/r1/category", "Pies")
+        wait_for(lambda: cache.peek("r1").category == "Pies")
+        assert cache.peek("r9") is None
+        released.set()
+        wait_for(lambda: cache.peek("r9") is not None)
+        assert cache.peek("r9").title == "Dal"
+    finally:
+        released.set()
+        feed.stop()
+
+
+# ------------------ EventStream ------------------
+EVENTS = [
+    'event: put\ndata: {"path": "/", "data": {"r1": {"title": "Caf\u00e9"}}}\n\n',
+    "event: keep-alive\ndata: null\n\n",
+    'event: patch\r\ndata: {"path": "/r1", "data": {"title": "B"}}\r\n\r\n',
+]
+
+
+class SSEHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/moved":
+            self.send_response(307)
+            self.send_header("Location", "/plain")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        chunked = self.path == "/chunked"
+        self.protocol_version = "HTTP/1.1" if chunked else "HTTP/1.0"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event in EVENTS:
+            raw = event.encode("utf-8")
+            if chunked:
+                # Splits the é across two chunks (an empty one would end the body)
+                for piece in filter(None, (raw[:30], raw[30:])):
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+            else:
+                self.wfile.write(raw)
+            self.wfile.flush()
+        time.sleep(5)  # then stays open, as Firebase does
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def sse_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SSEHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+@pytest.mark.parametrize("path", ["chunked", "plain", "moved"])
+def test_event_stream_reads_events_as_they_arrive(sse_server, path):
+    messages = []
+    stream = EventStream(f"{sse_server}/{path}", {}, messages.append)
+    try:
+        # The server keeps the connection open, so these can only come from
+        # reading each event as it arrives
+        wait_for(lambda: len(messages) == 3)
+    finally:
+        stream.close()
+    assert not stream.thread.is_alive()
+    assert [m["event"] for m in messages] == ["put", "keep-alive", "patch"]
+    assert messages[0]["data"] == {"r1": {"title": "Café"}}
+    assert messages[2] == {"event": "patch", "path": "/r1", "data": {"title": "B"}}
@@ -0,0 +1,68 @@
+import html
+import re
+
+from search_index import decode_cursor, encode_cursor
+
+RECIPES = {
+    "r1": {"title": "banana Bread", "ingredients": ["3 bananas"], "instructions": "Bake.", "category": "Baking"},
+    "r2": {"title": "Apple Pie", "ingredients": ["6 apples"], "instructions": "Bake.", "category": "Baking"},
+    "r3": {"title": "Chicken Soup", "ingredients": ["1 chicken", "2 carrots"], "instructions": "Simmer.", "category": "Soups"},
+    "r4": {"title": "Carrot Cake", "ingredients": ["3 carrots"], "instructions": "Bake.", "category": "Baking"},
+    "r5": {"title": "Dal", "ingredients": ["1 cup lentils"], "instructions": "Simmer.", "category": "Soups"},
+}
+
+
+def listed(response):
+    assert response.status_code == 200
+    rows = re.findall(r'name="selected_recipes" value="[^"]*"></td>\s*<td>([^<]*)</td>', response.get_data(as_text=True))
+    return [html.unescape(title) for title in rows]
+
+
+def next_link(response):
+    match = re.search(r'href="([^"]+)"[^>]*>Next', response.get_data(as_text=True))
+    return html.unescape(match.group(1)) if match else None
+
+
+def test_pages_follow_title_order(client, load_recipes):
+    load_recipes(RECIPES)
+    first = client.get("/recipes?page_size=2")
+    assert listed(first) == ["Apple Pie", "banana Bread"]
+    second = client.get(next_link(first))
+    assert listed(second) == ["Carrot Cake", "Chicken Soup"]
+    third = client.get(next_link(second))
+    assert listed(third) == ["Dal"]
+    assert next_link(third) is None
+
+
+def test_cursor_pages_match_numbered_pages(client, load_recipes):
+    load_recipes(RECIPES)
+    url = "/recipes?page_size=2&cursor=" + encode_cursor(("", ""))  # before the first title
+    pages = []
+    while url:
+        response = client.get(url)
+        pages.append(listed(response))
+        url = next_link(response)
+    assert pages == [["Apple Pie", "banana Bread"], ["Carrot Cake", "Chicken Soup"], ["Dal"]]
+
+
+def test_filtered_pages(client, load_recipes):
+    load_recipes(RECIPES)
+    assert listed(client.get("/recipes?search=has+carrot")) == ["Carrot Cake", "Chicken Soup"]
+    assert listed(client.get("/recipes?category=Soups")) == ["Chicken Soup", "Dal"]
+
+
+def test_cursor_for_a_recipe_that_left_the_title_order(client, load_recipes, app_module, monkeypatch):
+    # As if the page's last recipe was deleted between reading the page and
+    # making its links: the cursor comes from the row itself
+    load_recipes(RECIPES)
+    monkeypatch.setattr(app_module.title_order, "key", lambda rid: None)
+    response = client.get("/recipes?page_size=2&cursor=" + encode_cursor(("", "")))
+    cursor = re.search(r"cursor=([\w-]+)", next_link(response)).group(1)
+    assert decode_cursor(cursor) == ("banana bread", "r1")
+    monkeypatch.undo()
+    assert listed(client.get(next_link(response))) == ["Carrot Cake", "Chicken Soup"]
+
+
+def test_bad_cursor(client, load_recipes):
+    load_recipes(RECIPES)
+    assert client.get("/recipes?cursor=nonsense").status_code == 400
@@ -0,0 +1,90 @@
+import pytest
+
+RECIPES = {
+    "r1": {"title": "Apple Pie", "ingredients": ["6 apples"], "instructions": "Bake.", "category": "Baking"},
+    "r2": {"title": "Chicken Soup", "ingredients": ["1 chicken"], "instructions": "Simmer.", "category": "Soups"},
+}
+
+
+class CountingEngine:
+    """Stands in for ExportEngine: writes a small fake PDF and counts renders."""
+
+    def __init__(self):
+        self.renders = 0
+
+    def render(self, recipes_list, format_type, output, progress=None, theme=None):
+        self.renders += 1
+        output.write(f"%PDF {format_type} {self.renders} ".encode() + b"x" * 1000)
+        return "export.pdf"
+
+
+@pytest.fixture
+def engine(app_module, monkeypatch):
+    engine = CountingEngine()
+    monkeypatch.setattr(app_module.export_engine, "get", lambda: engine)
+    return engine
+
+
+def test_pages_answer_a_matching_etag_with_304(client, load_recipes):
+    load_recipes(RECIPES)
+    first = client.get("/recipes")
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "no-cache"
+    etag = first.headers["ETag"]
+
+    again = client.get("/recipes", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.get_data() == b""
+    assert client.get("/recipes", headers={"If-Modified-Since": first.headers["Last-Modified"]}).status_code == 304
+
+
+def test_an_edit_changes_the_etag(client, load_recipes):
+    load_recipes(RECIPES)
+    etag = client.get("/recipes").headers["ETag"]
+    client.post("/edit_recipe/r1", data={
+        "title": "Pear Pie", "ingredients": "4 pears", "instructions": "Bake.", "category": "Baking", "source": "",
+    })
+    changed = client.get("/recipes", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert "Pear Pie" in changed.get_data(as_text=True)
+
+
+def test_a_recipe_page_only_depends_on_that_recipe(client, load_recipes, app_module):
+    load_recipes(RECIPES)
+    etag = client.get("/view_recipe/r1").headers["ETag"]
+    app_module.store.update("r2", {"title": "Dal"})
+    app_module.recipe_cache.put("r2", app_module.store.get("r2"))
+    assert client.get("/view_recipe/r1", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_cookbook_downloads_are_cached_and_revalidated(client, load_recipes, engine):
+    load_recipes(RECIPES)
+    first = client.get("/bulk_export_all?format=standard")
+    assert first.status_code == 200
+    assert first.headers["ETag"]
+
+    again = client.get("/bulk_export_all?format=standard")
+    assert again.get_data() == first.get_data()
+    assert client.get("/bulk_export_all?format=standard", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+    assert engine.renders == 1
+
+    client.get("/bulk_export_all?format=cards")
+    assert engine.renders == 2
+
+
+def test_selected_exports_are_cached_without_an_etag(client, load_recipes, engine):
+    load_recipes(RECIPES)
+    first = client.post("/bulk_export_selected", data={"selected_recipes": ["r1", "r2"]})
+    assert first.status_code == 200
+    assert "ETag" not in first.headers
+    assert "Last-Modified" not in first.headers
+
+    # A POST is never answered with a 304, even with a matching ETag
+    again = client.post("/bulk_export_selected", data={"selected_recipes": ["r1", "r2"]},
+                        headers={"If-None-Match": '"anything"', "If-Modified-Since": "Thu, 01 Jan 2099 00:00:00 GMT"})
+    assert again.status_code == 200
+    assert again.get_data() == first.get_data()
+    assert engine.renders == 1
+
+    client.post("/bulk_export_selected", data={"selected_recipes": ["r1"]})
+    assert engine.renders == 2
@@ -0,0 +1,104 @@
+from ingredients import parse_ingredient
+from recipe import normalize
+from scaling import format_amount, recipe_servings, scale_recipes
+
+
+def make_recipe(rid="p1", **fields):
+    data = {
+        "title": "Pancakes",
+        "ingredients": ["1 1/2 cups all-purpose flour, sifted", "2 T sugar", "200 g butter", "salt to taste"],
+        "instructions": "Mix.",
+        "servings": 4,
+    }
+    data.update(fields)
+    return normalize(data, rid)
+
+
+def test_scale_to_servings():
+    scaled, = scale_recipes([make_recipe()], servings=8)
+    assert scaled.ingredients == (
+        "3 cups all-purpose flour, sifted", "4 tbsp sugar", "400 g butter", "salt to taste",
+    )
+    assert scaled.get("servings") == 8
+
+
+def test_scaling_there_and_back_gives_the_same_lines():
+    recipe = make_recipe()
+    doubled, = scale_recipes([recipe], servings=8)
+    back, = scale_recipes([doubled], servings=4)
+    assert back.ingredients[0] == recipe.ingredients[0]
+    assert back.ingredients[1] == "2 tbsp sugar"  # units are written the usual way
+    assert back.ingredients[2:] == recipe.ingredients[2:]
+    assert [i.quantity for i in back.parsed] == [i.quantity for i in recipe.parsed]
+
+
+def test_converting_there_and_back_gives_the_same_amounts():
+    recipe = make_recipe(ingredients=["1 cup milk", "2 lb chicken", "1 tsp salt"])
+    metric, = scale_recipes([recipe], units="metric")
+    assert metric.ingredients == ("237 ml milk", "907 g chicken", "4.93 ml salt")
+    us, = scale_recipes([metric], units="us")
+    assert [(i.quantity, i.unit) for i in us.parsed] == [(1.0, "cup"), (2.0, "lb"), (1.0, "tsp")]
+
+
+def test_both_ends_of_a_range_are_scaled():
+    recipe = make_recipe(ingredients=["2-3 cloves garlic", "1/2 to 1 cup milk"])
+    scaled, = scale_recipes([recipe], servings=6)
+    assert scaled.ingredients == ("3-4 1/2 cloves garlic", "3/4-1 1/2 cups milk")
+    assert [(i.low, i.quantity) for i in scaled.parsed] == [(3.0, 4.5), (0.75, 1.5)]
+    metric, = scale_recipes([recipe], units="metric")
+    assert metric.ingredients == ("2-3 cloves garlic", "118-237 ml milk")
+
+
+def test_us_amounts_round_to_kitchen_fractions():
+    recipe = make_recipe(ingredients=["80 ml cream", "0.6 ml vanilla", "300 g butter"])
+    us, = scale_recipes([recipe], units="us")
+    assert us.ingredients == ("1/3 cup cream", "1/8 tsp vanilla", "10 5/8 oz butter")
+
+
+def test_amounts_too_small_for_us_units_stay_metric():
+    recipe = make_recipe(ingredients=["1 g yeast", "0.2 ml almond extract"])
+    us, = scale_recipes([recipe], servings=6, units="us")
+    assert us.ingredients == ("1.5 g yeast", "0.3 ml almond extract")
+
+
+def test_scaled_lines_parse_to_what_scaling_says():
+    recipe = make_recipe(ingredients=make_recipe().ingredients + ("2-3 cloves garlic",))
+    for units in ("metric", "us"):
+        scaled, = scale_recipes([recipe], servings=6, units=units)
+        for text, ingredient in zip(scaled.ingredients, scaled.parsed):
+            reparsed = parse_ingredient(text)
+            assert ingredient.text == text
+            assert (reparsed.quantity, reparsed.low, reparsed.unit, reparsed.name, reparsed.tail) == (
+                ingredient.quantity, ingredient.low, ingredient.unit, ingredient.name, ingredient.tail,
+            )
+
+
+def test_unchanged_recipes_come_back_as_they_are():
+    no_servings = make_recipe("p2", servings=None, ingredients=["2 eggs"])
+    empty = make_recipe("p3", ingredients=[])
+    same = make_recipe("p4")
+    result = scale_recipes([no_servings, empty, same], servings=4)
+    assert [a is b for a, b in zip(result, [no_servings, empty, same])] == [True, True, True]
+
+
+def test_recipes_without_servings_are_only_converted():
+    recipe = make_recipe(servings=None, ingredients=["2 cups milk"])
+    scaled, = scale_recipes([recipe], servings=8, units="metric")
+    assert scaled.ingredients == ("473 ml milk",)
+    assert scaled.get("servings") is None
+
+
+def test_recipe_servings():
+    assert recipe_servings(normalize({"yields": "6 servings"})) == 6.0
+    assert recipe_servings(normalize({"servings": 2})) == 2.0
+    assert recipe_servings(normalize({"servings": "abc"})) is None
+    assert recipe_servings(normalize({"servings": 0})) is None
+
+
+def test_format_amount():
+    assert format_amount(12.0, "g") == "12 g"
+    assert format_amount(1.5, "cup") == "1 1/2 cups"
+    assert format_amount(2.0, "pinch") == "2 pinches"
+    assert format_amount(3.0, None) == "3"
+    assert format_amount(3.0, "clove", low=2.0) == "2-3 cloves"
+    assert format_amount(250.0, "ml", low=120.0) == "120-250 ml"
@@ -0,0 +1,143 @@
+import pytest
+
+import benchmark
+from recipe import normalize, normalize_all
+from search_index import RecipeIndex, TitleOrder, decode_cursor, encode_cursor, parse_query, tokenize
+
+
+def recipes(*titles):
+    return {f"r{i}": normalize({"title": title}, f"r{i}") for i, title in enumerate(titles, 1)}
+
+
+@pytest.fixture
+def order():
+    order = TitleOrder()
+    order.on_reload(recipes("banana Bread", "Apple Pie", "Chicken Soup", "Carrot Cake", "apple pie"))
+    return order
+
+
+def test_title_order_pages(order):
+    assert order.page(2) == (["r2", "r5"], True)
+    assert order.page(2, offset=2) == (["r1", "r4"], True)
+    assert order.page(2, offset=4) == (["r3"], False)
+
+
+def test_title_order_continues_after_a_cursor(order):
+    assert order.page(2, after=order.key("r5")) == (["r1", "r4"], True)
+    # A cursor for a recipe that has since gone still marks a place in the order
+    order.on_delete("r1")
+    assert order.page(2, after=("banana bread", "r1")) == (["r4", "r3"], False)
+
+
+def test_title_order_only_some_ids(order):
+    assert order.page(10, only={"r3", "r4", "missing"}) == (["r4", "r3"], False)
+    order.SORT_LIMIT = 0  # walk the order instead of sorting the matches
+    assert order.page(1, only={"r3", "r4"}) == (["r4"], True)
+    assert order.page(1, offset=1, only={"r3", "r4"}) == (["r3"], False)
+
+
+def test_title_order_follows_changes(order):
+    order.on_put("r3", normalize({"title": "Aubergine Soup"}, "r3"))
+    order.on_put("r6", normalize({"title": "Zucchini Fritters"}, "r6"))
+    assert order.page(10)[0] == ["r2", "r5", "r3", "r1", "r4", "r6"]
+    assert order.key("r3") == ("aubergine soup", "r3")
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(("apple pie", "r2"))) == ("apple pie", "r2")
+    with pytest.raises(ValueError):
+        decode_cursor("nonsense")
+
+
+# ------------------ RecipeIndex ------------------
+MEALS = {
+    "m1": {"title": "Chicken Soup", "ingredients": ["1 chicken", "2 carrots"], "category": "Soups"},
+    "m2": {"title": "Carrot Cake", "ingredients": ["3 carrots", "200 g flour"], "category": "Baking"},
+    "m3": {"title": "Lemon Chicken & Rice", "ingredients": ["2 chicken breasts", "1 lemon"], "category": "Dinner"},
+    "m4": {"title": "Chickpea Curry", "ingredients": ["2 cans chickpeas", "1 onion"], "category": "Dinner"},
+}
+
+
+@pytest.fixture
+def index():
+    index = RecipeIndex()
+    index.on_reload(normalize_all(MEALS))
+    return index
+
+
+def test_parse_query():
+    assert parse_query("Chicken soup") == [(("title", "ingredient", "category"), "chicken", False), (("title", "ingredient", "category"), "soup", True)]
+    assert parse_query("has chicken and lemon") == [(("ingredient",), "chicken", False), (("ingredient",), "lemon", True)]
+    assert parse_query("category:dinner ingredients:onion") == [(("category",), "dinner", False), (("ingredient",), "onion", True)]
+    assert parse_query("  ") == []
+
+
+@pytest.mark.parametrize("query, category, expected", [
+    ("", None, {"m1", "m2", "m3", "m4"}),
+    ("", "Dinner", {"m3", "m4"}),
+    ("chicken", None, {"m1", "m3"}),  # whole word
+    ("chick", None, {"m1", "m3", "m4"}),  # still being typed
+    ("chick soup", None, {"m1"}),  # a word cut short
+    ("carrot", None, {"m1", "m2"}),  # title of one, ingredient of the other
+    ("has carrot", None, {"m1", "m2"}),
+    ("has cake", None, set()),
+    ("title:carrot", None, {"m2"}),
+    ("category:dinner chick", None, {"m3", "m4"}),
+    ("chicken", "Dinner", {"m3"}),
+    ("lemon and rice", None, {"m3"}),
+    ("200", None, set()),  # quantities aren't indexed
+    ("lasagne", None, set()),
+])
+def test_search(index, query, category, expected):
+    assert index.search(query, category) == expected
+
+
+def test_index_follows_changes(index):
+    index.on_put("m1", normalize({"title": "Leek Soup", "ingredients": ["2 leeks"], "category": "Soups"}, "m1"))
+    assert index.search("chicken") == {"m3"}
+    assert index.search("leek") == {"m1"}
+    index.on_delete("m3")
+    assert index.search("chick") == {"m4"}
+    assert index.categories() == ["Baking", "Dinner", "Soups"]
+    index.on_reload(normalize_all({"m2": MEALS["m2"]}))
+    assert len(index) == 1
+    assert index.search("") == {"m2"}
+    assert index.categories() == ["Baking"]
+
+
+def naive_search(recipes, query, category=None):
+    """What search() should return, by looking at every recipe."""
+    fields_of = {
+        rid: {
+            "title": set(tokenize(r.title)),
+            "ingredient": {t for line in r.ingredients for t in tokenize(line) if not t.isdigit()},
+            "category": set(tokenize(r.category)),
+        }
+        for rid, r in recipes.items()
+    }
+    result = set()
+    for rid, recipe in recipes.items():
+        if category and recipe.category != category:
+            continue
+        for fields, term, prefix in parse_query(query):
+            prefix = prefix or not any(term in tokens[field] for tokens in fields_of.values() for field in fields)
+            tokens = [t for field in fields for t in fields_of[rid][field]]
+            if not any(t == term or (prefix and t.startswith(term)) for t in tokens):
+                break
+        else:
+            result.add(rid)
+    return result
+
+
+def test_search_matches_looking_at_every_recipe():
+    # Enough recipes for both ways of narrowing down: merging postings and
+    # checking each remaining recipe's tokens
+    recipes = normalize_all(benchmark.synthetic_recipes(1000, 7))
+    index = RecipeIndex()
+    index.on_reload(recipes)
+    some = list(recipes.values())[:8]
+    queries = ["", "chicken", "chick", "has garlic and lem", "category:dessert", "title:soup bean"]
+    queries += [f"{r.title.split()[0]} {r.ingredients[0].split()[-1][:3]}" for r in some]
+    for query in queries:
+        for category in (None, some[0].category):
+            assert index.search(query, category) == naive_search(recipes, query, category), (query, category)
@@ -0,0 +1,38 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs app.py the way `python app.py` does, but instead of serving, makes the
+# export pool start a (spawned) worker and waits for it
+RUN_APP = """
+import os, runpy, sys, flask
+
+def run(app, **kwargs):
+    export_engine = sys.modules[app.import_name].export_engine
+    print("worker", export_engine.get().pool.submit(os.getpid).result() != os.getpid(), flush=True)
+
+flask.Flask.run = run
+runpy.run_path("app.py", run_name="__main__")
+"""
+
+
+def test_spawned_export_workers_do_not_run_app_startup(tmp_path):
+    env = dict(
+        os.environ,
+        RECIPE_STORE="sqlite",
+        RECIPE_DB=str(tmp_path / "recipes.db"),
+        SCRAPE_CACHE_DB=str(tmp_path / "scrape_cache.db"),
+        RESPONSE_CACHE_DIR=str(tmp_path / "responses"),
+        EXPORT_CACHE_DIR=str(tmp_path / "fragments"),
+        RECIPE_FEED="0",
+        WARMUP="0",
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", RUN_APP], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    lines = result.stdout.splitlines()
+    assert "worker True" in lines
+    assert sum(line.startswith("Startup:") for line in lines) == 1
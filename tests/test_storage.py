@@ -0,0 +1,92 @@
+import pytest
+
+from benchmark import LocalFirebase
+from storage import FirebaseStore, SQLiteStore
+
+RECIPES = {
+    "r1": {"title": "banana Bread", "ingredients": ["3 bananas", "2 cups flour"], "instructions": "Bake.", "category": "Baking"},
+    "r2": {"title": "Apple Pie", "ingredients": ["6 apples", "1 pie crust"], "instructions": "Bake.", "category": "Baking"},
+    "r3": {"title": "Chicken Soup", "ingredients": ["1 chicken", "2 carrots"], "instructions": "Simmer.", "category": "Soups"},
+    "r4": {"title": "Carrot Cake", "ingredients": ["3 carrots", "2 cups flour"], "instructions": "Bake.", "category": "Baking"},
+}
+
+
+# Both stores must page and filter the same way. A small page_batch makes
+# Firebase queries read recipe_titles over several batches.
+@pytest.fixture(params=["sqlite", "firebase"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SQLiteStore(str(tmp_path / "recipes.db"))
+    else:
+        store = FirebaseStore(LocalFirebase, page_batch=2)
+    store.put_many(RECIPES)
+    return store
+
+
+def titles(rows):
+    return [data["title"] for _, data in rows]
+
+
+def test_get_and_get_many(store):
+    assert store.get("r2")["title"] == "Apple Pie"
+    assert store.get("missing") is None
+    assert set(store.get_many(["r1", "r3", "missing"])) == {"r1", "r3"}
+    assert set(store.all()) == {"r1", "r2", "r3", "r4"}
+
+
+def test_query_orders_by_title_whatever_the_case(store):
+    rows, next_key = store.query(None, 10)
+    assert titles(rows) == ["Apple Pie", "banana Bread", "Carrot Cake", "Chicken Soup"]
+    assert next_key is None
+
+
+def test_query_pages_by_cursor_and_offset(store):
+    first, next_key = store.query(None, 2)
+    assert titles(first) == ["Apple Pie", "banana Bread"]
+    assert next_key == ("banana bread", "r1")
+
+    second, next_key = store.query(next_key, 2)
+    assert titles(second) == ["Carrot Cake", "Chicken Soup"]
+    assert next_key is None
+
+    by_offset, _ = store.query(None, 2, offset=2)
+    assert by_offset == second
+
+
+def test_query_filters(store):
+    assert titles(store.query(None, 10, category="Soups")[0]) == ["Chicken Soup"]
+    assert titles(store.query(None, 10, search="has carrot")[0]) == ["Carrot Cake", "Chicken Soup"]
+    assert titles(store.query(None, 10, search="car", category="Baking")[0]) == ["Carrot Cake"]
+    assert titles(store.query(None, 10, search="category:soups")[0]) == ["Chicken Soup"]
+    assert store.query(None, 10, search="lasagne") == ([], None)
+
+
+def test_add_update_delete(store):
+    rid = store.add({"title": "Zucchini Fritters", "ingredients": ["2 zucchini"], "instructions": "Fry.", "category": "Sides"})
+    assert store.get(rid)["title"] == "Zucchini Fritters"
+
+    store.update(rid, {"title": "Aubergine Fritters"})
+    assert store.get(rid)["ingredients"] == ["2 zucchini"]
+    assert titles(store.query(None, 2)[0]) == ["Apple Pie", "Aubergine Fritters"]
+    assert titles(store.query(None, 10, search="aubergine")[0]) == ["Aubergine Fritters"]
+    assert store.query(None, 10, search="title:zucchini")[0] == []
+
+    store.delete(rid)
+    assert store.get(rid) is None
+    assert store.query(None, 10, search="aubergine") == ([], None)
+    store.delete(rid)  # already gone
+
+
+def test_recipes_survive_reopening(tmp_path):
+    store = SQLiteStore(str(tmp_path / "recipes.db"))
+    store.put_many(RECIPES)
+    reopened = SQLiteStore(store.path)
+    assert reopened.get("r4")["title"] == "Carrot Cake"
+
+
+def test_firebase_indexes_recipes_written_some_other_way():
+    firebase = LocalFirebase()
+    firebase.seed(RECIPES)
+    store = FirebaseStore(lambda: firebase, page_batch=2)
+    assert titles(store.query(None, 10, search="has carrot")[0]) == ["Carrot Cake", "Chicken Soup"]
+    assert set(firebase.nodes["recipe_titles"]) == set(RECIPES)